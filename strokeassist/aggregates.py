@@ -0,0 +1,195 @@
+"""
+Precomputed stroke-rate aggregates for the dashboard's group-by charts.
+
+One pass over the dataset fills a dense cube with the number of patients and
+the number of strokes for every combination of the grouping dimensions. Any
+single-dimension breakdown or pairwise cross is then a sum over the cube's
+other axes, which costs the same no matter how many rows the dataset has.
+"""
+import itertools
+import numpy as np
+import pandas as pd
+
+# Age bands used by the dashboard, as in pd.cut(age, bins=AGE_BINS): right-closed
+AGE_BINS = [0, 20, 40, 60, 80, 100]
+AGE_LABELS = ['0-20', '21-40', '41-60', '61-80', '81-100']
+
+# Grouping dimensions of the cube, in axis order
+DIMENSIONS = (
+    'gender', 'work_type', 'age_group', 'Residence_type',
+    'hypertension', 'heart_disease', 'smoking_status'
+)
+
+# Dataset columns needed to build the cube
+SOURCE_COLUMNS = (
+    'gender', 'work_type', 'age', 'Residence_type',
+    'hypertension', 'heart_disease', 'smoking_status', 'stroke'
+)
+
+def age_group_codes(age):
+    """Index into AGE_LABELS for each age, or -1 outside the bands (or missing)"""
+    age = np.asarray(age, dtype=float)
+    codes = np.searchsorted(AGE_BINS, age, side='left') - 1
+    codes[(codes < 0) | (codes >= len(AGE_LABELS)) | np.isnan(age)] = -1
+    return codes
+
+class AggregateCube:
+    """
+    Patient and stroke counts over every combination of DIMENSIONS.
+
+    Position 0 of each axis counts rows where that dimension is missing, so a
+    breakdown by one dimension still includes rows missing another, exactly
+    like a separate groupby per dimension. Values of each dimension are kept
+    in first-seen order and new values can be added by later chunks. Rows
+    without a stroke label are not counted.
+    """
+    def __init__(self):
+        self.levels = {dim: [] for dim in DIMENSIONS}
+        self.levels['age_group'] = list(AGE_LABELS)
+        self.counts = np.zeros(self._shape(), dtype=np.int64)
+        self.stroke_sums = np.zeros(self._shape(), dtype=np.float64)
+        self.rows = 0
+        self._tables = {}
+
+    def _shape(self):
+        return tuple(len(self.levels[dim]) + 1 for dim in DIMENSIONS)
+
+    def _codes(self, dim, values):
+        """Map a column to axis positions, growing the dimension's levels"""
+        if dim == 'age_group':
+            return age_group_codes(values) + 1
+
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes, uniques = values.cat.codes.to_numpy(), list(values.cat.categories)
+        else:
+            codes, uniques = pd.factorize(values)
+            uniques = uniques.tolist()
+
+        levels = self.levels[dim]
+        positions = {level: i for i, level in enumerate(levels)}
+        mapping = np.empty(len(uniques) + 1, dtype=np.int64)
+        mapping[-1] = 0
+        for i, value in enumerate(uniques):
+            if value not in positions:
+                positions[value] = len(levels)
+                levels.append(value)
+            mapping[i] = positions[value] + 1
+        # Code -1 (missing) picks mapping[-1], the missing slot
+        return mapping[codes]
+
+    def add(self, df):
+        """Count the rows of df (which needs SOURCE_COLUMNS) into the cube"""
+        stroke = pd.to_numeric(df['stroke'], errors='coerce').to_numpy(dtype=float)
+        labelled = ~np.isnan(stroke)
+
+        old_shape = self._shape()
+        codes = [
+            self._codes(dim, df['age' if dim == 'age_group' else dim])[labelled]
+            for dim in DIMENSIONS
+        ]
+        shape = self._shape()
+        if shape != old_shape:
+            # New values were appended to some dimensions
+            padding = [(0, new - old) for old, new in zip(old_shape, shape)]
+            self.counts = np.pad(self.counts, padding)
+            self.stroke_sums = np.pad(self.stroke_sums, padding)
+
+        cells = np.ravel_multi_index(codes, shape)
+        size = self.counts.size
+        self.counts += np.bincount(cells, minlength=size).reshape(shape)
+        self.stroke_sums += np.bincount(cells, weights=stroke[labelled], minlength=size).reshape(shape)
+        self.rows += len(df)
+        self._tables.clear()
+        return self
+
+    def totals(self):
+        """Number of patients with a stroke label, and how many had a stroke"""
+        return int(self.counts.sum()), int(round(self.stroke_sums.sum()))
+
+    def _summed(self, dims):
+        """Counts and stroke sums with every axis except dims summed out"""
+        axes = tuple(i for i, dim in enumerate(DIMENSIONS) if dim not in dims)
+        return self.counts.sum(axis=axes), self.stroke_sums.sum(axis=axes)
+
+    def _level_order(self, dim):
+        """Level positions in display order: age bands as defined, others sorted"""
+        levels = self.levels[dim]
+        if dim == 'age_group':
+            return list(range(len(levels)))
+        return sorted(range(len(levels)), key=lambda i: levels[i])
+
+    def marginal(self, dim):
+        """
+        Stroke rate by one dimension, as a DataFrame with columns dim, 'stroke'
+        (the rate, like df.groupby(dim)['stroke'].mean()) and 'count'
+        """
+        key = (dim,)
+        table = self._tables.get(key)
+        if table is None:
+            counts, sums = self._summed(key)
+            levels = self.levels[dim]
+            rows = [
+                (levels[i], sums[i + 1] / counts[i + 1], counts[i + 1])
+                for i in self._level_order(dim) if counts[i + 1] > 0
+            ]
+            table = pd.DataFrame(rows, columns=[dim, 'stroke', 'count'])
+            self._tables[key] = table
+        return table
+
+    def cross(self, dim_a, dim_b):
+        """
+        Stroke rate by a pair of dimensions, as a DataFrame with columns
+        dim_a, dim_b, 'stroke' and 'count'
+        """
+        key = (dim_a, dim_b)
+        table = self._tables.get(key)
+        if table is None:
+            counts, sums = self._summed(key)
+            if DIMENSIONS.index(dim_a) > DIMENSIONS.index(dim_b):
+                counts, sums = counts.T, sums.T
+            levels_a, levels_b = self.levels[dim_a], self.levels[dim_b]
+            rows = [
+                (levels_a[i], levels_b[j], sums[i + 1, j + 1] / counts[i + 1, j + 1], counts[i + 1, j + 1])
+                for i in self._level_order(dim_a) for j in self._level_order(dim_b)
+                if counts[i + 1, j + 1] > 0
+            ]
+            table = pd.DataFrame(rows, columns=[dim_a, dim_b, 'stroke', 'count'])
+            self._tables[key] = table
+        return table
+
+    def precompute(self):
+        """Build every marginal and pairwise cross table up front"""
+        for dim in DIMENSIONS:
+            self.marginal(dim)
+        for dim_a, dim_b in itertools.combinations(DIMENSIONS, 2):
+            self.cross(dim_a, dim_b)
+        return self
+
+    def to_dict(self):
+        """Describe the cube as JSON-serializable data"""
+        return {
+            'dimensions': list(DIMENSIONS),
+            'levels': self.levels,
+            'counts': self.counts.tolist(),
+            'stroke_sums': self.stroke_sums.tolist(),
+            'rows': self.rows,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a cube from to_dict() output"""
+        if tuple(data['dimensions']) != DIMENSIONS:
+            raise ValueError("Aggregate cube was built for different dimensions")
+        self = cls()
+        self.levels = {dim: list(data['levels'][dim]) for dim in DIMENSIONS}
+        self.counts = np.array(data['counts'], dtype=np.int64).reshape(self._shape())
+        self.stroke_sums = np.array(data['stroke_sums'], dtype=np.float64).reshape(self._shape())
+        self.rows = data['rows']
+        return self
+
+def build_cube(df, chunksize=1000000):
+    """Build the cube from a dataset with SOURCE_COLUMNS, a chunk of rows at a time"""
+    cube = AggregateCube()
+    for start in range(0, max(len(df), 1), chunksize):
+        cube.add(df.iloc[start:start + chunksize])
+    return cube.precompute()
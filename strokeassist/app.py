@@ -1,49 +1,372 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, url_for, abort
 import os
 import json
-from model import load_model, predict_stroke_risk
+import logging
+import threading
+import time
+import pandas as pd
+from model import predict_stroke_risk, predict_stroke_risk_batch
+from model_registry import ModelRegistry
 from chatbot import get_chatbot_response
+from coalescer import PredictionCoalescer
+from prediction_cache import PredictionCache
+from metrics import MetricsRegistry, gauge_lines
+import jsonlog
+import assets
+import input_schema
+
+# JSON lines written by a background thread (see jsonlog.py for the settings)
+jsonlog.configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-# Load the model at startup
-try:
-    model, feature_names = load_model('stroke_model.pkl')
-    print("Model and features loaded successfully")
-except Exception as e:
-    print(f"Error loading model: {str(e)}")
-    model, feature_names = None, None
+# Pickled model, or a compact artifact directory written by `python model.py export`
+MODEL_PATH = os.environ.get('MODEL_PATH', 'stroke_model.pkl')
+
+# With MODEL_LAZY_LOAD=1 the model loads in a background thread so the server
+# can bind its port straight away; prediction routes answer 503 until it's ready
+MODEL_LAZY_LOAD = os.environ.get('MODEL_LAZY_LOAD', '0') == '1'
+
+# Directory of model versions (pickles or compact artifacts). The newest one
+# is served, and a newer one appearing there is loaded and swapped in without
+# a restart; the directory is checked every MODEL_WATCH_INTERVAL seconds
+MODEL_DIR = os.environ.get('MODEL_DIR')
+MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', 5))
+
+registry = ModelRegistry(MODEL_PATH, MODEL_DIR, MODEL_WATCH_INTERVAL)
+
+# Static files by fingerprinted URL, compressed ahead of time (see assets.py)
+static_assets = assets.AssetStore(app.static_folder)
+
+# Pages that don't change between requests, rendered on first use
+rendered_pages = {}
+model_ready = threading.Event()
+
+def load_model_at_startup():
+    """Load the starting model into the registry and mark it ready"""
+    start = time.perf_counter()
+    try:
+        registry.load_initial()
+        logger.info("Model and features loaded successfully")
+    except Exception as e:
+        logger.error(f"Error loading model: {str(e)}")
+    finally:
+        logger.info("Model startup finished", extra={'startup_ms': round((time.perf_counter() - start) * 1000, 1)})
+        model_ready.set()
+        registry.start_watching()
+
+if MODEL_LAZY_LOAD:
+    threading.Thread(target=load_model_at_startup, name='model-loader', daemon=True).start()
+else:
+    load_model_at_startup()
+
+def model_loading_response():
+    """503 response for prediction requests that arrive before the model is loaded"""
+    response = jsonify({'error': 'Model is still loading, please retry shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def current_model():
+    """The model version to serve a request with, taken once per request"""
+    active = registry.current()
+    if active is None:
+        raise Exception("No model is loaded")
+    return active
+
+def score_coalesced(requests):
+    """
+    Score a batch of queued /predict requests, given as (model version, form
+    data) pairs, one result tuple per request. Requests queued across a model
+    swap are scored by the version they started with.
+    """
+    results = [None] * len(requests)
+    groups = {}
+    for i, (active, data) in enumerate(requests):
+        groups.setdefault(id(active), (active, []))[1].append(i)
+    for active, indices in groups.values():
+        predictions, probabilities, feature_importance = predict_stroke_risk_batch(
+            active.model,
+            active.feature_names,
+            [requests[i][1] for i in indices]
+        )
+        if not isinstance(feature_importance, list):
+            feature_importance = [feature_importance] * len(predictions)
+        for i, result in zip(indices, zip(predictions, probabilities, feature_importance)):
+            results[i] = result
+    return results
+
+# With PREDICT_COALESCE_MS > 0, concurrent /predict calls are queued for up to
+# that many milliseconds (or PREDICT_COALESCE_MAX requests) and scored together
+PREDICT_COALESCE_MS = float(os.environ.get('PREDICT_COALESCE_MS', 0))
+PREDICT_COALESCE_MAX = int(os.environ.get('PREDICT_COALESCE_MAX', 64))
+
+coalescer = None
+if PREDICT_COALESCE_MS > 0:
+    coalescer = PredictionCoalescer(
+        score_coalesced,
+        max_wait=PREDICT_COALESCE_MS / 1000,
+        max_batch=PREDICT_COALESCE_MAX
+    )
+
+# LRU cache of /predict results for resubmitted forms (PREDICTION_CACHE_SIZE=0
+# disables it), optionally expiring after PREDICTION_CACHE_TTL seconds
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 10000))
+PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', 0)) or None
+
+prediction_cache = None
+if PREDICTION_CACHE_SIZE > 0:
+    prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL)
+
+# Request counts and per-stage latency histograms, served at /metrics
+metrics = MetricsRegistry()
+requests_total = metrics.counter('stroke_requests_total', 'Requests handled', 'route')
+request_errors_total = metrics.counter('stroke_request_errors_total', 'Requests answered with an error', 'route')
+request_seconds = metrics.histogram('stroke_request_duration_seconds', 'Time spent handling a request', 'route')
+predict_stage_seconds = metrics.histogram(
+    'stroke_predict_stage_duration_seconds',
+    'Time spent in each stage of a /predict request '
+    '(parse, preprocess, inference, importance, serialize)',
+    'stage'
+)
+
+def record_request(route, start, timings=None, error=False):
+    """
+    Count a finished request and record its latency and stage timings. A
+    sample of requests (every failed one) is also logged.
+    """
+    elapsed = time.perf_counter() - start
+    requests_total.inc(route)
+    if error:
+        request_errors_total.inc(route)
+    request_seconds.observe(elapsed, route)
+    if timings:
+        for stage, seconds in timings.items():
+            predict_stage_seconds.observe(seconds, stage)
+    if error or jsonlog.sample(route):
+        fields = {'route': route, 'duration_ms': round(elapsed * 1000, 3), 'error': error}
+        if timings:
+            fields['stages_ms'] = {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+        logger.log(logging.WARNING if error else logging.INFO, "request", extra=fields)
+
+def collect_component_metrics():
+    """Counters kept by the prediction cache and coalescer themselves"""
+    lines = gauge_lines('stroke_model_ready', 'Whether the model has finished loading', int(model_ready.is_set()))
+    if prediction_cache is not None:
+        stats = prediction_cache.stats()
+        lines += gauge_lines('stroke_prediction_cache_hits_total', 'Prediction cache hits', stats['hits'], 'counter')
+        lines += gauge_lines('stroke_prediction_cache_misses_total', 'Prediction cache misses', stats['misses'], 'counter')
+        lines += gauge_lines('stroke_prediction_cache_evictions_total', 'Prediction cache evictions', stats['evictions'], 'counter')
+        lines += gauge_lines('stroke_prediction_cache_entries', 'Results held in the prediction cache', stats['entries'])
+    if coalescer is not None:
+        stats = coalescer.stats()
+        lines += gauge_lines('stroke_coalescer_queue_depth', 'Predictions waiting to be batched', stats['queue_depth'])
+        lines += gauge_lines('stroke_coalescer_batches_total', 'Batches scored by the coalescer', stats['batches'], 'counter')
+    stats = registry.stats()
+    lines += gauge_lines('stroke_model_swaps_total', 'Times a new model version was swapped in', stats['swaps'], 'counter')
+    lines += gauge_lines('stroke_model_load_failures_total', 'New model versions rejected', stats['failures'], 'counter')
+    if stats['model_version'] is not None:
+        lines += ['# HELP stroke_model_info Model version in service', '# TYPE stroke_model_info gauge',
+                  f'stroke_model_info{{version="{stats["model_version"]}"}} 1']
+    lines += gauge_lines('stroke_log_records_dropped_total', 'Log records dropped because the log writer fell behind',
+                         jsonlog.dropped_records(), 'counter')
+    return lines
+
+metrics.add_collector(collect_component_metrics)
+
+def predict_one(active, data, explain=None, timings=None):
+    """Score one patient with a model version, through the coalescer when it is enabled"""
+    if coalescer is not None and explain is None:
+        # Stages run batched on the coalescer thread, so the wait is all inference
+        start = time.perf_counter()
+        result = coalescer.predict((active, data))
+        if timings is not None:
+            timings['inference'] = time.perf_counter() - start
+        return result
+    return predict_stroke_risk(active.model, active.feature_names, data, explain=explain, timings=timings)
+
+def read_patient(active, content_type, read_body, read_form):
+    """
+    Decode a /predict request and validate it against the model's input
+    schema, raising input_schema.InputError if any field is invalid (shared
+    by the WSGI and ASGI entry points). JSON and MessagePack bodies come
+    from read_body(), anything else is form data from read_form().
+    """
+    schema = input_schema.get_schema(active.feature_names)
+    body_format = input_schema.body_format(content_type)
+    if body_format in ('json', 'msgpack'):
+        return schema.validate(input_schema.decode_body(read_body(), body_format))
+    return schema.validate(read_form(), numbers_as_text=True)
+
+def run_prediction(data, explain=None, timings=None, active=None):
+    """
+    Score one patient's form data through the prediction cache and format
+    the result for display (shared by the WSGI and ASGI entry points)
+    
+    Stage timings are added to `timings` when a dict is given. `active` is
+    the model version to use, by default the current one.
+    """
+    # The whole request uses this version, even if a new one is swapped in meanwhile
+    if active is None:
+        active = current_model()
+    if prediction_cache is not None:
+        data, key = prediction_cache.normalize(active.model, active.feature_names, data, explain)
+        cached = prediction_cache.get(key)
+        if cached is None:
+            cached = predict_one(active, data, explain, timings)
+            prediction_cache.put(key, cached)
+        prediction, probability, feature_importance = cached
+    else:
+        prediction, probability, feature_importance = predict_one(active, data, explain, timings)
+    
+    return format_prediction(prediction, probability, feature_importance, active.version)
+
+def format_prediction(prediction, probability, feature_importance, model_version):
+    """Format a single prediction the way the frontend displays it"""
+    return {
+        'prediction': 'High Risk' if prediction == 1 else 'Low Risk',
+        'probability': f"{probability:.2%}",
+        'feature_importance': feature_importance,
+        'model_version': model_version
+    }
+
+@app.context_processor
+def asset_helpers():
+    def asset_url(name):
+        """Fingerprinted URL of a static file (plain static URL if it isn't one we serve)"""
+        return static_assets.url(name) or url_for('static', filename=name)
+    return {'asset_url': asset_url}
+
+def cached_page(template):
+    """The rendered template as an Asset, rendering it the first time"""
+    page = rendered_pages.get(template)
+    if page is None:
+        with app.test_request_context('/'):
+            body = render_template(template).encode('utf-8')
+        page = rendered_pages[template] = assets.make_asset(body, 'text/html; charset=utf-8')
+    return page
+
+def asset_response(asset, cache_control=assets.IMMUTABLE):
+    status, headers, body = assets.respond(
+        asset, request.headers.get('Accept-Encoding', ''), request.headers.get('If-None-Match', ''), cache_control
+    )
+    return body, status, headers
 
 @app.route('/')
 def home():
-    """Render the homepage with the prediction form"""
-    return render_template('index.html')
+    """Serve the homepage with the prediction form"""
+    return asset_response(cached_page('index.html'), assets.REVALIDATE)
+
+@app.route('/assets/<path:name>')
+def static_asset(name):
+    """Serve a fingerprinted static file"""
+    asset = static_assets.get(name)
+    if asset is None:
+        abort(404)
+    return asset_response(asset)
 
 @app.route('/predict', methods=['POST'])
 def predict():
     """Handle prediction request and return result"""
+    if not model_ready.is_set():
+        return model_loading_response()
+    start = time.perf_counter()
+    timings = {}
     try:
-        # Get form data
-        data = request.form.to_dict()
+        # Form data, JSON or MessagePack, rejected here if any field is invalid
+        active = current_model()
+        data = read_patient(active, request.content_type, request.get_data, lambda: request.form.to_dict())
+        timings['parse'] = time.perf_counter() - start
         
-        # Make prediction
-        prediction, probability, feature_importance = predict_stroke_risk(
-            model, 
-            feature_names,
-            data
+        # Make prediction, ?explain=contribution ranks features for this patient
+        result = run_prediction(data, request.args.get('explain'), timings, active)
+        
+        serialize_start = time.perf_counter()
+        response = jsonify(result)
+        timings['serialize'] = time.perf_counter() - serialize_start
+        record_request('/predict', start, timings)
+        return response
+    except input_schema.InputError as e:
+        record_request('/predict', start, timings, error=True)
+        return jsonify({'error': str(e), 'fields': e.errors}), 400
+    except Exception as e:
+        record_request('/predict', start, timings, error=True)
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Score a roster of patients sent as a JSON array or a CSV upload"""
+    if not model_ready.is_set():
+        return model_loading_response()
+    start = time.perf_counter()
+    try:
+        if 'file' in request.files:
+            # CSV upload with one patient per row and the form fields as columns.
+            # Read everything as text so values are encoded exactly like form input.
+            records = pd.read_csv(request.files['file'], dtype=str, keep_default_na=False)
+        else:
+            payload = request.get_json(silent=True)
+            # Accept either a bare array or {"patients": [...]}
+            records = payload.get('patients') if isinstance(payload, dict) else payload
+            if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+                raise ValueError("Expected a JSON array of patients or a CSV file upload")
+        
+        # Score every patient with a single model call
+        active = current_model()
+        predictions, probabilities, feature_importance = predict_stroke_risk_batch(
+            active.model,
+            active.feature_names,
+            records,
+            explain=request.args.get('explain')
         )
         
-        # Format result for display
-        result = {
-            'prediction': 'High Risk' if prediction == 1 else 'Low Risk',
-            'probability': f"{probability:.2%}",
-            'feature_importance': feature_importance
-        }
+        # Contribution mode gives one feature dict per patient
+        if not isinstance(feature_importance, list):
+            feature_importance = [feature_importance] * len(predictions)
+        
+        results = [
+            format_prediction(prediction, probability, importance, active.version)
+            for prediction, probability, importance in zip(predictions, probabilities, feature_importance)
+        ]
         
-        return jsonify(result)
+        response = jsonify({'count': len(results), 'model_version': active.version, 'results': results})
+        record_request('/predict/batch', start)
+        return response
     except Exception as e:
+        record_request('/predict/batch', start, error=True)
         return jsonify({'error': str(e)}), 400
 
+@app.route('/predict/schema')
+def predict_schema():
+    """Fields /predict accepts for the model in service, with their ranges and values"""
+    if not model_ready.is_set():
+        return model_loading_response()
+    return jsonify(input_schema.get_schema(current_model().feature_names).to_dict())
+
+@app.route('/predict/stats')
+def predict_stats():
+    """Report queue depth and batch sizes of the /predict coalescer"""
+    if coalescer is None:
+        return jsonify({'coalescing': False})
+    return jsonify(dict(coalescer.stats(), coalescing=True))
+
+@app.route('/predict/cache')
+def predict_cache_stats():
+    """Report hit, miss and eviction counters of the prediction cache"""
+    if prediction_cache is None:
+        return jsonify({'caching': False})
+    return jsonify(dict(prediction_cache.stats(), caching=True))
+
+@app.route('/model')
+def model_info():
+    """Report the model version in service and the registry's swap counters"""
+    return jsonify(registry.stats())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Expose request counters and latency histograms in the Prometheus text format"""
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.route('/chatbot', methods=['POST'])
 def chatbot():
     """Handle chatbot message and return response"""
@@ -57,20 +380,20 @@ def chatbot():
 @app.route('/dashboard')
 def dashboard():
     """Provide information about how to access the Streamlit dashboard"""
-    return render_template('dashboard_info.html')
+    return asset_response(cached_page('dashboard_info.html'), assets.REVALIDATE)
 
 if __name__ == '__main__':
     try:
-        print("Starting the application...")
+        logger.info("Starting the application...")
         # For development
         # app.run(debug=True)
 
         # For production
         from waitress import serve
         port = int(os.environ.get('PORT', 8080))
-        print(f"Starting server on port {port}")
+        logger.info(f"Starting server on port {port}")
         serve(app, host='0.0.0.0', port=port)
     except Exception as e:
-        print(f"Error starting the server: {str(e)}")
+        logger.exception(f"Error starting the server: {str(e)}")
 
 
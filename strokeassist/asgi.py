@@ -0,0 +1,390 @@
+"""
+ASGI entry point for the stroke prediction app.
+
+Serves the same routes as the Flask app in app.py, but connections are
+handled on an asyncio event loop, so idle keep-alive connections from kiosks
+don't tie up threads:
+
+- POST /predict and POST /chatbot are handled natively. Form parsing and
+  scoring run on a bounded thread pool, and requests beyond ASGI_MAX_PENDING
+  queued jobs get a 503 instead of piling up.
+- /chatbot/ws is a WebSocket carrying a whole chat session, so each
+  message after the first costs one frame instead of an HTTP request.
+  Chat answers are looked up on the same thread pool as scoring.
+- GET / and GET /dashboard are rendered once and served from memory, as
+  are the fingerprinted, precompressed static files under /assets/.
+- Every other route (static files, /predict/batch, stats, /metrics) is
+  passed to the Flask app on the same thread pool.
+
+Usage:
+    python asgi.py
+    uvicorn asgi:application --host 0.0.0.0 --port 8080 --limit-concurrency 10000
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from werkzeug.formparser import parse_form_data
+
+import app as flask_app
+import assets
+import input_schema
+from chatbot import get_chatbot_response
+from metrics import gauge_lines
+
+logger = logging.getLogger(__name__)
+
+# Threads running form parsing, scoring and Flask fallback requests
+SCORING_THREADS = int(os.environ.get('ASGI_SCORING_THREADS', 4))
+
+# Jobs waiting for or running on the thread pool before new ones are refused
+MAX_PENDING = int(os.environ.get('ASGI_MAX_PENDING', 256))
+
+# Largest request body accepted, in bytes
+MAX_BODY_SIZE = int(os.environ.get('ASGI_MAX_BODY_SIZE', 16 * 1024 * 1024))
+
+# Open chat WebSockets before new ones are refused. Each is also a
+# connection under ASGI_MAX_CONNECTIONS, so keep this below it
+MAX_CHAT_SESSIONS = int(os.environ.get('ASGI_MAX_CHAT_SESSIONS', 8000))
+
+# Longest chat message accepted over a WebSocket, in characters
+MAX_CHAT_MESSAGE = int(os.environ.get('ASGI_MAX_CHAT_MESSAGE', 4096))
+
+executor = ThreadPoolExecutor(SCORING_THREADS, thread_name_prefix='asgi-scoring')
+pending = 0
+chat_sessions = 0
+chat_messages = 0
+
+class RequestTooLarge(Exception):
+    pass
+
+async def read_body(receive):
+    """Read the whole request body"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_SIZE:
+            raise RequestTooLarge()
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            break
+    return b''.join(chunks)
+
+def get_header(scope, name):
+    """Return a request header as text, or an empty string"""
+    name = name.lower().encode('latin-1')
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return ''
+
+async def send_response(send, status, body, content_type='application/json', headers=()):
+    """Send a complete response"""
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', content_type.encode('latin-1')),
+            (b'content-length', str(len(body)).encode('latin-1')),
+        ] + [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def send_json(send, status, payload, headers=()):
+    """Send a JSON response encoded like Flask's jsonify"""
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode() + b'\n'
+    await send_response(send, status, body, headers=headers)
+
+async def run_in_pool(func, *args, refuse_when_busy=True):
+    """
+    Run func on the bounded thread pool, or return None straight away if
+    MAX_PENDING jobs are already waiting. With refuse_when_busy=False the
+    job is queued anyway, for callers that bound their own jobs; it still
+    counts towards MAX_PENDING for everyone else.
+    """
+    global pending
+    if refuse_when_busy and pending >= MAX_PENDING:
+        return None
+    pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+    finally:
+        pending -= 1
+
+def parse_form(body, content_type):
+    """Parse a urlencoded or multipart form body into a dict"""
+    if content_type.startswith('application/x-www-form-urlencoded'):
+        return dict(parse_qsl(body.decode('utf-8'), keep_blank_values=True))
+    environ = {
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    }
+    _, form, _ = parse_form_data(environ)
+    return form.to_dict()
+
+def predict_sync(body, content_type, explain):
+    """Parse and score one /predict request, returning (status, payload)"""
+    start = time.perf_counter()
+    timings = {}
+    try:
+        active = flask_app.current_model()
+        data = flask_app.read_patient(active, content_type, lambda: body, lambda: parse_form(body, content_type))
+        timings['parse'] = time.perf_counter() - start
+        result = flask_app.run_prediction(data, explain, timings, active)
+        flask_app.record_request('/predict', start, timings)
+        return 200, result
+    except input_schema.InputError as e:
+        flask_app.record_request('/predict', start, timings, error=True)
+        return 400, {'error': str(e), 'fields': e.errors}
+    except Exception as e:
+        flask_app.record_request('/predict', start, timings, error=True)
+        return 400, {'error': str(e)}
+
+async def predict(scope, receive, send):
+    if not flask_app.model_ready.is_set():
+        await send_json(send, 503, {'error': 'Model is still loading, please retry shortly'},
+                        headers=[('retry-after', '1')])
+        return
+
+    body = await read_body(receive)
+    query = dict(parse_qsl(scope['query_string'].decode('latin-1')))
+    result = await run_in_pool(predict_sync, body, get_header(scope, 'content-type'), query.get('explain'))
+    if result is None:
+        await send_json(send, 503, {'error': 'Server is busy, please retry shortly'},
+                        headers=[('retry-after', '1')])
+        return
+    await send_json(send, *result)
+
+async def chatbot(scope, receive, send):
+    try:
+        message = json.loads(await read_body(receive)).get('message', '')
+        # Passage search can take a while on a large corpus, so keep it off the event loop
+        response = await run_in_pool(get_chatbot_response, message)
+        if response is None:
+            await send_json(send, 503, {'error': 'Server is busy, please retry shortly'},
+                            headers=[('retry-after', '1')])
+            return
+        await send_json(send, 200, {'response': response})
+    except RequestTooLarge:
+        raise
+    except Exception as e:
+        await send_json(send, 400, {'error': str(e)})
+
+def chat_reply(frame):
+    """Answer one chat frame: {"id": ..., "message": ...} -> {"id": ..., "response": ...}"""
+    try:
+        request = json.loads(frame)
+        reply = {'id': request.get('id')}
+    except (ValueError, AttributeError) as e:
+        return {'id': None, 'error': f"Invalid chat frame: {str(e)}"}
+    message = request.get('message', '')
+    if not isinstance(message, str) or len(message) > MAX_CHAT_MESSAGE:
+        reply['error'] = f"Message must be text of at most {MAX_CHAT_MESSAGE} characters"
+        return reply
+    try:
+        reply['response'] = get_chatbot_response(message)
+    except Exception as e:
+        reply['error'] = str(e)
+    return reply
+
+async def chat_socket(scope, receive, send):
+    """
+    A chat session over a WebSocket. Each text frame is a JSON object with
+    a message and an id chosen by the client, and is answered with a frame
+    carrying the same id and either a response or an error.
+    """
+    global chat_sessions, chat_messages
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if chat_sessions >= MAX_CHAT_SESSIONS:
+        # Closing before accepting rejects the handshake; the widget falls back to POST
+        await send({'type': 'websocket.close', 'code': 1013})
+        return
+    await send({'type': 'websocket.accept'})
+    chat_sessions += 1
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            frame = message.get('text')
+            if frame is None:
+                frame = (message.get('bytes') or b'').decode('utf-8', 'replace')
+            chat_messages += 1
+            # Answered on the thread pool like POST /chatbot. The next frame
+            # is only read once this one is answered, so replies stay in
+            # order and each session has at most one job queued; a burst
+            # waits its turn instead of being refused
+            reply = await run_in_pool(chat_reply, frame, refuse_when_busy=False)
+            reply = json.dumps(reply, separators=(',', ':'))
+            await send({'type': 'websocket.send', 'text': reply})
+    finally:
+        chat_sessions -= 1
+
+def collect_chat_metrics():
+    lines = gauge_lines('stroke_chat_sessions', 'Open chatbot WebSocket sessions', chat_sessions)
+    lines += gauge_lines('stroke_chat_messages_total', 'Chat messages answered over WebSockets', chat_messages, 'counter')
+    return lines
+
+flask_app.metrics.add_collector(collect_chat_metrics)
+
+async def send_asset(scope, send, asset, cache_control=assets.IMMUTABLE):
+    """Send an in-memory Asset, or 304 if the client's copy is current"""
+    status, headers, body = assets.respond(
+        asset, get_header(scope, 'accept-encoding'), get_header(scope, 'if-none-match'), cache_control
+    )
+    headers = [(name.lower(), value) for name, value in headers if name != 'Content-Type']
+    await send_response(send, status, body, asset.content_type, headers)
+
+async def static_page(scope, send, template):
+    await send_asset(scope, send, flask_app.cached_page(template), assets.REVALIDATE)
+
+async def static_asset(scope, receive, send):
+    asset = flask_app.static_assets.get(scope['path'][len(assets.URL_PREFIX):])
+    if asset is None:
+        await send_response(send, 404, b'Not Found', 'text/plain')
+        return
+    await send_asset(scope, send, asset)
+
+def wsgi_environ(scope, body):
+    """Build a WSGI environ for an ASGI HTTP request"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        if name in environ and name != 'CONTENT_LENGTH':
+            value = environ[name] + ',' + value
+        environ[name] = value
+    return environ
+
+def call_flask(environ):
+    """Run the Flask app on a WSGI environ, returning (status, headers, body)"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+
+    result = flask_app.app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], body
+
+async def flask_fallback(scope, receive, send):
+    body = await read_body(receive)
+    result = await run_in_pool(call_flask, wsgi_environ(scope, body))
+    if result is None:
+        await send_json(send, 503, {'error': 'Server is busy, please retry shortly'},
+                        headers=[('retry-after', '1')])
+        return
+
+    status, headers, body = result
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+ROUTES = {
+    ('POST', '/predict'): predict,
+    ('POST', '/chatbot'): chatbot,
+    ('GET', '/'): lambda scope, receive, send: static_page(scope, send, 'index.html'),
+    ('GET', '/dashboard'): lambda scope, receive, send: static_page(scope, send, 'dashboard_info.html'),
+}
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    """ASGI application"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] == 'websocket':
+        if scope['path'] == '/chatbot/ws':
+            await chat_socket(scope, receive, send)
+        else:
+            await receive()
+            await send({'type': 'websocket.close', 'code': 1008})
+        return
+    if scope['type'] != 'http':
+        return
+
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        if scope['method'] == 'GET' and scope['path'].startswith(assets.URL_PREFIX):
+            handler = static_asset
+        else:
+            handler = flask_fallback
+    try:
+        await handler(scope, receive, send)
+    except RequestTooLarge:
+        await send_json(send, 413, {'error': 'Request body too large'})
+
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.environ.get('PORT', 8080))
+    logger.info(f"Starting ASGI server on port {port}")
+    uvicorn.run(
+        application,
+        host='0.0.0.0',
+        port=port,
+        # Connection-level backpressure: beyond this many open connections
+        # and in-flight requests, new ones are answered with 503
+        limit_concurrency=int(os.environ.get('ASGI_MAX_CONNECTIONS', 10000)),
+        timeout_keep_alive=int(os.environ.get('ASGI_KEEP_ALIVE', 75)),
+        # Frames too big to be a chat message (up to 4 bytes per character)
+        # close the connection before they are buffered
+        ws_max_size=MAX_CHAT_MESSAGE * 4 + 1024,
+        # Chat frames are a few hundred bytes; per-connection compression
+        # state would more than double the memory of each open session
+        ws_per_message_deflate=False,
+        backlog=2048,
+    )
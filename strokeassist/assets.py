@@ -0,0 +1,257 @@
+"""
+Fingerprinted, precompressed static files and pages served from memory.
+
+Every file under static/ gets a URL with a hash of its contents in the name
+(style.css -> /assets/style.3f2a9c1b7e04.css). Since the URL changes
+whenever the file does, responses can be cached by browsers for a year
+without revalidation, which matters for kiosks on slow clinic links.
+
+Gzip (and brotli, when the optional `brotli` package is installed) versions
+are made once, either at build time with
+
+    python assets.py build
+
+which writes them to ASSETS_BUILD_DIR, or when the app starts for any file
+that hasn't been built. Requests then only pick the smallest encoding the
+client accepts; nothing is compressed per request. Rendered pages use the
+same Asset structure, so they are also served with an ETag and answered
+with 304 when the browser already has them.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import sys
+from collections import namedtuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Files to fingerprint and serve
+STATIC_DIR = os.path.join(APP_DIR, 'static')
+
+# Where `python assets.py build` writes the fingerprinted, precompressed files
+ASSETS_BUILD_DIR = os.environ.get('ASSETS_BUILD_DIR', os.path.join(APP_DIR, 'build', 'assets'))
+
+# URL path the fingerprinted files are served under
+URL_PREFIX = '/assets/'
+
+# Fingerprinted URLs never change content, so they can be kept for a year
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Pages can change on a deploy; browsers keep them but check the ETag first
+REVALIDATE = 'no-cache'
+
+# Files smaller than this aren't worth compressing
+MIN_COMPRESS_SIZE = 256
+
+# Encodings in order of preference, with the file suffix of each
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# `variants` maps an encoding ('identity', 'gzip', 'br') to the body in that encoding
+Asset = namedtuple('Asset', ['content_type', 'etag', 'variants'])
+
+def content_hash(body):
+    return hashlib.sha256(body).hexdigest()[:12]
+
+def fingerprint(name, body):
+    """style.css -> style.<hash>.css"""
+    root, ext = os.path.splitext(name)
+    return f"{root}.{content_hash(body)}{ext}"
+
+def compress(body, encoding):
+    if encoding == 'gzip':
+        # mtime=0 so the same input always gives the same bytes
+        return gzip.compress(body, compresslevel=9, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(body, quality=11)
+    raise ValueError(f"Unknown encoding {encoding!r}")
+
+def available_encodings():
+    return [encoding for encoding, _ in ENCODINGS if encoding != 'br' or brotli is not None]
+
+def content_type_for(name):
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+        content_type += '; charset=utf-8'
+    return content_type
+
+def make_asset(body, content_type, precompressed=None):
+    """
+    An Asset for body, compressing it in every available encoding that isn't
+    in `precompressed` (a dict of encoding -> bytes). Encodings that don't
+    make the body smaller are left out.
+    """
+    variants = {'identity': body}
+    if len(body) >= MIN_COMPRESS_SIZE:
+        for encoding in available_encodings():
+            encoded = (precompressed or {}).get(encoding)
+            if encoded is None:
+                encoded = compress(body, encoding)
+            if len(encoded) < len(body):
+                variants[encoding] = encoded
+    return Asset(content_type, content_hash(body), variants)
+
+def source_files(static_dir=STATIC_DIR):
+    """Logical names (relative paths with forward slashes) of the files under static_dir"""
+    names = []
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if not name.startswith('.'):
+                names.append(os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, '/'))
+    return names
+
+def build(static_dir=STATIC_DIR, output_dir=ASSETS_BUILD_DIR):
+    """
+    Write the fingerprinted copy of every static file and its compressed
+    versions to output_dir, with a manifest.json of logical name -> URL name.
+    Returns the manifest.
+    """
+    manifest = {}
+    for name in source_files(static_dir):
+        with open(os.path.join(static_dir, name), 'rb') as f:
+            body = f.read()
+        built = fingerprint(name, body)
+        asset = make_asset(body, content_type_for(name))
+        path = os.path.join(output_dir, built)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        for encoding, suffix in (('identity', ''),) + ENCODINGS:
+            if encoding in asset.variants:
+                with open(path + suffix, 'wb') as f:
+                    f.write(asset.variants[encoding])
+        manifest[name] = built
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+def _read_built(output_dir, built):
+    """Compressed versions of a file from an earlier build, by encoding"""
+    found = {}
+    for encoding, suffix in ENCODINGS:
+        try:
+            with open(os.path.join(output_dir, built + suffix), 'rb') as f:
+                found[encoding] = f.read()
+        except OSError:
+            continue
+    return found
+
+class AssetStore:
+    """
+    The static files in memory, by fingerprinted name. Files are always
+    fingerprinted from their current contents, so a build that is older
+    than the sources is only used for the files that haven't changed since.
+    """
+    def __init__(self, static_dir=STATIC_DIR, build_dir=ASSETS_BUILD_DIR):
+        self.urls = {}
+        self.assets = {}
+        built_count = 0
+        for name in source_files(static_dir):
+            with open(os.path.join(static_dir, name), 'rb') as f:
+                body = f.read()
+            built = fingerprint(name, body)
+            precompressed = _read_built(build_dir, built) if build_dir else {}
+            built_count += bool(precompressed)
+            self.assets[built] = make_asset(body, content_type_for(name), precompressed)
+            self.urls[name] = URL_PREFIX + built
+        logger.info("Static assets loaded", extra={'assets': len(self.assets), 'prebuilt': built_count})
+
+    def url(self, name):
+        """Fingerprinted URL of a static file, or None if there is no such file"""
+        return self.urls.get(name)
+
+    def get(self, built):
+        """The Asset served at URL_PREFIX + built, or None"""
+        return self.assets.get(built)
+
+def parse_accept_encoding(header):
+    """Accept-Encoding header -> {encoding: quality}"""
+    accepted = {}
+    for item in header.split(','):
+        encoding, _, params = item.strip().partition(';')
+        encoding = encoding.strip().lower()
+        if not encoding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[encoding] = quality
+    return accepted
+
+def choose_encoding(asset, accept_encoding):
+    """The smallest variant of asset the client accepts"""
+    accepted = parse_accept_encoding(accept_encoding or '')
+    wildcard = accepted.get('*', 0.0)
+    best = 'identity'
+    for encoding, body in asset.variants.items():
+        if encoding != 'identity' and accepted.get(encoding, wildcard) > 0 and len(body) < len(asset.variants[best]):
+            best = encoding
+    return best
+
+def etag_for(asset, encoding):
+    # Each encoding is a different representation, so it gets its own tag
+    return f'"{asset.etag}"' if encoding == 'identity' else f'"{asset.etag}-{encoding}"'
+
+def not_modified(asset, if_none_match):
+    """Whether an If-None-Match header names any representation of asset"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+    return any(etag_for(asset, encoding) in tags for encoding in asset.variants)
+
+def respond(asset, accept_encoding='', if_none_match='', cache_control=IMMUTABLE):
+    """
+    (status, headers, body) for a GET of asset: 304 with no body if the
+    client's copy is current, otherwise the best encoding it accepts
+    """
+    encoding = choose_encoding(asset, accept_encoding)
+    headers = [
+        ('Cache-Control', cache_control),
+        ('ETag', etag_for(asset, encoding)),
+    ]
+    if len(asset.variants) > 1:
+        headers.append(('Vary', 'Accept-Encoding'))
+    if not_modified(asset, if_none_match):
+        return 304, headers, b''
+    body = asset.variants[encoding]
+    headers.append(('Content-Type', asset.content_type))
+    if encoding != 'identity':
+        headers.append(('Content-Encoding', encoding))
+    return 200, headers, body
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress the static files")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="Write fingerprinted, compressed static files")
+    build_parser.add_argument('--static-dir', default=STATIC_DIR)
+    build_parser.add_argument('--output', default=ASSETS_BUILD_DIR)
+
+    args = parser.parse_args(argv)
+    if args.command == 'build':
+        manifest = build(args.static_dir, args.output)
+        encodings = ', '.join(available_encodings())
+        print(f"Built {len(manifest)} assets into {args.output} ({encodings})")
+        for name, built in sorted(manifest.items()):
+            print(f"  {name} -> {URL_PREFIX}{built}")
+        if brotli is None:
+            print("Brotli versions skipped; pip install brotli to build them", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
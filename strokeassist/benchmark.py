@@ -0,0 +1,1720 @@
+"""
+Performance benchmarks for the stroke prediction app.
+
+Everything runs offline against a small synthetic logistic regression model
+and synthetic patients, so no trained model file or dataset is needed.
+
+Usage:
+    python benchmark.py            # every comparison benchmark, at full size
+    python benchmark.py suite      # regression suite, checked against benchmark_baseline.json
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+
+from model import (
+    NUMERIC_FEATURES, CATEGORICAL_MAPPINGS, encode_input, preprocess_input,
+    preprocess_batch, predict_stroke_risk, score_probabilities, get_top_features,
+    get_feature_contributions
+)
+
+# Every one-hot column the form can produce, in a stable order
+SYNTHETIC_FEATURE_NAMES = list(NUMERIC_FEATURES) + [
+    encoded for encoded_features in CATEGORICAL_MAPPINGS.values() for encoded in encoded_features
+]
+
+def make_synthetic_patients(n, seed=0):
+    """
+    Generate n random patients in the raw form format used by /predict
+    """
+    rng = np.random.default_rng(seed)
+    patients = []
+    for _ in range(n):
+        patient = {
+            'age': f"{rng.uniform(1, 90):.1f}",
+            'avg_glucose_level': f"{rng.uniform(55, 270):.2f}",
+            'bmi': f"{rng.uniform(12, 50):.1f}",
+        }
+        for feature, encoded_features in CATEGORICAL_MAPPINGS.items():
+            encoded = encoded_features[rng.integers(len(encoded_features))]
+            patient[feature] = encoded[len(feature) + 1:]
+        patients.append(patient)
+    return patients
+
+def make_synthetic_model(n_samples=2000, seed=0, drop_first=False):
+    """
+    Fit a logistic regression on synthetic patients, returning (model, feature_names).
+    With drop_first the first one-hot column of every categorical field is
+    left out (a reference level), as in models trained on drop-first dummies.
+    """
+    rng = np.random.default_rng(seed)
+    feature_names = list(SYNTHETIC_FEATURE_NAMES)
+    if drop_first:
+        dropped = {encoded_features[0] for encoded_features in CATEGORICAL_MAPPINGS.values()}
+        feature_names = [feature for feature in feature_names if feature not in dropped]
+    X = preprocess_batch(make_synthetic_patients(n_samples, seed), feature_names)
+
+    # Outcome loosely driven by the usual risk factors
+    logit = (0.06 * (X['age'] - 60) + 0.01 * (X['avg_glucose_level'] - 120)
+             + 1.2 * X['hypertension_1'] + 1.0 * X['heart_disease_1'] - 1.5)
+    y = (rng.random(n_samples) < 1 / (1 + np.exp(-logit))).astype(int)
+
+    model = LogisticRegression(max_iter=1000)
+    model.fit(X, y)
+    return model, feature_names
+
+def _timeit(func, repeat=5):
+    """Return the best wall-clock time of several runs of func"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_batch_predict(n_rows=2000, n_single=200):
+    """
+    Compare rows per second of looping /predict against one /predict/batch call
+    """
+    app_module = _import_app()
+    client = app_module.app.test_client()
+    patients = make_synthetic_patients(n_rows, seed=1)
+
+    # Time real predictions, not error responses
+    for response in (client.post('/predict', data=patients[0]), client.post('/predict/batch', json=patients)):
+        if response.status_code != 200:
+            raise RuntimeError(f"{response.request.path} answered {response.status_code}: {response.get_data(as_text=True)}")
+
+    def loop_single():
+        for patient in patients[:n_single]:
+            client.post('/predict', data=patient)
+
+    def batch():
+        client.post('/predict/batch', json=patients)
+
+    # Repeat runs would otherwise be answered from the prediction cache
+    prediction_cache = app_module.prediction_cache
+    app_module.prediction_cache = None
+    try:
+        single_rate = n_single / _timeit(loop_single, repeat=3)
+        batch_rate = n_rows / _timeit(batch, repeat=3)
+    finally:
+        app_module.prediction_cache = prediction_cache
+
+    print("Batch prediction")
+    print(f"  looping /predict:    {single_rate:12,.0f} rows/s")
+    print(f"  /predict/batch:      {batch_rate:12,.0f} rows/s")
+    print(f"  speedup:             {batch_rate / single_rate:12.1f}x")
+    return {'single_rows_per_s': single_rate, 'batch_rows_per_s': batch_rate}
+
+def reference_preprocess_input(data, feature_names):
+    """
+    The original DataFrame-based preprocess_input, kept as the reference the
+    compiled encoding plan is checked against
+    """
+    input_df = pd.DataFrame({feature: [0.0] for feature in feature_names})
+    
+    for feature, dtype in NUMERIC_FEATURES.items():
+        if feature in data and feature in feature_names:
+            try:
+                input_df.loc[0, feature] = dtype(data[feature])
+            except (ValueError, TypeError):
+                pass
+    
+    for feature, encoded_features in CATEGORICAL_MAPPINGS.items():
+        if feature in data and data[feature] is not None:
+            value = data[feature]
+            for encoded_feature in encoded_features:
+                if encoded_feature == f"{feature}_{value}" and encoded_feature in feature_names:
+                    input_df.loc[0, encoded_feature] = 1
+    
+    return input_df[feature_names]
+
+def check_encoding_parity(feature_names=None):
+    """
+    Check the encoding plan against the reference implementation on every
+    combination of categorical values, returning the number of cases checked.
+    The combinations are also written to Parquet with a null in every
+    column and must encode the same when read back for bulk scoring.
+    """
+    feature_names = feature_names or list(SYNTHETIC_FEATURE_NAMES)
+    fields = list(CATEGORICAL_MAPPINGS)
+    choices = [
+        [encoded[len(feature) + 1:] for encoded in CATEGORICAL_MAPPINGS[feature]]
+        for feature in fields
+    ]
+    numeric_cases = [
+        {'age': '67', 'avg_glucose_level': '228.69', 'bmi': '36.6'},
+        {'age': 'abc', 'avg_glucose_level': '', 'bmi': None},
+        {},
+    ]
+    
+    checked = 0
+    for combination in itertools.product(*choices):
+        for numeric in numeric_cases:
+            data = dict(zip(fields, combination), **numeric)
+            expected = reference_preprocess_input(data, feature_names).to_numpy(dtype=float)
+            actual = encode_input(data, feature_names)
+            if not np.array_equal(expected, actual):
+                raise AssertionError(f"Encoding mismatch for {data}")
+            checked += 1
+    return checked + _check_parquet_parity(feature_names, fields, choices)
+
+def _check_parquet_parity(feature_names, fields, choices):
+    """
+    Encode every combination read back from a Parquet file, as written by
+    tools other than pandas: numeric-looking categories are integer columns
+    with nulls, which pandas reads as floats. They must encode the same as
+    with encode_input.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return 0
+    from model import _read_chunks, get_encoding_plan
+    
+    records = [dict(zip(fields, combination), age='67', avg_glucose_level='228.69', bmi='36.6')
+               for combination in itertools.product(*choices)]
+    records.append({field: None for field in records[0]})
+    columns = {}
+    for column in records[0]:
+        values = [record[column] for record in records]
+        if column in NUMERIC_FEATURES:
+            columns[column] = pa.array([None if v is None else float(v) for v in values], pa.float64())
+        elif all(v is None or v.isdigit() for v in values):
+            columns[column] = pa.array([None if v is None else int(v) for v in values], pa.int64())
+        else:
+            columns[column] = pa.array(values, pa.string())
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'patients.parquet')
+        pq.write_table(pa.table(columns), path)
+        chunks = list(_read_chunks(path, len(records)))
+    actual = get_encoding_plan(feature_names).encode_batch(pd.concat(chunks, ignore_index=True))
+    for data, row in zip(records, actual):
+        if not np.array_equal(encode_input(data, feature_names)[0], row):
+            raise AssertionError(f"Parquet encoding mismatch for {data}")
+    return len(records)
+
+def bench_preprocess(n_calls=2000):
+    """
+    Compare single-patient preprocessing latency of the reference DataFrame
+    implementation, preprocess_input and the raw encoding plan
+    """
+    feature_names = list(SYNTHETIC_FEATURE_NAMES)
+    patient = make_synthetic_patients(1)[0]
+    
+    def run(func, calls):
+        return _timeit(lambda: [func(patient, feature_names) for _ in range(calls)]) / calls
+    
+    reference = run(reference_preprocess_input, n_calls // 10)
+    frame = run(preprocess_input, n_calls)
+    plan = run(encode_input, n_calls)
+    
+    print("Single-patient preprocessing")
+    print(f"  reference DataFrame: {reference * 1e6:12.1f} us")
+    print(f"  preprocess_input:    {frame * 1e6:12.1f} us")
+    print(f"  encode_input:        {plan * 1e6:12.1f} us")
+    return {'reference_us': reference * 1e6, 'preprocess_input_us': frame * 1e6,
+            'encode_input_us': plan * 1e6}
+
+def bench_input_formats(n_calls=20000, n_requests=2000):
+    """
+    Parse-and-validate cost of a /predict body as form data (the old path
+    only parsed it), JSON and MessagePack, and the cost of POST /predict
+    for a valid and an invalid request
+    """
+    import urllib.parse
+    from input_schema import InputError, get_schema, decode_body, msgpack
+
+    model, feature_names = make_synthetic_model()
+    schema = get_schema(feature_names)
+    patients = make_synthetic_patients(100)
+    typed = [schema.validate(patient, numbers_as_text=True) for patient in patients]
+    bodies = {
+        'form': [urllib.parse.urlencode(patient).encode() for patient in patients],
+        'json': [json.dumps(patient).encode() for patient in typed],
+    }
+    if msgpack is not None:
+        bodies['msgpack'] = [msgpack.packb(patient) for patient in typed]
+
+    def parse_form(body):
+        return dict(urllib.parse.parse_qsl(body.decode('utf-8'), keep_blank_values=True))
+
+    cases = [
+        ('form, parse only (before)', 'form', parse_form),
+        ('form + schema', 'form', lambda body: schema.validate(parse_form(body), numbers_as_text=True)),
+        ('json + schema', 'json', lambda body: schema.validate(decode_body(body, 'json'))),
+        ('msgpack + schema', 'msgpack', lambda body: schema.validate(decode_body(body, 'msgpack'))),
+    ]
+    results = {}
+    print(f"Parse and validate one /predict body ({len(feature_names)} features)")
+    for name, body_format, parse in cases:
+        if body_format not in bodies:
+            print(f"  {name:26s} skipped, pip install msgpack to run it")
+            continue
+        cycle = itertools.cycle(bodies[body_format])
+        per_call = _per_call_us(lambda: parse(next(cycle)), n_calls)
+        size = float(np.mean([len(body) for body in bodies[body_format]]))
+        results[name] = {'us': per_call, 'bodies_per_s': 1e6 / per_call, 'bytes': size}
+        print(f"  {name:26s} {per_call:7.2f} us  {1e6 / per_call:10,.0f} bodies/s  {size:5.0f} bytes")
+
+    def reject(body):
+        try:
+            schema.validate(decode_body(body, 'json'))
+        except InputError:
+            pass
+    invalid = json.dumps(dict(typed[0], bmi=-1)).encode()
+    results['json reject'] = {'us': _per_call_us(lambda: reject(invalid), n_calls)}
+    print(f"  {'invalid json rejected':26s} {results['json reject']['us']:7.2f} us")
+
+    # Whole requests through Flask, without a network in between. Before,
+    # an invalid value was left at 0 and the request was scored anyway.
+    flask_app = _import_app()
+    client = flask_app.app.test_client()
+    prediction_cache = flask_app.prediction_cache
+    flask_app.prediction_cache = None
+    try:
+        cycle = itertools.cycle(patients)
+        requests = {
+            'form': lambda: client.post('/predict', data=next(cycle)),
+            'json': lambda: client.post('/predict', json=typed[0]),
+            'invalid json': lambda: client.post('/predict', json=dict(typed[0], bmi=-1)),
+        }
+        print("POST /predict")
+        for name, post in requests.items():
+            per_call = _per_call_us(post, n_requests)
+            results[f'POST {name}'] = {'us': per_call}
+            print(f"  {name:26s} {per_call:7.1f} us")
+    finally:
+        flask_app.prediction_cache = prediction_cache
+    return results
+
+def bench_scoring_engines(n_calls=2000, n_rows=10000):
+    """
+    Compare single-patient predict_stroke_risk latency of the scoring engines
+    and check that linear-native matches sklearn's probabilities
+    """
+    model, feature_names = make_synthetic_model()
+    patient = make_synthetic_patients(1)[0]
+    X = preprocess_batch(make_synthetic_patients(n_rows, seed=2), feature_names).to_numpy()
+    
+    max_error = np.max(np.abs(
+        score_probabilities(model, X, feature_names, 'linear-native')
+        - score_probabilities(model, X, feature_names, 'sklearn')
+    ))
+    if max_error > 1e-12:
+        raise AssertionError(f"linear-native differs from sklearn by {max_error}")
+    
+    def double_inference():
+        # What predict_stroke_risk used to do: predict and predict_proba on a DataFrame
+        input_data = pd.DataFrame(encode_input(patient, feature_names), columns=feature_names)
+        model.predict(input_data)
+        model.predict_proba(input_data)
+    
+    def run(func, calls):
+        return _timeit(lambda: [func() for _ in range(calls)]) / calls
+    
+    before = run(double_inference, n_calls // 10)
+    sklearn = run(lambda: predict_stroke_risk(model, feature_names, patient, 'sklearn'), n_calls // 10)
+    native = run(lambda: predict_stroke_risk(model, feature_names, patient, 'linear-native'), n_calls)
+    
+    print("Single-patient scoring")
+    print(f"  predict + predict_proba: {before * 1e6:8.1f} us")
+    print(f"  engine=sklearn:          {sklearn * 1e6:8.1f} us")
+    print(f"  engine=linear-native:    {native * 1e6:8.1f} us")
+    print(f"  max |p_native - p_sklearn| over {n_rows} rows: {max_error:.2e}")
+    return {'double_inference_us': before * 1e6, 'sklearn_us': sklearn * 1e6,
+            'linear_native_us': native * 1e6, 'max_abs_error': float(max_error)}
+
+def bench_explanations(n_calls=5000):
+    """
+    Compare the cost of the top-features explanation per prediction: ranking
+    the coefficients on every call, the cached ranking, and per-patient
+    contributions
+    """
+    from model import _rank_features
+    
+    model, feature_names = make_synthetic_model()
+    X = encode_input(make_synthetic_patients(1)[0], feature_names)
+    
+    def run(func):
+        return _timeit(lambda: [func() for _ in range(n_calls)]) / n_calls
+    
+    ranked = run(lambda: _rank_features(model, feature_names))
+    cached = run(lambda: get_top_features(model, feature_names))
+    contribution = run(lambda: get_feature_contributions(model, feature_names, X))
+    
+    print("Top-feature explanation")
+    print(f"  rank every call:     {ranked * 1e6:12.1f} us")
+    print(f"  cached ranking:      {cached * 1e6:12.1f} us")
+    print(f"  contribution mode:   {contribution * 1e6:12.1f} us")
+    return {'rank_us': ranked * 1e6, 'cached_us': cached * 1e6,
+            'contribution_us': contribution * 1e6}
+
+def bench_model_load():
+    """
+    Compare model load time of the pickle file and the compact artifact, both
+    in-process and as a cold start in a fresh interpreter
+    """
+    from model import load_model, export_model
+    
+    model, feature_names = make_synthetic_model()
+    with tempfile.TemporaryDirectory() as tmp:
+        pickle_path = os.path.join(tmp, 'stroke_model.pkl')
+        with open(pickle_path, 'wb') as file:
+            pickle.dump({'model': model, 'feature_names': feature_names}, file)
+        compact_path = export_model(model, feature_names, os.path.join(tmp, 'stroke_model'))
+        
+        def load(path):
+            with contextlib.redirect_stdout(io.StringIO()):
+                load_model(path)
+        
+        def cold_start(path):
+            # Fresh interpreter, so import costs (sklearn for the pickle) are included
+            code = ("import time; start = time.perf_counter(); import model; "
+                    f"model.load_model({path!r}); print(time.perf_counter() - start)")
+            output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+            return float(output.stdout.strip().splitlines()[-1])
+        
+        results = {
+            'pickle_ms': _timeit(lambda: load(pickle_path)) * 1000,
+            'compact_ms': _timeit(lambda: load(compact_path)) * 1000,
+            'pickle_cold_ms': cold_start(pickle_path) * 1000,
+            'compact_cold_ms': cold_start(compact_path) * 1000,
+        }
+    
+    print("Model load")
+    print(f"  pickle:              {results['pickle_ms']:10.2f} ms (cold start {results['pickle_cold_ms']:.0f} ms)")
+    print(f"  compact artifact:    {results['compact_ms']:10.2f} ms (cold start {results['compact_cold_ms']:.0f} ms)")
+    return results
+
+def _free_port():
+    """Ask the OS for an unused TCP port"""
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _wait_for_port(port, timeout=30):
+    """Wait until something accepts connections on localhost:port"""
+    import socket
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+def _predict_client(port, duration, patient, results):
+    """Post /predict over one keep-alive connection for `duration` seconds"""
+    import http.client
+    import urllib.parse
+    body = urllib.parse.urlencode(patient)
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    count = 0
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            connection.request('POST', '/predict', body, headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            # Refused or timed out, try again on a fresh connection
+            connection.close()
+            continue
+        if response.status == 200:
+            count += 1
+            latencies.append(time.perf_counter() - start)
+    connection.close()
+    results.put((count, latencies))
+
+def _load_test(port, clients, duration, patient, with_latencies=False):
+    """
+    Run `clients` client processes against the server, returning requests/s
+    (and the successful request latencies if with_latencies is set)
+    """
+    import multiprocessing
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=_predict_client, args=(port, duration, patient, results))
+        for _ in range(clients)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    rate = sum(count for count, _ in outcomes) / duration
+    if with_latencies:
+        return rate, np.array([latency for _, latencies in outcomes for latency in latencies])
+    return rate
+
+def _start_server(command, env, port):
+    """Start a server subprocess from this directory and wait until it listens"""
+    process = subprocess.Popen(command, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_for_port(port)
+    except Exception:
+        process.kill()
+        raise
+    return process
+
+def _synthetic_model_file(tmp):
+    """Pickle the synthetic model into tmp the way the app expects it"""
+    model, feature_names = make_synthetic_model()
+    path = os.path.join(tmp, 'stroke_model.pkl')
+    with open(path, 'wb') as file:
+        pickle.dump({'model': model, 'feature_names': feature_names}, file)
+    return path
+
+def _import_app():
+    """Import the Flask app with the synthetic model as its model"""
+    previous_model_path = os.environ.get('MODEL_PATH')
+    with tempfile.TemporaryDirectory() as tmp:
+        # The app loads its model on import
+        os.environ['MODEL_PATH'] = _synthetic_model_file(tmp)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                import app as flask_app
+        finally:
+            if previous_model_path is None:
+                del os.environ['MODEL_PATH']
+            else:
+                os.environ['MODEL_PATH'] = previous_model_path
+    # Keep request logs off the benchmark output
+    flask_app.jsonlog.configure_logging(open(os.devnull, 'w'))
+    return flask_app
+
+def bench_serving_scaling(worker_counts=None, duration=5):
+    """
+    Load test /predict through serve.py with increasing worker counts to show
+    throughput scaling with cores
+    """
+    worker_counts = worker_counts or sorted({1, 2, os.cpu_count() or 1})
+    patient = make_synthetic_patients(1)[0]
+    results = {}
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = _synthetic_model_file(tmp)
+        print(f"Serving throughput ({os.cpu_count()} cores)")
+        for workers in worker_counts:
+            port = _free_port()
+            env = dict(os.environ, MODEL_PATH=model_path, PORT=str(port), WEB_CONCURRENCY=str(workers))
+            server = _start_server([sys.executable, 'serve.py'], env, port)
+            try:
+                rate = _load_test(port, clients=max(2, 2 * workers), duration=duration, patient=patient)
+            finally:
+                server.terminate()
+                server.wait()
+            results[workers] = rate
+            print(f"  {workers:2d} workers:          {rate:10,.0f} requests/s")
+    return results
+
+def _concurrent_latencies(call, patients, threads):
+    """
+    Call `call(patient)` from `threads` threads at once, returning per-call
+    latencies in seconds and overall throughput in calls per second
+    """
+    import threading
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads + 1)
+    
+    def worker(chunk):
+        local = []
+        barrier.wait()
+        for patient in chunk:
+            start = time.perf_counter()
+            call(patient)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+    
+    chunks = [patients[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return np.array(latencies), len(patients) / (time.perf_counter() - start)
+
+def bench_coalescer(threads=32, n_requests=3200, engine='sklearn'):
+    """
+    Compare p50/p99 latency and throughput of concurrent single-patient
+    predictions with and without the micro-batching coalescer
+    """
+    from coalescer import PredictionCoalescer
+    from model import predict_stroke_risk_batch
+    
+    model, feature_names = make_synthetic_model()
+    patients = make_synthetic_patients(n_requests, seed=3)
+    
+    def score_batch(records):
+        predictions, probabilities, top_features = predict_stroke_risk_batch(
+            model, feature_names, records, engine=engine)
+        return [(p, q, top_features) for p, q in zip(predictions, probabilities)]
+    
+    coalescer = PredictionCoalescer(score_batch, max_wait=0.002, max_batch=64)
+    paths = {
+        'per-request': lambda patient: predict_stroke_risk(model, feature_names, patient, engine),
+        'coalesced': coalescer.predict,
+    }
+    
+    print(f"Concurrent /predict scoring ({threads} threads, engine={engine})")
+    results = {}
+    for name, call in paths.items():
+        latencies, throughput = _concurrent_latencies(call, patients, threads)
+        results[name] = {
+            'p50_ms': float(np.percentile(latencies, 50) * 1000),
+            'p99_ms': float(np.percentile(latencies, 99) * 1000),
+            'requests_per_s': throughput,
+        }
+        print(f"  {name:12s} p50 {results[name]['p50_ms']:7.2f} ms  p99 {results[name]['p99_ms']:7.2f} ms"
+              f"  {throughput:10,.0f} requests/s")
+    stats = coalescer.stats()
+    print(f"  mean batch size {stats['mean_batch_size']:.1f} over {stats['batches']} batches")
+    results['coalescer_stats'] = stats
+    return results
+
+def bench_asgi_concurrency(idle_connections=1000, clients=8, duration=5):
+    """
+    Hold many idle keep-alive connections open (like kiosks between form
+    submissions) and measure /predict latency and throughput from active
+    clients, for the waitress deployment and the ASGI entry point
+    """
+    import socket
+    patient = make_synthetic_patients(1)[0]
+    servers = {
+        'waitress': [sys.executable, '-c',
+                     "import os; from waitress import serve; from app import app; "
+                     "serve(app, host='127.0.0.1', port=int(os.environ['PORT']))"],
+        'asgi': [sys.executable, 'asgi.py'],
+    }
+    results = {}
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = _synthetic_model_file(tmp)
+        print(f"Concurrency with {idle_connections} idle keep-alive connections, {clients} active clients")
+        for name, command in servers.items():
+            port = _free_port()
+            env = dict(os.environ, MODEL_PATH=model_path, PORT=str(port))
+            server = _start_server(command, env, port)
+            idle = []
+            try:
+                for _ in range(idle_connections):
+                    sock = socket.create_connection(('127.0.0.1', port))
+                    sock.sendall(b"GET /dashboard HTTP/1.1\r\nHost: localhost\r\n\r\n")
+                    idle.append(sock)
+                rate, latencies = _load_test(port, clients, duration, patient, with_latencies=True)
+            finally:
+                for sock in idle:
+                    sock.close()
+                server.terminate()
+                server.wait()
+            
+            results[name] = {
+                'requests_per_s': rate,
+                'p50_ms': float(np.percentile(latencies, 50) * 1000) if len(latencies) else None,
+                'p99_ms': float(np.percentile(latencies, 99) * 1000) if len(latencies) else None,
+            }
+            if len(latencies):
+                print(f"  {name:9s} {rate:10,.0f} requests/s  p50 {results[name]['p50_ms']:7.2f} ms"
+                      f"  p99 {results[name]['p99_ms']:7.2f} ms")
+            else:
+                print(f"  {name:9s} no requests completed")
+    return results
+
+def _page_load(connection, requests):
+    """
+    GET each (path, headers) in turn on one keep-alive connection, returning
+    (bytes received, time to first byte of each response, [(response, body)])
+    """
+    received = 0
+    ttfbs = []
+    responses = []
+    for path, headers in requests:
+        start = time.perf_counter()
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        ttfbs.append(time.perf_counter() - start)
+        body = response.read()
+        # Status line and headers as sent, plus the body
+        received += len(f"HTTP/1.1 {response.status} {response.reason}\r\n") + len(str(response.msg)) + len(body)
+        responses.append((response, body))
+    return received, ttfbs, responses
+
+def bench_assets(n_loads=300, link_kbit_s=1000):
+    """
+    Bytes transferred and time to first byte for a homepage load (page,
+    stylesheet and script), first and repeat visits, with the page rendered
+    per request and the static files sent as they are (before) and with the
+    cached page and fingerprinted, precompressed assets (after)
+    """
+    import http.client
+    import re
+    server_code = (
+        "import os; from flask import render_template; from waitress import serve; from app import app; "
+        # The homepage as it was served before: rendered on every request
+        "app.add_url_rule('/uncached', 'uncached', lambda: render_template('index.html')); "
+        "serve(app, host='127.0.0.1', port=int(os.environ['PORT']))"
+    )
+    browser = {'Accept-Encoding': 'gzip, deflate, br'}
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        port = _free_port()
+        env = dict(os.environ, MODEL_PATH=_synthetic_model_file(tmp), PORT=str(port))
+        server = _start_server([sys.executable, '-c', server_code], env, port)
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            _, _, [(_, html)] = _page_load(connection, [('/', {})])
+            asset_urls = re.findall(r'"(/assets/[^"]+)"', html.decode('utf-8'))
+            static_urls = ['/static/' + url[len('/assets/'):] for url in asset_urls]
+            # Fingerprinted names -> plain names for the old static route
+            static_urls = [re.sub(r'\.[0-9a-f]{12}(\.\w+)$', r'\1', url) for url in static_urls]
+
+            # Validators the browser keeps from a first visit
+            _, _, old = _page_load(connection, [('/uncached', browser)] + [(url, browser) for url in static_urls])
+            _, _, new = _page_load(connection, [('/', browser)])
+            old_tags = [response.getheader('ETag') for response, _ in old]
+            new_page_tag = new[0][0].getheader('ETag')
+
+            scenarios = {
+                'before, first visit': [('/uncached', browser)] + [(url, browser) for url in static_urls],
+                # Flask's static route answers conditional requests, the page is sent again
+                'before, repeat visit': [('/uncached', browser)] + [
+                    (url, dict(browser, **{'If-None-Match': tag})) for url, tag in zip(static_urls, old_tags[1:])
+                ],
+                'after, first visit': [('/', browser)] + [(url, browser) for url in asset_urls],
+                # Immutable assets come from the browser cache without a request
+                'after, repeat visit': [('/', dict(browser, **{'If-None-Match': new_page_tag}))],
+            }
+            print(f"Homepage load, {n_loads} loads per scenario (transfer time at {link_kbit_s} kbit/s)")
+            for name, requests in scenarios.items():
+                sizes = []
+                page_ttfbs = []
+                for _ in range(n_loads):
+                    received, ttfbs, _ = _page_load(connection, requests)
+                    sizes.append(received)
+                    page_ttfbs.append(ttfbs[0])
+                received = int(np.median(sizes))
+                results[name] = {
+                    'requests': len(requests),
+                    'bytes': received,
+                    'page_ttfb_p50_ms': float(np.percentile(page_ttfbs, 50) * 1000),
+                    'page_ttfb_p99_ms': float(np.percentile(page_ttfbs, 99) * 1000),
+                    'transfer_ms': received * 8 / link_kbit_s,
+                }
+                r = results[name]
+                print(f"  {name:21s} {r['requests']} requests {received:8,d} bytes ({r['transfer_ms']:6.1f} ms)"
+                      f"  page TTFB p50 {r['page_ttfb_p50_ms']:5.2f} ms  p99 {r['page_ttfb_p99_ms']:5.2f} ms")
+            connection.close()
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+def reference_chatbot_response(message, knowledge):
+    """
+    The original linear-scan knowledge base lookup, kept for comparison
+    """
+    message = message.lower().strip()
+    for key, response in knowledge.items():
+        if key in message or any(word in message for word in key.split()):
+            return response
+    return None
+
+def bench_chatbot(sizes=(10, 1000, 10000), n_calls=2000):
+    """
+    Compare chatbot lookup latency of the intent index and the original
+    linear scan as the knowledge base grows
+    """
+    from chatbot import stroke_knowledge, build_intent_index, get_chatbot_response
+    
+    rng = np.random.default_rng(4)
+    vocabulary = [f"term{i}" for i in range(20000)]
+    # Questions that only match near the end of the knowledge base (worst
+    # case for the linear scan) plus ones that match nothing
+    messages = ["what are the warning signs of a transient ischemic attack",
+                "could you explain the recovery outlook for someone my age"]
+    
+    print("Chatbot lookup")
+    results = {}
+    for size in sizes:
+        knowledge = {
+            " ".join(rng.choice(vocabulary, 3)): f"answer {i}"
+            for i in range(max(size - len(stroke_knowledge), 0))
+        }
+        knowledge.update(stroke_knowledge)
+        index = build_intent_index(knowledge)
+        
+        def run(func):
+            calls = max(n_calls // max(size // 100, 1), 20)
+            return _timeit(lambda: [func(messages[i % 2]) for i in range(calls)]) / calls
+        
+        linear = run(lambda message: reference_chatbot_response(message, knowledge))
+        indexed = run(lambda message: get_chatbot_response(message, index))
+        results[size] = {'linear_us': linear * 1e6, 'index_us': indexed * 1e6}
+        print(f"  {size:6d} entries:  linear scan {linear * 1e6:9.1f} us   index {indexed * 1e6:7.1f} us")
+    return results
+
+def _post_chat_latencies(port, messages, duration):
+    """POST chat messages over one keep-alive connection for `duration` seconds"""
+    import http.client
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    headers = {'Content-Type': 'application/json'}
+    latencies = []
+    deadline = time.perf_counter() + duration
+    for message in itertools.cycle(messages):
+        if time.perf_counter() >= deadline:
+            break
+        start = time.perf_counter()
+        connection.request('POST', '/chatbot', json.dumps({'message': message}), headers)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+    return np.array(latencies)
+
+async def _chat_socket_bench(port, sessions, messages, duration, server_pid):
+    """Open `sessions` chat WebSockets, then time messages on one and a burst on all"""
+    import asyncio
+    import psutil
+    import websockets
+    url = f'ws://127.0.0.1:{port}/chatbot/ws'
+    server = psutil.Process(server_pid)
+    rss_before = server.memory_info().rss
+    sockets = []
+    for start in range(0, sessions, 500):
+        sockets += await asyncio.gather(*[
+            websockets.connect(url, ping_interval=None, max_queue=4)
+            for _ in range(min(500, sessions - start))
+        ])
+    rss_after = server.memory_info().rss
+
+    async def ask(ws, i, message):
+        await ws.send(json.dumps({'id': i, 'message': message}))
+        reply = json.loads(await ws.recv())
+        if 'response' not in reply:
+            raise RuntimeError(f"Chat error: {reply}")
+
+    # One session chatting while the others stay open
+    latencies = []
+    deadline = time.perf_counter() + duration
+    for i, message in enumerate(itertools.cycle(messages)):
+        if time.perf_counter() >= deadline:
+            break
+        start = time.perf_counter()
+        await ask(sockets[0], i, message)
+        latencies.append(time.perf_counter() - start)
+
+    # Every session sending one message at once
+    start = time.perf_counter()
+    await asyncio.gather(*[ask(ws, i, messages[i % len(messages)]) for i, ws in enumerate(sockets)])
+    burst = time.perf_counter() - start
+
+    await asyncio.gather(*[ws.close() for ws in sockets])
+    return np.array(latencies), (rss_after - rss_before) / sessions, burst
+
+def bench_chat_sessions(sessions=5000, duration=5):
+    """
+    Chat message latency over a WebSocket session with thousands of other
+    sessions open, against a POST per message to waitress (as before) and to
+    the ASGI server (the widget's fallback)
+    """
+    import asyncio
+    messages = ["what are the symptoms of a stroke", "how can I prevent a stroke",
+                "what is my risk if I smoke", "hello"]
+    servers = {
+        'waitress': [sys.executable, '-c',
+                     "import os; from waitress import serve; from app import app; "
+                     "serve(app, host='127.0.0.1', port=int(os.environ['PORT']))"],
+        'asgi': [sys.executable, 'asgi.py'],
+    }
+    results = {}
+
+    def report(name, latencies):
+        results[name] = {
+            'messages_per_s': len(latencies) / latencies.sum(),
+            'p50_us': float(np.percentile(latencies, 50) * 1e6),
+            'p99_us': float(np.percentile(latencies, 99) * 1e6),
+        }
+        r = results[name]
+        print(f"  {name:24s} {r['messages_per_s']:8,.0f} messages/s  p50 {r['p50_us']:7.0f} us  p99 {r['p99_us']:7.0f} us")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = _synthetic_model_file(tmp)
+        print(f"Chat messages on one connection ({sessions} WebSocket sessions open for the ASGI socket)")
+        for name, command in servers.items():
+            port = _free_port()
+            env = dict(os.environ, MODEL_PATH=model_path, PORT=str(port),
+                       ASGI_MAX_CONNECTIONS=str(sessions + 100), ASGI_MAX_CHAT_SESSIONS=str(sessions))
+            server = _start_server(command, env, port)
+            try:
+                report(f'POST /chatbot ({name})', _post_chat_latencies(port, messages, duration))
+                if name == 'asgi':
+                    latencies, session_bytes, burst = asyncio.run(
+                        _chat_socket_bench(port, sessions, messages, duration, server.pid))
+                    report('WebSocket /chatbot/ws', latencies)
+            finally:
+                server.terminate()
+                server.wait()
+    results['server_bytes_per_session'] = session_bytes
+    results['burst_messages_per_s'] = sessions / burst
+    print(f"  server memory per open session {session_bytes / 1024:6.1f} KiB;"
+          f" one message on every session: {sessions / burst:,.0f} messages/s")
+    return results
+
+def make_synthetic_passages(n, words_per_passage=80, vocabulary_size=50000, seed=7):
+    """Passages of random words with a Zipf-like word frequency, like real text"""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array([f"term{i}x" for i in range(vocabulary_size)])
+    weights = 1 / np.arange(1, vocabulary_size + 1) ** 1.1
+    words = rng.choice(vocabulary, size=(n, words_per_passage), p=weights / weights.sum())
+    return [{'title': f"article {i // 5}", 'text': " ".join(row), 'source': f"article{i // 5}.txt"}
+            for i, row in enumerate(words)]
+
+def bench_retrieval(n_passages=100000, n_queries=500, k=3):
+    """
+    Chatbot passage retrieval at scale: building the BM25 index, opening the
+    saved index, and top-k query latency
+    """
+    from retrieval import build_index, load_index
+    
+    passages = make_synthetic_passages(n_passages)
+    start = time.perf_counter()
+    index = build_index(passages)
+    build_s = time.perf_counter() - start
+    
+    rng = np.random.default_rng(8)
+    queries = [" ".join(rng.choice(passages[rng.integers(n_passages)]['text'].split(), rng.integers(2, 7)))
+               for _ in range(n_queries)]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        index.save(tmp)
+        load_s = _timeit(lambda: load_index(tmp), repeat=5)
+        loaded = load_index(tmp)
+        loaded.search(queries[0], k)
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            loaded.search(query, k)
+            latencies.append(time.perf_counter() - start)
+        index_mb = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp)) / 1e6
+    latencies = np.array(latencies) * 1000
+    
+    results = {
+        'passages': n_passages,
+        'terms': len(index.vocabulary),
+        'build_s': build_s,
+        'load_ms': load_s * 1000,
+        'index_mb': index_mb,
+        'query_p50_ms': float(np.percentile(latencies, 50)),
+        'query_p99_ms': float(np.percentile(latencies, 99)),
+    }
+    
+    print(f"Chatbot passage retrieval ({n_passages} passages, {results['terms']} terms, top {k})")
+    print(f"  build index (once):  {results['build_s']:10.1f} s")
+    print(f"  open saved index:    {results['load_ms']:10.1f} ms ({index_mb:.0f} MB on disk)")
+    print(f"  query p50:           {results['query_p50_ms']:10.2f} ms")
+    print(f"  query p99:           {results['query_p99_ms']:10.2f} ms")
+    return results
+
+def _measure_in_subprocess(code):
+    """Run code in a fresh interpreter; returns (seconds, peak RSS in MB). Linux only."""
+    # Peak RSS comes from VmHWM, which (unlike ru_maxrss) isn't inherited from
+    # the forking parent
+    script = ("import time; start = time.perf_counter()\n" + code +
+              "\nelapsed = time.perf_counter() - start\n"
+              "peak = [line.split()[1] for line in open('/proc/self/status') if line.startswith('VmHWM')][0]\n"
+              "print(elapsed, peak)")
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    seconds, peak_kb = output.stdout.strip().splitlines()[-1].split()
+    return float(seconds), int(peak_kb) / 1024
+
+def bench_dataset_load(n_rows=5000000):
+    """
+    Compare cold load time and peak memory of the dashboard dataset: the
+    whole CSV with pd.read_csv against the columns one page needs from the
+    memory-mapped columnar store
+    """
+    from dashboard_data import make_synthetic_dataset, convert_csv
+    
+    columns = ['gender', 'work_type', 'age', 'Residence_type', 'stroke']
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'stroke.csv')
+        make_synthetic_dataset(n_rows).to_csv(csv_path, index=False)
+        store_dir = os.path.join(tmp, 'stroke.store')
+        start = time.perf_counter()
+        convert_csv(csv_path, store_dir)
+        convert_s = time.perf_counter() - start
+        
+        # Both variants run the same groupby so the data is actually read
+        baseline_s, baseline_mb = _measure_in_subprocess("import pandas as pd")
+        csv_s, csv_mb = _measure_in_subprocess(
+            f"import pandas as pd\ndf = pd.read_csv({csv_path!r})\n"
+            "df.groupby('gender')['stroke'].mean()")
+        store_s, store_mb = _measure_in_subprocess(
+            f"import pandas as pd\nfrom dashboard_data import load_columns\n"
+            f"df = load_columns({store_dir!r}, {columns!r})\n"
+            "df.groupby('gender', observed=True)['stroke'].mean()")
+    
+    results = {
+        'rows': n_rows,
+        'convert_s': convert_s,
+        'csv_s': csv_s - baseline_s,
+        'csv_mb': csv_mb,
+        'store_s': store_s - baseline_s,
+        'store_mb': store_mb,
+        'baseline_mb': baseline_mb,
+    }
+    
+    print(f"Dashboard dataset load ({n_rows} rows, one-time conversion {convert_s:.1f} s)")
+    print(f"  read_csv, all columns:  {results['csv_s'] * 1000:10.0f} ms, peak RSS {csv_mb:.0f} MB")
+    print(f"  store, page columns:    {results['store_s'] * 1000:10.0f} ms, peak RSS {store_mb:.0f} MB")
+    print(f"  (interpreter + pandas alone: peak RSS {baseline_mb:.0f} MB)")
+    return results
+
+def bench_aggregates(n_rows=5000000):
+    """
+    Compare the dashboard's per-rerun group-bys over the whole dataset with
+    building the aggregate cube once and looking the charts up in it
+    """
+    from dashboard_data import make_synthetic_dataset
+    from aggregates import build_cube, DIMENSIONS, AGE_BINS, AGE_LABELS
+    
+    df = make_synthetic_dataset(n_rows)
+    for column in ('gender', 'work_type', 'Residence_type', 'smoking_status'):
+        df[column] = df[column].astype('category')
+    
+    def groupbys():
+        age_group = pd.cut(df['age'], bins=AGE_BINS, labels=AGE_LABELS)
+        df['stroke'].groupby(age_group, observed=True).mean()
+        for dim in DIMENSIONS:
+            if dim != 'age_group':
+                df.groupby(dim, observed=True)['stroke'].mean()
+    
+    build_s = _timeit(lambda: build_cube(df), repeat=3)
+    cube = build_cube(df)
+    
+    def lookups():
+        # Fresh memo each time, so every table is computed from the cube
+        cube._tables.clear()
+        for dim in DIMENSIONS:
+            cube.marginal(dim)
+    
+    results = {
+        'rows': n_rows,
+        'groupby_ms': _timeit(groupbys, repeat=3) * 1000,
+        'build_ms': build_s * 1000,
+        'lookup_ms': _timeit(lookups, repeat=20) * 1000,
+        'memo_us': _timeit(lambda: [cube.marginal(dim) for dim in DIMENSIONS], repeat=1000) * 1e6,
+    }
+    
+    print(f"Dashboard group-bys ({n_rows} rows, all {len(DIMENSIONS)} dimensions)")
+    print(f"  group-by per rerun:    {results['groupby_ms']:10.1f} ms")
+    print(f"  cube build (once):     {results['build_ms']:10.1f} ms")
+    print(f"  cube tables:           {results['lookup_ms']:10.2f} ms ({results['memo_us']:.1f} us memoized)")
+    return results
+
+def bench_figure_cache(n_rows=100000, reruns=10):
+    """
+    Time the Risk Factors page's five charts drawn and encoded on every rerun
+    against served from the figure cache, and count figures left open
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from dashboard_data import make_synthetic_dataset
+    from figure_cache import FigureCache
+    
+    df = make_synthetic_dataset(n_rows)
+    rates = {
+        column: df.groupby(column)['stroke'].mean().reset_index()
+        for column in ('hypertension', 'heart_disease', 'smoking_status')
+    }
+    
+    def bar(column):
+        fig, ax = plt.subplots(figsize=(8, 6))
+        sns.barplot(x=column, y='stroke', data=rates[column], ax=ax)
+        return fig
+    
+    def box(column):
+        fig, ax = plt.subplots(figsize=(10, 6))
+        sns.boxplot(x='stroke', y=column, data=df, ax=ax)
+        return fig
+    
+    charts = [
+        ('hypertension', lambda: bar('hypertension')),
+        ('avg_glucose_level', lambda: box('avg_glucose_level')),
+        ('heart_disease', lambda: bar('heart_disease')),
+        ('bmi', lambda: box('bmi')),
+        ('smoking_status', lambda: bar('smoking_status')),
+    ]
+    
+    def uncached_page():
+        # What st.pyplot did: encode every figure and leave it open
+        for _, draw in charts:
+            draw().savefig(io.BytesIO(), format='png', bbox_inches='tight', dpi=200)
+    
+    cache = FigureCache()
+    
+    def cached_page():
+        for chart, draw in charts:
+            cache.render(('Risk Factors', chart, 'v1', 'm1'), draw)
+    
+    plt.close('all')
+    uncached_s = _timeit(uncached_page, repeat=reruns)
+    leaked = len(plt.get_fignums())
+    plt.close('all')
+    first_s = _timeit(cached_page, repeat=1)
+    cached_s = _timeit(cached_page, repeat=reruns)
+    
+    results = {
+        'rows': n_rows,
+        'uncached_ms': uncached_s * 1000,
+        'first_render_ms': first_s * 1000,
+        'cached_ms': cached_s * 1000,
+        'open_figures_uncached': leaked,
+        'open_figures_cached': len(plt.get_fignums()),
+        'cache_bytes': cache.stats()['bytes'],
+    }
+    
+    print(f"Risk Factors figures ({n_rows} rows, {len(charts)} charts, {reruns} reruns)")
+    print(f"  redrawn every rerun:   {results['uncached_ms']:10.1f} ms, {leaked} figures left open")
+    print(f"  figure cache, first:   {results['first_render_ms']:10.1f} ms")
+    print(f"  figure cache, hits:    {results['cached_ms']:10.3f} ms, {results['open_figures_cached']} figures left open")
+    return results
+
+def bench_grid_scoring(engine='sklearn'):
+    """
+    Score the dashboard's risk curve and interactive gauge grid through the
+    model: one predict_stroke_risk call per point against score_grid
+    """
+    import model as model_module
+    from model import score_grid
+    
+    model, feature_names = make_synthetic_model()
+    base = dict(make_synthetic_patients(1, seed=3)[0])
+    ages = np.linspace(20, 80, 100)
+    curve_axes = {'age': ages, 'hypertension': [0, 1]}
+    gauge_axes = {
+        'age': list(range(20, 101)),
+        'hypertension': [0, 1],
+        'heart_disease': [0, 1],
+        'avg_glucose_level': list(range(50, 301)),
+        'smoking_status': ['never_smoked', 'formerly_smoked', 'smokes'],
+    }
+    
+    def curve_per_point():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for age, hypertension in itertools.product(ages, [0, 1]):
+                predict_stroke_risk(model, feature_names, dict(base, age=age, hypertension=hypertension), engine)
+    
+    def fresh_grid(axes):
+        # Forget memoized grids so every run scores from scratch
+        model_module._grid_cache.clear()
+        return score_grid(model, feature_names, axes, base, engine)
+    
+    gauge = fresh_grid(gauge_axes)
+    rng = np.random.default_rng(0)
+    lookups = [
+        (rng.integers(81), rng.integers(2), rng.integers(2), rng.integers(251), rng.integers(3))
+        for _ in range(1000)
+    ]
+    
+    def lookup():
+        # What a slider interaction does: fetch the memoized grid, read one point
+        for position in lookups:
+            float(score_grid(model, feature_names, gauge_axes, base, engine)[position])
+    
+    results = {
+        'engine': engine,
+        'curve_points': len(ages) * 2,
+        'curve_per_point_ms': _timeit(curve_per_point, repeat=3) * 1000,
+        'curve_grid_ms': _timeit(lambda: fresh_grid(curve_axes)) * 1000,
+        'gauge_points': gauge.size,
+        'gauge_grid_ms': _timeit(lambda: fresh_grid(gauge_axes), repeat=3) * 1000,
+        'gauge_lookup_us': _timeit(lookup, repeat=20) * 1e6 / len(lookups),
+    }
+    
+    print(f"Risk grid scoring ({engine} engine)")
+    print(f"  curve, per point:      {results['curve_per_point_ms']:10.1f} ms ({results['curve_points']} points)")
+    print(f"  curve, score_grid:     {results['curve_grid_ms']:10.2f} ms")
+    print(f"  gauge, score_grid:     {results['gauge_grid_ms']:10.1f} ms ({results['gauge_points']} points, once per model)")
+    print(f"  gauge, memoized:       {results['gauge_lookup_us']:10.2f} us per slider lookup")
+    return results
+
+def bench_sketches(n_rows=5000000, relative_accuracy=0.01):
+    """
+    Compare describe() and the stroke box plot statistics computed from all
+    rows with the same figures from quantile sketches, and measure the
+    sketches' quantile error and size
+    """
+    import matplotlib.cbook as cbook
+    from dashboard_data import make_synthetic_dataset
+    from sketches import build_summaries, SUMMARY_COLUMNS
+    
+    df = make_synthetic_dataset(n_rows)
+    columns = list(SUMMARY_COLUMNS)
+    
+    def exact():
+        df[columns].describe()
+        for column in ('avg_glucose_level', 'bmi'):
+            cbook.boxplot_stats([df.loc[df['stroke'] == label, column].to_numpy() for label in (0, 1)])
+    
+    summaries = build_summaries(df, relative_accuracy)
+    
+    def from_sketches():
+        summaries.describe()
+        for column in ('avg_glucose_level', 'bmi'):
+            summaries.boxplot_stats(column)
+    
+    approximate = summaries.describe()
+    reference = df[columns].describe()
+    quartiles = ['25%', '50%', '75%']
+    error = float((abs(approximate.loc[quartiles] - reference.loc[quartiles]) / reference.loc[quartiles]).max().max())
+    buckets = sum(
+        len(sketch.positive) + len(sketch.negative)
+        for sketch in list(summaries.overall.values()) +
+        [s for groups in summaries.by_stroke.values() for s in groups.values()]
+    )
+    
+    results = {
+        'rows': n_rows,
+        'relative_accuracy': relative_accuracy,
+        'exact_ms': _timeit(exact, repeat=3) * 1000,
+        'build_ms': _timeit(lambda: build_summaries(df, relative_accuracy), repeat=3) * 1000,
+        'sketch_ms': _timeit(from_sketches, repeat=20) * 1000,
+        'max_quartile_error': error,
+        'buckets': buckets,
+    }
+    
+    print(f"Summary statistics ({n_rows} rows, {relative_accuracy:.1%} quantile accuracy)")
+    print(f"  describe + box plots, exact:   {results['exact_ms']:10.1f} ms per rerun")
+    print(f"  sketches, build (once):        {results['build_ms']:10.1f} ms")
+    print(f"  describe + box plots, sketch:  {results['sketch_ms']:10.2f} ms ({buckets} buckets in total)")
+    print(f"  largest quartile error:        {error:10.3%}")
+    return results
+
+def bench_ingestion(n_rows=5000000, n_new=100000):
+    """
+    Append a day's records to a large dataset store: incremental update of
+    the saved dashboard statistics against recomputing them from every row
+    """
+    from dashboard_data import (
+        make_synthetic_dataset, convert_csv, ingest, load_stats, build_stats, load_columns
+    )
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'stroke.csv')
+        new_path = os.path.join(tmp, 'new.csv')
+        store_dir = os.path.join(tmp, 'stroke.store')
+        make_synthetic_dataset(n_rows).to_csv(csv_path, index=False)
+        make_synthetic_dataset(n_new, seed=7).to_csv(new_path, index=False)
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            convert_csv(csv_path, store_dir)
+            load_stats(store_dir)
+            
+            start = time.perf_counter()
+            ingest(store_dir, new_path)
+            ingest_s = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            load_stats(store_dir)
+            reload_s = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            build_stats(load_columns(store_dir))
+            rebuild_s = time.perf_counter() - start
+    
+    results = {
+        'rows': n_rows,
+        'new_rows': n_new,
+        'ingest_s': ingest_s,
+        'stats_reload_ms': reload_s * 1000,
+        'full_rebuild_s': rebuild_s,
+    }
+    
+    print(f"Ingestion ({n_new} new rows into {n_rows})")
+    print(f"  append + incremental stats: {ingest_s:8.2f} s")
+    print(f"  dashboard stats reload:     {reload_s * 1000:8.1f} ms")
+    print(f"  full stats recompute:       {rebuild_s:8.2f} s")
+    return results
+
+def bench_bulk_scoring(n_rows=1000000, worker_counts=None, n_single=2000):
+    """
+    Throughput of `model.py score` on a synthetic registry CSV for several
+    worker counts, against scoring the same patients one call at a time
+    """
+    from model import score_file
+    from dashboard_data import make_synthetic_dataset
+    
+    worker_counts = worker_counts or sorted({1, os.cpu_count() or 1})
+    model, feature_names = make_synthetic_model()
+    patients = make_synthetic_patients(n_single)
+    
+    def single():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for patient in patients:
+                predict_stroke_risk(model, feature_names, patient)
+    
+    results = {'rows': n_rows, 'single_rows_per_s': n_single / _timeit(single, repeat=1)}
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = _synthetic_model_file(tmp)
+        input_path = os.path.join(tmp, 'registry.csv')
+        make_synthetic_dataset(n_rows).to_csv(input_path, index=False)
+        for workers in worker_counts:
+            output_path = os.path.join(tmp, f'scores_{workers}.csv')
+            start = time.perf_counter()
+            score_file(model_path, input_path, output_path, workers=workers)
+            results[f'workers_{workers}_rows_per_s'] = n_rows / (time.perf_counter() - start)
+    
+    print(f"Bulk scoring ({n_rows} rows, CSV in and out)")
+    print(f"  one call per patient:  {results['single_rows_per_s']:10.0f} rows/s")
+    for workers in worker_counts:
+        print(f"  score_file, workers={workers}: {results[f'workers_{workers}_rows_per_s']:8.0f} rows/s")
+    return results
+
+def bench_metrics_overhead(n_calls=100000):
+    """
+    Per-request cost of the /predict instrumentation: the stage timers plus
+    recording the request counter, latency and stage histograms
+    """
+    flask_app = _import_app()
+    
+    timings = {'parse': 4e-5, 'preprocess': 6e-6, 'inference': 8e-4, 'importance': 2e-6, 'serialize': 3e-5}
+    
+    def record():
+        for _ in range(n_calls):
+            flask_app.record_request('/predict', time.perf_counter(), timings)
+    
+    def timers():
+        # The perf_counter reads a /predict request makes for its stage timings
+        clock = time.perf_counter
+        for _ in range(n_calls):
+            clock(); clock(); clock(); clock(); clock(); clock(); clock(); clock()
+    
+    record_us = _timeit(record) * 1e6 / n_calls
+    timers_us = _timeit(timers) * 1e6 / n_calls
+    
+    model, feature_names = make_synthetic_model()
+    patient = make_synthetic_patients(1)[0]
+    
+    def predict(timings_arg):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(2000):
+                predict_stroke_risk(model, feature_names, patient, 'linear-native', timings=timings_arg)
+    
+    results = {
+        'record_us': record_us,
+        'timers_us': timers_us,
+        'total_us': record_us + timers_us,
+        'predict_us': _timeit(lambda: predict(None)) * 1e6 / 2000,
+        'predict_timed_us': _timeit(lambda: predict({})) * 1e6 / 2000,
+    }
+    
+    print("Metrics instrumentation overhead per /predict request")
+    print(f"  stage timers:          {results['timers_us']:10.2f} us")
+    print(f"  counters + histograms: {results['record_us']:10.2f} us")
+    print(f"  total:                 {results['total_us']:10.2f} us")
+    print(f"  (predict_stroke_risk, linear-native: {results['predict_us']:.2f} us, "
+          f"{results['predict_timed_us']:.2f} us with timings)")
+    return results
+
+def bench_logging(n_requests=4000, threads=1, reader_bytes_per_s=100000):
+    """
+    Compare /predict tail latency with every request logged by a handler that
+    writes straight to a slow stdout, through the background JSON writer, and
+    not logged at all. The slow stdout is a pipe drained by a subprocess at
+    `reader_bytes_per_s`, like a busy log collector.
+    """
+    import logging
+    import jsonlog
+    
+    flask_app = _import_app()
+    patients = make_synthetic_patients(n_requests, seed=6)
+    prediction_cache = flask_app.prediction_cache
+    flask_app.prediction_cache = None
+    
+    reader = subprocess.Popen(
+        [sys.executable, '-c',
+         "import sys, time\n"
+         "while sys.stdin.buffer.read1(4096):\n"
+         f"    time.sleep(4096 / {reader_bytes_per_s})\n"],
+        stdin=subprocess.PIPE
+    )
+    pipe = io.TextIOWrapper(reader.stdin, line_buffering=True)
+    root = logging.getLogger()
+    
+    def run():
+        client = flask_app.app.test_client()
+        latencies, throughput = _concurrent_latencies(
+            lambda patient: client.post('/predict', data=patient), patients, threads)
+        return {
+            'p50_ms': float(np.percentile(latencies, 50)) * 1000,
+            'p99_ms': float(np.percentile(latencies, 99)) * 1000,
+            'max_ms': float(latencies.max()) * 1000,
+            'requests_per_s': throughput,
+        }
+    
+    results = {}
+    try:
+        # Logging switched off by sampling every route at 0
+        default_rate = jsonlog.LOG_SAMPLE_RATE
+        jsonlog.LOG_SAMPLE_RATE = 0
+        try:
+            results['off'] = run()
+        finally:
+            jsonlog.LOG_SAMPLE_RATE = default_rate
+        
+        # Every request logged, written out on the request thread
+        jsonlog.stop_logging()
+        direct = logging.StreamHandler(pipe)
+        direct.setFormatter(jsonlog.JsonFormatter())
+        root.addHandler(direct)
+        try:
+            results['direct'] = run()
+        finally:
+            root.removeHandler(direct)
+        
+        # Every request logged through the queue and writer thread
+        handler = jsonlog.configure_logging(pipe)
+        results['queued'] = run()
+        results['queued']['dropped'] = handler.dropped
+    finally:
+        flask_app.jsonlog.configure_logging(open(os.devnull, 'w'))
+        flask_app.prediction_cache = prediction_cache
+        reader.kill()
+        reader.wait()
+    
+    print(f"/predict latency with request logging ({n_requests} requests from {threads} thread(s), "
+          f"stdout drained at {reader_bytes_per_s // 1000} kB/s)")
+    for name, label in (('off', 'not logged'), ('direct', 'direct handler'), ('queued', 'queued JSON writer')):
+        r = results[name]
+        print(f"  {label:20s} p50 {r['p50_ms']:7.2f} ms   p99 {r['p99_ms']:8.2f} ms   "
+              f"max {r['max_ms']:8.2f} ms   {r['requests_per_s']:7.0f} req/s")
+    print(f"  records dropped by the queued writer: {results['queued']['dropped']}")
+    return results
+
+def bench_model_swap(duration=10, swap_every=0.5):
+    """
+    /predict latency while the model registry swaps in a new model version
+    every `swap_every` seconds, compared with a run without swaps. Checks
+    that no request fails and counts the versions that answered.
+    """
+    from model_registry import ModelRegistry
+    
+    flask_app = _import_app()
+    prediction_cache = flask_app.prediction_cache
+    flask_app.prediction_cache = None
+    patients = make_synthetic_patients(1000, seed=9)
+    models = [make_synthetic_model(seed=seed) for seed in range(4)]
+    
+    def run(model_dir, swap):
+        registry = ModelRegistry(model_dir=model_dir, poll_interval=0.05)
+        with contextlib.redirect_stdout(io.StringIO()):
+            registry.load_initial()
+        previous_registry, flask_app.registry = flask_app.registry, registry
+        registry.start_watching()
+        
+        # New versions are written ahead and renamed in, as a deploy would,
+        # so only the registry's own work competes with the requests
+        staged = []
+        for count in range(1, int(duration / swap_every) + 1):
+            model, feature_names = models[count % len(models)]
+            temp_path = os.path.join(model_dir, f'.v{count}.tmp')
+            with open(temp_path, 'wb') as file:
+                pickle.dump({'model': model, 'feature_names': feature_names}, file)
+            staged.append((temp_path, os.path.join(model_dir, f'v{count}.pkl')))
+        stop = time.perf_counter() + duration
+        
+        def publish():
+            for temp_path, path in staged:
+                time.sleep(swap_every)
+                if time.perf_counter() > stop - swap_every:
+                    break
+                os.replace(temp_path, path)
+        
+        import threading
+        publisher = threading.Thread(target=publish) if swap else None
+        if publisher:
+            publisher.start()
+        client = flask_app.app.test_client()
+        latencies, versions, errors = [], set(), 0
+        i = 0
+        try:
+            while time.perf_counter() < stop:
+                start = time.perf_counter()
+                response = client.post('/predict', data=patients[i % len(patients)])
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+                else:
+                    versions.add(response.get_json()['model_version'])
+                i += 1
+        finally:
+            if publisher:
+                publisher.join()
+            registry.stop()
+            flask_app.registry = previous_registry
+        latencies = np.array(latencies) * 1000
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'versions': len(versions),
+            'swaps': registry.swaps,
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'max_ms': float(latencies.max()),
+        }
+    
+    results = {}
+    try:
+        for name, swap in (('steady', False), ('swapping', True)):
+            with tempfile.TemporaryDirectory() as tmp:
+                model, feature_names = models[0]
+                with open(os.path.join(tmp, 'v0.pkl'), 'wb') as file:
+                    pickle.dump({'model': model, 'feature_names': feature_names}, file)
+                results[name] = run(tmp, swap)
+    finally:
+        flask_app.prediction_cache = prediction_cache
+    
+    print(f"/predict latency during model swaps ({duration} s, a new version every {swap_every} s)")
+    for name, r in results.items():
+        print(f"  {name:9s} p50 {r['p50_ms']:6.2f} ms   p99 {r['p99_ms']:6.2f} ms   max {r['max_ms']:6.2f} ms   "
+              f"{r['requests']} requests, {r['errors']} errors, {r['swaps']} swaps, {r['versions']} versions answered")
+    return results
+
+# Regression suite: small fixed workloads timed per call, so that runs can be
+# compared with each other and with a stored baseline
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# A case is reported as a regression when it is this much slower than the baseline
+DEFAULT_TOLERANCE = 0.25
+
+SUITE_ROWS = 200000
+
+def _per_call_us(func, calls, repeat=5):
+    """Best time per call of func over several runs of `calls` calls, in microseconds"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()  # warm up
+        return _timeit(lambda: [func() for _ in range(calls)], repeat) * 1e6 / calls
+
+def run_suite(n_rows=SUITE_ROWS):
+    """
+    Time every case of the regression suite on the synthetic model and
+    dataset; returns {case: microseconds per call}
+    """
+    from chatbot import get_chatbot_response
+    from dashboard_data import make_synthetic_dataset
+    from aggregates import build_cube
+    from sketches import build_summaries, SUMMARY_COLUMNS
+    from input_schema import get_schema
+    from model_registry import smoke_test
+    
+    model, feature_names = make_synthetic_model()
+    patients = itertools.cycle(make_synthetic_patients(100))
+    messages = itertools.cycle([
+        "what are the symptoms of a stroke", "how can I prevent a stroke",
+        "what is my risk if I smoke", "tell me something unrelated",
+    ])
+    results = {}
+    
+    results['preprocess_input'] = _per_call_us(
+        lambda: preprocess_input(next(patients), feature_names), 2000)
+    for engine in ('sklearn', 'linear-native'):
+        results[f'predict_stroke_risk[{engine}]'] = _per_call_us(
+            lambda: predict_stroke_risk(model, feature_names, next(patients), engine), 1000)
+    results['get_chatbot_response'] = _per_call_us(lambda: get_chatbot_response(next(messages)), 2000)
+    
+    # A model without the reference level of each categorical field has to
+    # pass the swap smoke test and accept patients at the reference levels
+    drop_model, drop_features = make_synthetic_model(drop_first=True)
+    smoke_test(drop_model, drop_features)
+    schema = get_schema(drop_features)
+    reference_patients = itertools.cycle([
+        dict(patient, **{field: encoded[0][len(field) + 1:] for field, encoded in CATEGORICAL_MAPPINGS.items()})
+        for patient in make_synthetic_patients(100, seed=2)
+    ])
+    results['validate + predict[drop-first]'] = _per_call_us(
+        lambda: predict_stroke_risk(drop_model, drop_features,
+                                    schema.validate(next(reference_patients), numbers_as_text=True)), 1000)
+    
+    # Routes through Flask's test client, without a network in between
+    flask_app = _import_app()
+    client = flask_app.app.test_client()
+    prediction_cache = flask_app.prediction_cache
+    flask_app.prediction_cache = None
+    try:
+        results['POST /predict'] = _per_call_us(lambda: client.post('/predict', data=next(patients)), 500)
+    finally:
+        flask_app.prediction_cache = prediction_cache
+    if prediction_cache is not None:
+        patient = next(patients)
+        results['POST /predict (cached)'] = _per_call_us(lambda: client.post('/predict', data=patient), 500)
+    results['POST /chatbot'] = _per_call_us(
+        lambda: client.post('/chatbot', json={'message': next(messages)}), 500)
+    
+    # Dashboard aggregation, sized by n_rows
+    df = make_synthetic_dataset(n_rows)
+    cube = build_cube(df)
+    summaries = build_summaries(df)
+    
+    def cube_tables():
+        cube._tables.clear()
+        cube.precompute()
+    
+    def summary_tables():
+        summaries.describe()
+        for column in SUMMARY_COLUMNS:
+            summaries.boxplot_stats(column)
+    
+    results[f'build_cube[{n_rows} rows]'] = _per_call_us(lambda: build_cube(df), 1, repeat=3)
+    results['cube tables'] = _per_call_us(cube_tables, 5)
+    results[f'build_summaries[{n_rows} rows]'] = _per_call_us(lambda: build_summaries(df), 1, repeat=3)
+    results['summary tables'] = _per_call_us(summary_tables, 20)
+    return {case: round(us, 3) for case, us in results.items()}
+
+def suite_environment():
+    """Versions and hardware the suite ran on, stored with its results"""
+    import sklearn
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'scikit-learn': sklearn.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+def compare_results(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Print each case next to its baseline time; returns the cases that are
+    more than `tolerance` slower than the baseline
+    """
+    regressions = []
+    width = max(len(case) for case in results)
+    print(f"{'case':{width}s}  {'baseline us':>12s}  {'current us':>12s}  {'change':>8s}")
+    for case, current in results.items():
+        reference = baseline.get(case)
+        if reference is None:
+            print(f"{case:{width}s}  {'-':>12s}  {current:12.2f}  {'new':>8s}")
+            continue
+        change = current / reference - 1
+        flag = ''
+        if change > tolerance:
+            regressions.append(case)
+            flag = '  REGRESSION'
+        print(f"{case:{width}s}  {reference:12.2f}  {current:12.2f}  {change:+8.1%}{flag}")
+    return regressions
+
+def run_all():
+    """Run every comparison benchmark at full size"""
+    print(f"Encoding parity checked on {check_encoding_parity()} inputs")
+    bench_preprocess()
+    bench_input_formats()
+    bench_scoring_engines()
+    bench_explanations()
+    bench_grid_scoring()
+    bench_metrics_overhead()
+    bench_logging()
+    bench_model_load()
+    bench_model_swap()
+    bench_dataset_load()
+    bench_aggregates()
+    bench_sketches()
+    bench_ingestion()
+    bench_figure_cache()
+    bench_assets()
+    bench_chatbot()
+    bench_chat_sessions()
+    bench_retrieval()
+    bench_batch_predict()
+    bench_bulk_scoring()
+    bench_coalescer()
+    bench_serving_scaling()
+    bench_asgi_concurrency()
+
+def main(argv=None):
+    """
+    Command-line entry point: `all` (the default) runs the comparison
+    benchmarks, `suite` runs the regression suite and checks it against the
+    stored baseline
+    """
+    parser = argparse.ArgumentParser(description="Stroke prediction app benchmarks")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('all', help="Run every comparison benchmark (slow)")
+    
+    suite_parser = subparsers.add_parser('suite', help="Run the regression suite and compare with the baseline")
+    suite_parser.add_argument('--output', help="JSON file to write the results to")
+    suite_parser.add_argument('--baseline', default=BASELINE_PATH, help="Baseline JSON file to compare with")
+    suite_parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                              help="Allowed slowdown before a case counts as a regression (0.25 = 25%%)")
+    suite_parser.add_argument('--rows', type=int, default=SUITE_ROWS, help="Rows in the synthetic dashboard dataset")
+    suite_parser.add_argument('--save-baseline', action='store_true',
+                              help="Write the results to the baseline file instead of comparing")
+    
+    args = parser.parse_args(argv)
+    
+    if args.command in (None, 'all'):
+        run_all()
+        return 0
+    
+    report = {'environment': suite_environment(), 'results_us': run_suite(args.rows)}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        for case, current in report['results_us'].items():
+            print(f"  {case}: {current:.2f} us")
+        return 0
+    
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if baseline.get('environment') != report['environment']:
+        print("Note: the baseline was recorded in a different environment:", baseline.get('environment'))
+    regressions = compare_results(report['results_us'], baseline['results_us'], args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than the baseline by more than {args.tolerance:.0%}: "
+              + ", ".join(regressions))
+        return 1
+    print(f"No case slower than the baseline by more than {args.tolerance:.0%}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
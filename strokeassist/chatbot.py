@@ -1,4 +1,13 @@
-import re
+import logging
+import math
+import os
+import random
+import time
+from collections import defaultdict
+
+from retrieval import STOPWORDS, tokenize, build_index, open_index
+
+logger = logging.getLogger(__name__)
 
 # Define a knowledge base for the chatbot
 stroke_knowledge = {
@@ -85,38 +94,174 @@ thank_responses = [
     "No problem! Remember that awareness is key in stroke prevention."
 ]
 
-def get_chatbot_response(message):
+# Share of a knowledge entry's (idf-weighted) words a message must contain
+# for an entry made only of common words to match
+MIN_COVERAGE = 0.5
+
+class IntentIndex:
+    """
+    Inverted index from tokens to the intents that answer a message.
+    
+    Small-talk phrases (greetings, farewells, thanks) match when all of their
+    words are in the message. Knowledge base entries are scored by how much
+    of their idf-weighted content words the message covers. Only the posting
+    lists of the message's own tokens are visited, so lookups cost depends on
+    the message length rather than the size of the knowledge base.
+    """
+    def __init__(self, knowledge, small_talk):
+        # Small talk: token -> [(priority, phrase tokens, responses)]
+        self.small_talk = defaultdict(list)
+        for priority, (phrases, responses) in enumerate(small_talk):
+            for phrase in phrases:
+                tokens = frozenset(tokenize(phrase))
+                for token in tokens:
+                    self.small_talk[token].append((priority, tokens, responses))
+        
+        # Knowledge base: content tokens of every entry and postings token -> entries
+        self.responses = []
+        self.terms = []
+        self.postings = defaultdict(list)
+        for key, response in knowledge.items():
+            tokens = [token for token in tokenize(key) if token not in STOPWORDS]
+            terms = frozenset(tokens or tokenize(key))
+            entry = len(self.responses)
+            self.responses.append(response)
+            self.terms.append(terms)
+            for term in terms:
+                self.postings[term].append(entry)
+        
+        n_entries = max(len(self.responses), 1)
+        self.idf = {
+            term: math.log((n_entries + 1) / (len(entries) + 1)) + 1
+            for term, entries in self.postings.items()
+        }
+        self.total_weight = [sum(self.idf[term] for term in terms) for terms in self.terms]
+        
+        # Terms in more than half the entries (like "stroke") don't pick
+        # candidates by themselves, except for entries made only of such terms
+        self.common = {
+            term for term, entries in self.postings.items()
+            if n_entries > 2 and len(entries) > n_entries / 2
+        }
+        self.generic_entries = [
+            entry for entry, terms in enumerate(self.terms) if terms <= self.common
+        ]
+    
+    def match_small_talk(self, tokens):
+        """Return the responses of the highest priority phrase in the message"""
+        best = None
+        for token in tokens:
+            for priority, phrase, responses in self.small_talk.get(token, ()):
+                if (best is None or priority < best[0]) and phrase <= tokens:
+                    best = (priority, responses)
+        return best[1] if best else None
+    
+    def match_knowledge(self, tokens):
+        """Return the best matching knowledge base response, or None"""
+        candidates = set()
+        for token in tokens:
+            if token not in self.common:
+                candidates.update(self.postings.get(token, ()))
+        rare_match = bool(candidates)
+        if not candidates:
+            candidates = self.generic_entries
+        
+        best, best_score = None, None
+        for entry in candidates:
+            matched = sum(self.idf[term] for term in self.terms[entry] if term in tokens)
+            score = (matched / self.total_weight[entry], matched)
+            if best_score is None or score > best_score:
+                best, best_score = entry, score
+        
+        if best is None or (not rare_match and best_score[0] < MIN_COVERAGE):
+            return None
+        return self.responses[best]
+
+def build_intent_index(knowledge):
+    """Index a knowledge base (question key -> response) with the small talk intents"""
+    small_talk = [
+        (greetings, greeting_responses),
+        (farewells, farewell_responses),
+        (thanks, thank_responses),
+    ]
+    return IntentIndex(knowledge, small_talk)
+
+# Built once at import
+intent_index = build_intent_index(stroke_knowledge)
+
+# Patient-education articles to answer from when no intent matches: a
+# directory of .txt/.md files or a .jsonl file. Their passage index is built
+# once and saved in CHATBOT_INDEX_DIR (default: next to the corpus). Without
+# a corpus, the knowledge base above is searched as a small built-in corpus.
+CHATBOT_CORPUS = os.environ.get('CHATBOT_CORPUS')
+CHATBOT_INDEX_DIR = os.environ.get('CHATBOT_INDEX_DIR')
+
+# Passages combined into one answer, and the lowest BM25 score answered with
+CHATBOT_PASSAGES = int(os.environ.get('CHATBOT_PASSAGES', 2))
+CHATBOT_MIN_SCORE = float(os.environ.get('CHATBOT_MIN_SCORE', 2.0))
+
+def builtin_passages(knowledge):
+    """The knowledge base as retrieval passages"""
+    return [{'title': key, 'text': response, 'source': 'built-in'} for key, response in knowledge.items()]
+
+def load_passage_index():
+    """Open the CHATBOT_CORPUS index, or index the built-in knowledge base"""
+    if CHATBOT_CORPUS:
+        start = time.perf_counter()
+        try:
+            index = open_index(CHATBOT_CORPUS, CHATBOT_INDEX_DIR)
+            logger.info("Chatbot corpus loaded", extra={
+                'passages': len(index), 'load_ms': round((time.perf_counter() - start) * 1000, 1)
+            })
+            return index
+        except Exception as e:
+            logger.exception(f"Error loading chatbot corpus {CHATBOT_CORPUS}: {str(e)}, "
+                             "using the built-in knowledge base")
+    return build_index(builtin_passages(stroke_knowledge))
+
+passage_index = load_passage_index()
+
+def answer_from_passages(message, index=None, k=CHATBOT_PASSAGES):
+    """The best matching passages joined into one answer, or None"""
+    results = (passage_index if index is None else index).search(message, k)
+    if not results or results[0][0] < CHATBOT_MIN_SCORE:
+        return None
+    # Leave out passages much weaker than the best one
+    best = results[0][0]
+    return "\n\n".join(passage['text'] for score, passage in results if score >= best / 2)
+
+def get_chatbot_response(message, index=None, passages=None):
     """
     Generate a response to the user's message
     """
-    message = message.lower().strip()
+    index = index or intent_index
+    tokens = set(tokenize(message))
     
-    # Check for greetings
-    if any(greeting in message for greeting in greetings):
-        import random
-        return random.choice(greeting_responses)
+    # Check for greetings, farewells and thank you
+    responses = index.match_small_talk(tokens)
+    if responses:
+        return random.choice(responses)
     
-    # Check for farewells
-    if any(farewell in message for farewell in farewells):
-        import random
-        return random.choice(farewell_responses)
+    # Check the knowledge base
+    response = index.match_knowledge(tokens)
+    if response:
+        return response
     
-    # Check for thank you
-    if any(thank in message for thank in thanks):
-        import random
-        return random.choice(thank_responses)
+    # Search the article passages
+    response = answer_from_passages(message, passages)
+    if response:
+        return response
     
-    # Check if any of the knowledge base keys are in the message
-    for key, response in stroke_knowledge.items():
-        if key in message or any(word in message for word in key.split()):
-            return response
+    # Unanswered questions, to see what the knowledge base is missing. Only
+    # the size of the question is logged, not what the user wrote.
+    logger.info("No chatbot answer found", extra={'tokens': len(tokens), 'mentions_stroke': "stroke" in tokens})
     
     # Default response for queries about stroke
-    if "stroke" in message:
+    if "stroke" in tokens:
         return ("I'm not sure I understand your question about strokes. "
                 "You can ask me about stroke types, symptoms, risk factors, prevention, "
                 "treatment, recovery, or statistics.")
     
     # Default response
     return ("I'm here to provide information about strokes. You can ask me about stroke types, "
-            "symptoms, risk factors, prevention, treatment, recovery, or statistics.")
\ No newline at end of file
+            "symptoms, risk factors, prevention, treatment, recovery, or statistics.")
@@ -0,0 +1,109 @@
+"""
+Micro-batching for single-patient predictions.
+
+Under burst load many concurrent /predict calls each run a one-row inference.
+The coalescer queues those calls for a short window (or until a batch is
+full), scores them together with one vectorized call and hands each caller
+its own result.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Upper bounds of the batch-size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+class PredictionCoalescer:
+    """
+    Collect prediction requests from many threads and score them in batches.
+
+    `score_batch` takes a list of form-style dicts and returns one result per
+    dict, in order. A batch is scored when `max_batch` requests are waiting or
+    `max_wait` seconds after its first request arrived, whichever is first.
+    """
+    def __init__(self, score_batch, max_wait=0.002, max_batch=64):
+        self.score_batch = score_batch
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._batch_sizes = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self._max_queue_depth = 0
+
+        self._thread = threading.Thread(target=self._run, name='prediction-coalescer', daemon=True)
+        self._thread.start()
+
+    def submit(self, data):
+        """Queue one patient and return a Future for its result"""
+        future = Future()
+        self._queue.put((data, future))
+        return future
+
+    def predict(self, data, timeout=None):
+        """Queue one patient and wait for its result"""
+        return self.submit(data).result(timeout)
+
+    def _collect(self):
+        """Block for the first request, then gather more until the window closes"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _record(self, batch_size, queue_depth):
+        """Update the batch-size histogram and queue depth statistics"""
+        bucket = len(BATCH_SIZE_BUCKETS)
+        for i, bound in enumerate(BATCH_SIZE_BUCKETS):
+            if batch_size <= bound:
+                bucket = i
+                break
+        with self._stats_lock:
+            self._requests += batch_size
+            self._batches += 1
+            self._batch_sizes[bucket] += 1
+            self._max_queue_depth = max(self._max_queue_depth, queue_depth + batch_size)
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self._record(len(batch), self._queue.qsize())
+
+            futures = [future for _, future in batch]
+            try:
+                results = self.score_batch([data for data, _ in batch])
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+    def stats(self):
+        """Queue depth, request counts and the batch-size histogram"""
+        with self._stats_lock:
+            histogram = {
+                f"le_{bound}": count
+                for bound, count in zip(BATCH_SIZE_BUCKETS, self._batch_sizes)
+            }
+            histogram['gt_' + str(BATCH_SIZE_BUCKETS[-1])] = self._batch_sizes[-1]
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_queue_depth,
+                'requests': self._requests,
+                'batches': self._batches,
+                'mean_batch_size': self._requests / self._batches if self._batches else 0.0,
+                'batch_size_histogram': histogram,
+                'max_wait_ms': self.max_wait * 1000,
+                'max_batch': self.max_batch,
+            }
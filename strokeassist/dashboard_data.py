@@ -0,0 +1,464 @@
+"""
+Columnar dataset store for the Streamlit dashboard.
+
+A patient CSV is converted once into a directory with one raw binary file per
+column plus a JSON header. Text columns are dictionary-encoded (small integer
+codes plus a list of categories), and every column is memory-mapped when it
+is loaded, so a page only reads the columns it needs no matter how many rows
+the dataset has.
+
+New records are appended to an existing store with `ingest`, which also
+folds them into the saved dashboard statistics instead of recomputing those.
+
+Usage:
+    python dashboard_data.py convert healthcare-dataset-stroke-data.csv stroke_store/
+    python dashboard_data.py ingest stroke_store/ new-records.csv
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+import jsonlog
+
+from aggregates import build_cube, AggregateCube, SOURCE_COLUMNS
+from sketches import build_summaries, ColumnSummaries, SUMMARY_COLUMNS, DEFAULT_RELATIVE_ACCURACY
+
+# Layout version of the store written by convert_csv
+STORE_FORMAT_VERSION = 1
+STORE_META_FILE = 'meta.json'
+
+# Aggregate cube and quantile sketches saved with the store, one file per
+# dataset version they describe (see save_stats)
+STORE_STATS_FILE = 'stats-{version}-{rows}.json'
+
+# dtype of the codes of dictionary-encoded columns (-1 marks missing values)
+CATEGORY_CODE_DTYPE = 'int16'
+
+logger = logging.getLogger(__name__)
+
+def make_synthetic_dataset(n_samples=500, seed=42):
+    """
+    Create synthetic data based on the stroke dataset schema
+    """
+    rng = np.random.RandomState(seed)
+
+    data = {
+        'id': range(1, n_samples + 1),
+        'gender': rng.choice(['Male', 'Female', 'Other'], n_samples, p=[0.48, 0.51, 0.01]),
+        'age': np.clip(rng.normal(45, 20, n_samples), 0, 100),
+        'hypertension': rng.choice([0, 1], n_samples, p=[0.8, 0.2]),
+        'heart_disease': rng.choice([0, 1], n_samples, p=[0.9, 0.1]),
+        'ever_married': rng.choice(['Yes', 'No'], n_samples),
+        'work_type': rng.choice(['Private', 'Self-employed', 'Govt_job', 'children', 'Never_worked'], n_samples),
+        'Residence_type': rng.choice(['Urban', 'Rural'], n_samples),
+        'avg_glucose_level': np.clip(rng.normal(106, 45, n_samples), 50, 300),
+        'bmi': np.clip(rng.normal(28, 7, n_samples), 10, 60),
+        'smoking_status': rng.choice(['never_smoked', 'formerly_smoked', 'smokes', 'Unknown'], n_samples),
+    }
+
+    # Adding stroke with correlation to risk factors
+    stroke_prob = 0.05 + 0.1 * (data['age'] > 60).astype(int) + \
+                  0.1 * data['hypertension'] + \
+                  0.1 * data['heart_disease'] + \
+                  0.05 * (data['avg_glucose_level'] > 200).astype(int)
+    stroke_prob = np.clip(stroke_prob, 0, 0.9)
+    data['stroke'] = rng.binomial(1, stroke_prob)
+
+    return pd.DataFrame(data)
+
+def is_store(path):
+    """Check whether path is a columnar store directory"""
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, STORE_META_FILE))
+
+def read_meta(store_dir):
+    """Read the store header"""
+    with open(os.path.join(store_dir, STORE_META_FILE)) as file:
+        return json.load(file)
+
+def _write_json(path, data, indent=None):
+    """Write a JSON file atomically, so readers never see a partial file"""
+    with open(path + '.tmp', 'w') as file:
+        json.dump(data, file, indent=indent)
+    os.replace(path + '.tmp', path)
+
+def write_meta(store_dir, meta):
+    """Write the store header"""
+    _write_json(os.path.join(store_dir, STORE_META_FILE), meta, indent=2)
+
+def _column_file(store_dir, column):
+    return os.path.join(store_dir, f"{column}.bin")
+
+def _describe_columns(df):
+    """
+    Decide how each column of the first chunk is stored. Integer columns may
+    still be widened to float32 by a later chunk (see append_chunk).
+    """
+    columns = {}
+    for column in df.columns:
+        dtype = df[column].dtype
+        if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+            columns[column] = {'kind': 'numeric', 'dtype': 'int32'}
+        elif pd.api.types.is_numeric_dtype(dtype):
+            columns[column] = {'kind': 'numeric', 'dtype': 'float32'}
+        else:
+            columns[column] = {'kind': 'category', 'dtype': CATEGORY_CODE_DTYPE, 'categories': []}
+    return columns
+
+def _encode_chunk(meta, df):
+    """
+    Turn a chunk into one array per stored column, growing the category
+    dictionaries with any values not seen before
+    """
+    arrays = {}
+    for column, info in meta['columns'].items():
+        if column not in df.columns:
+            raise ValueError(f"Column {column} missing from appended data")
+        values = df[column]
+
+        if info['kind'] == 'category':
+            categories = info['categories']
+            known = set(categories)
+            strings = values.astype(str).where(values.notna())
+            for value in pd.unique(strings.dropna()):
+                if value not in known:
+                    known.add(value)
+                    categories.append(value)
+            if len(categories) > np.iinfo(CATEGORY_CODE_DTYPE).max:
+                raise ValueError(f"Too many categories in column {column}")
+            codes = pd.Categorical(strings, categories=categories).codes
+            arrays[column] = np.asarray(codes, dtype=CATEGORY_CODE_DTYPE)
+        else:
+            numeric = pd.to_numeric(values, errors='coerce')
+            if info['dtype'] == 'int32' and not _is_integral(numeric):
+                raise ValueError(f"Missing or fractional values in integer column {column}; "
+                                 "convert the dataset again to store it as floats")
+            arrays[column] = numeric.to_numpy(dtype=info['dtype'])
+    return arrays
+
+def _is_integral(numeric):
+    """Whether a numeric Series has no missing or fractional values"""
+    return not numeric.isna().any() and bool((numeric % 1 == 0).all())
+
+def _widen_column(store_dir, meta, column):
+    """Rewrite an int32 column file (and its header entry) as float32"""
+    path = _column_file(store_dir, column)
+    values = np.fromfile(path, dtype='int32', count=meta['rows'])
+    values.astype('float32').tofile(path)
+    meta['columns'][column]['dtype'] = 'float32'
+
+def append_chunk(store_dir, meta, df, widen=False):
+    """
+    Append the rows of df to the column files. The header is not rewritten;
+    call write_meta once all chunks are appended.
+
+    With widen, integer columns that the chunk has missing or fractional
+    values for are first rewritten as float32, as if the first chunk had
+    had them. Only a store nobody is reading yet may be widened; otherwise
+    such values raise ValueError instead of being truncated.
+    """
+    if widen:
+        for column, info in meta['columns'].items():
+            if info['dtype'] == 'int32' and column in df.columns and \
+                    not _is_integral(pd.to_numeric(df[column], errors='coerce')):
+                _widen_column(store_dir, meta, column)
+    arrays = _encode_chunk(meta, df)
+    for column, array in arrays.items():
+        with open(_column_file(store_dir, column), 'ab') as file:
+            array.tofile(file)
+    meta['rows'] += len(df)
+    return arrays
+
+def convert_csv(csv_path, store_dir, chunksize=500000):
+    """
+    Convert a CSV into a columnar store, streaming it in chunks so memory use
+    doesn't grow with the file size.
+
+    The store is written to a new sibling directory that then takes the place
+    of store_dir, so readers of an earlier conversion keep their (memory
+    mapped) files intact and never see a half-written store.
+    """
+    store_dir = os.path.abspath(store_dir)
+    parent, name = os.path.split(store_dir)
+    os.makedirs(parent, exist_ok=True)
+    # Carry on from the version of an earlier conversion into this store, so
+    # caches keyed on dataset_version() see that the contents changed even
+    # when the row count didn't
+    try:
+        version = read_meta(store_dir)['version'] + 1
+    except (OSError, ValueError, KeyError):
+        version = 1
+
+    temp_dir = tempfile.mkdtemp(prefix=f'.{name}.', suffix='.tmp', dir=parent)
+    try:
+        meta = None
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+            if meta is None:
+                meta = {
+                    'format_version': STORE_FORMAT_VERSION,
+                    'rows': 0,
+                    'version': version,
+                    'source': os.path.abspath(csv_path),
+                    'columns': _describe_columns(chunk),
+                }
+                for column in meta['columns']:
+                    open(_column_file(temp_dir, column), 'wb').close()
+            append_chunk(temp_dir, meta, chunk, widen=True)
+
+        if meta is None:
+            raise ValueError(f"No rows in {csv_path}")
+        write_meta(temp_dir, meta)
+        # The statistics of an earlier conversion stay behind with its directory
+        if not _swap_directory(temp_dir, store_dir):
+            return read_meta(store_dir)
+        return meta
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def _swap_directory(new_dir, target_dir):
+    """
+    Put new_dir in the place of target_dir, deleting the old directory (its
+    files stay readable to anyone who has them mapped). Returns False if
+    another conversion installed its store in between; that one is kept.
+    """
+    old_dir = new_dir + '.old'
+    try:
+        os.rename(target_dir, old_dir)
+    except FileNotFoundError:
+        old_dir = None
+    try:
+        os.rename(new_dir, target_dir)
+        return True
+    except OSError:
+        if not is_store(target_dir):
+            raise
+        return False
+    finally:
+        if old_dir:
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+def dataset_version(store_dir):
+    """Token that changes whenever the store's contents change"""
+    meta = read_meta(store_dir)
+    return f"{meta['version']}:{meta['rows']}"
+
+def load_columns(store_dir, columns=None, rows=None, meta=None):
+    """
+    Load some columns of a store as a DataFrame backed by read-only memory maps.
+
+    `columns` defaults to every column; `rows` limits the result to the first
+    rows (e.g. for a preview). Dictionary-encoded columns come back as pandas
+    categoricals.
+    """
+    meta = meta or read_meta(store_dir)
+    if meta.get('format_version') != STORE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported dataset store version: {meta.get('format_version')}")
+
+    columns = list(meta['columns']) if columns is None else list(columns)
+    n_rows = meta['rows'] if rows is None else min(rows, meta['rows'])
+
+    arrays = {}
+    for column in columns:
+        info = meta['columns'].get(column)
+        if info is None:
+            raise KeyError(f"Column {column} not in dataset store")
+        if meta['rows'] == 0:
+            arrays[column] = np.zeros(0, dtype=info['dtype'])
+        else:
+            arrays[column] = np.memmap(_column_file(store_dir, column), dtype=info['dtype'], mode='r',
+                                       shape=(meta['rows'],))[:n_rows]
+    return _frame(meta, arrays)
+
+def _frame(meta, arrays):
+    """DataFrame of stored column arrays, with dictionary-encoded columns as categoricals"""
+    data = {}
+    for column, values in arrays.items():
+        info = meta['columns'][column]
+        if info['kind'] == 'category':
+            values = pd.Categorical.from_codes(values, categories=info['categories'])
+        data[column] = values
+    return pd.DataFrame(data, copy=False)
+
+def build_stats(df, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """Aggregate cube and quantile sketches of a dataset, in one call"""
+    return (
+        build_cube(df[list(SOURCE_COLUMNS)]),
+        build_summaries(df[list(SUMMARY_COLUMNS) + ['stroke']], relative_accuracy)
+    )
+
+def _stats_file(store_dir, meta):
+    return os.path.join(store_dir, STORE_STATS_FILE.format(version=meta['version'], rows=meta['rows']))
+
+def save_stats(store_dir, meta, cube, summaries):
+    """
+    Save the dashboard statistics for the version of the store in meta.
+
+    Every version has its own file, so statistics saved ahead of the header
+    that publishes their version (as ingest does) stay unseen until then, and
+    a reader still on the previous version can't overwrite them with its own.
+    """
+    _write_json(_stats_file(store_dir, meta), {
+        'dataset_version': f"{meta['version']}:{meta['rows']}",
+        'cube': cube.to_dict(),
+        'summaries': summaries.to_dict(),
+    })
+
+def read_stats(store_dir, meta=None, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """
+    Saved (cube, summaries) of the store, or None if there are none, they
+    describe another version of the data or use a different accuracy
+    """
+    meta = meta or read_meta(store_dir)
+    try:
+        with open(_stats_file(store_dir, meta)) as file:
+            stats = json.load(file)
+        if stats['dataset_version'] != f"{meta['version']}:{meta['rows']}":
+            return None
+        summaries = ColumnSummaries.from_dict(stats['summaries'])
+        if summaries.relative_accuracy != relative_accuracy:
+            return None
+        return AggregateCube.from_dict(stats['cube']).precompute(), summaries
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring saved dashboard statistics: {str(e)}")
+        return None
+
+def load_stats(store_dir, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """
+    Return (cube, summaries) for the store: the saved ones if they are
+    current, otherwise computed with a full scan and saved for next time
+    """
+    meta = read_meta(store_dir)
+    stats = read_stats(store_dir, meta, relative_accuracy)
+    if stats is None:
+        logger.info(f"Computing dashboard statistics for {store_dir}")
+        start = time.perf_counter()
+        stats = build_stats(load_columns(store_dir, meta=meta), relative_accuracy)
+        save_stats(store_dir, meta, *stats)
+        logger.info("Dashboard statistics computed", extra={
+            'store': store_dir, 'duration_ms': round((time.perf_counter() - start) * 1000, 1),
+        })
+    return stats
+
+def _remove_stats(store_dir, keep):
+    """Delete the statistics files of the store other than the paths in keep"""
+    prefix = STORE_STATS_FILE.split('{', 1)[0]
+    for name in os.listdir(store_dir):
+        path = os.path.join(store_dir, name)
+        if name.startswith(prefix) and name.endswith('.json') and path not in keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def _truncate_columns(store_dir, meta):
+    """Drop bytes past meta['rows'] left in column files by an interrupted append"""
+    for column, info in meta['columns'].items():
+        path = _column_file(store_dir, column)
+        size = meta['rows'] * np.dtype(info['dtype']).itemsize
+        if os.path.getsize(path) > size:
+            os.truncate(path, size)
+
+def ingest(store_dir, records, chunksize=500000, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """
+    Append new records (a CSV path or a DataFrame) to a store.
+
+    The saved dashboard statistics are updated with just the new rows when
+    they are current, and the dataset version is bumped once at the end, so
+    readers switch to the new data and statistics in one step: the write of
+    the header.
+    """
+    meta = read_meta(store_dir)
+    _truncate_columns(store_dir, meta)
+    stats = read_stats(store_dir, meta, relative_accuracy)
+    # Readers may still be loading the statistics of the current version
+    previous_stats = _stats_file(store_dir, meta)
+
+    if isinstance(records, pd.DataFrame):
+        chunks = [records.iloc[start:start + chunksize] for start in range(0, len(records), chunksize)]
+    else:
+        chunks = pd.read_csv(records, chunksize=chunksize)
+
+    added = 0
+    for chunk in chunks:
+        arrays = append_chunk(store_dir, meta, chunk)
+        if stats is not None:
+            df = _frame(meta, arrays)
+            stats[0].add(df[list(SOURCE_COLUMNS)])
+            stats[1].add(df[list(SUMMARY_COLUMNS) + ['stroke']])
+        added += len(chunk)
+
+    if added == 0:
+        return meta, 0
+
+    # The new statistics are saved under the new version first and published
+    # together with the rows by the header
+    meta['version'] += 1
+    if stats is not None:
+        save_stats(store_dir, meta, *stats)
+    write_meta(store_dir, meta)
+    _remove_stats(store_dir, {previous_stats, _stats_file(store_dir, meta)})
+    return meta, added
+
+def resolve_store(path):
+    """
+    Return a store directory for path: the path itself if it is a store, or a
+    `<csv>.store/` directory converted from a CSV (again whenever the CSV is newer)
+    """
+    if is_store(path):
+        return path
+
+    store_dir = path + '.store'
+    meta_path = os.path.join(store_dir, STORE_META_FILE)
+    if not os.path.exists(meta_path) or os.path.getmtime(meta_path) < os.path.getmtime(path):
+        logger.info(f"Converting {path} to a columnar store at {store_dir}")
+        start = time.perf_counter()
+        convert_csv(path, store_dir)
+        logger.info("Dataset converted", extra={
+            'store': store_dir, 'duration_ms': round((time.perf_counter() - start) * 1000, 1),
+        })
+    return store_dir
+
+def main(argv=None):
+    """
+    Command-line entry point for dataset store utilities
+    """
+    parser = argparse.ArgumentParser(description="Dashboard dataset store utilities")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help="Convert a CSV into a columnar store")
+    convert_parser.add_argument('csv_path')
+    convert_parser.add_argument('store_dir')
+    convert_parser.add_argument('--chunksize', type=int, default=500000)
+
+    ingest_parser = subparsers.add_parser('ingest', help="Append new records to a store")
+    ingest_parser.add_argument('store', help="Store directory, or the CSV it was converted from")
+    ingest_parser.add_argument('records_csv')
+    ingest_parser.add_argument('--chunksize', type=int, default=500000)
+    ingest_parser.add_argument('--accuracy', type=float, default=DEFAULT_RELATIVE_ACCURACY,
+                               help="Relative quantile accuracy of the saved statistics")
+
+    args = parser.parse_args(argv)
+    # Progress goes to stderr as JSON lines, results are printed below
+    jsonlog.configure_logging(sys.stderr)
+
+    if args.command == 'convert':
+        start = time.perf_counter()
+        meta = convert_csv(args.csv_path, args.store_dir, args.chunksize)
+        print(f"Converted {meta['rows']} rows in {time.perf_counter() - start:.1f} s")
+
+    elif args.command == 'ingest':
+        start = time.perf_counter()
+        meta, added = ingest(resolve_store(args.store), args.records_csv, args.chunksize, args.accuracy)
+        print(f"Appended {added} rows in {time.perf_counter() - start:.1f} s "
+              f"(dataset version {meta['version']}, {meta['rows']} rows)")
+
+if __name__ == '__main__':
+    main()
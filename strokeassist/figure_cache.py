@@ -0,0 +1,105 @@
+"""
+Render cache for dashboard figures.
+
+Matplotlib figures are drawn and encoded once, and the PNG bytes are kept
+under a key that names everything the figure depends on (page, chart, dataset
+version, model version), so a rerun with unchanged data just resends the
+bytes. Every figure is closed as soon as it is encoded, so pyplot doesn't
+accumulate open figures across reruns.
+"""
+import io
+import threading
+from collections import OrderedDict
+
+import matplotlib.pyplot as plt
+
+# Same options st.pyplot renders with, so cached charts look identical
+SAVEFIG_OPTIONS = {'format': 'png', 'bbox_inches': 'tight', 'dpi': 200}
+
+# Widest image st.image sends as is; wider ones are resized and re-encoded on
+# every call, which would cost more than drawing a small chart
+MAX_IMAGE_WIDTH = 1460
+
+def figure_to_png(fig, max_width=MAX_IMAGE_WIDTH):
+    """
+    Encode a figure as PNG bytes and close it. The resolution is lowered if
+    needed so the image is at most `max_width` pixels wide.
+    """
+    options = dict(SAVEFIG_OPTIONS)
+    buffer = io.BytesIO()
+    try:
+        if max_width:
+            bbox = fig.get_tightbbox(fig.canvas.get_renderer())
+            width = bbox.width + 2 * plt.rcParams['savefig.pad_inches']
+            options['dpi'] = min(options['dpi'], int((max_width - 1) / width))
+        fig.savefig(buffer, **options)
+    finally:
+        plt.close(fig)
+    return buffer.getvalue()
+
+class FigureCache:
+    """
+    Thread-safe LRU cache of encoded figures, bounded to `max_bytes` of PNG
+    data in total.
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the PNG bytes stored for key, or None"""
+        with self._lock:
+            png = self._entries.get(key)
+            if png is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return png
+
+    def put(self, key, png):
+        """Store PNG bytes, evicting the least recently used figures if full"""
+        if len(png) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = png
+            self._size += len(png)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def render(self, key, draw):
+        """
+        Return the PNG for key, calling draw() to build the figure (which is
+        then encoded and closed) only if it isn't cached
+        """
+        png = self.get(key)
+        if png is None:
+            png = figure_to_png(draw())
+            self.put(key, png)
+        return png
+
+    def stats(self):
+        """Hit, miss and eviction counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,176 @@
+"""
+Validation of /predict input, compiled from a model's encoding plan.
+
+A schema lists every field the model reads: numeric fields with the range
+they must fall in, and categorical fields with the values they can take.
+A value whose one-hot column the model dropped (a reference level) is
+accepted and encoded as all zeros, as before; only values the field
+doesn't have at all are rejected. It is built once per model (when the model is loaded) into
+flat lookup tables, so checking a request is a dict lookup or a comparison
+per field. A request with any missing, mistyped or out-of-range field is
+rejected with the reason for each field, before the model sees it.
+
+Request bodies can be form data (as sent by the page), JSON, or MessagePack
+(with the optional `msgpack` package installed). JSON and MessagePack
+carry numbers and strings as such; in form data every value is text, and
+numbers are parsed from it.
+"""
+import json
+import math
+
+from model import get_encoding_plan, CATEGORICAL_MAPPINGS
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Accepted range of each numeric field, inclusive
+NUMERIC_RANGES = {
+    'age': (0.0, 120.0),
+    'avg_glucose_level': (20.0, 600.0),
+    'bmi': (5.0, 100.0),
+}
+
+JSON_CONTENT_TYPES = ('application/json',)
+MSGPACK_CONTENT_TYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+FORM_CONTENT_TYPES = ('application/x-www-form-urlencoded', 'multipart/form-data')
+
+_MISSING = object()
+
+class InputError(ValueError):
+    """Invalid request input; `errors` maps each bad field to what is wrong with it"""
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("Invalid input: " + "; ".join(f"{field} {problem}" for field, problem in errors.items()))
+
+class InputSchema:
+    """
+    Compiled checks for the fields of an encoding plan. `validate` returns
+    the patient with numbers as floats and categories as the text the plan
+    encodes, ready for predict_stroke_risk.
+    """
+    def __init__(self, plan):
+        # (field, low, high) for the numeric fields the model uses
+        self.numeric = []
+        for feature, _ in plan.numeric:
+            low, high = NUMERIC_RANGES.get(feature, (-math.inf, math.inf))
+            self.numeric.append((feature, low, high))
+
+        # field -> {accepted value: value as the plan encodes it}, for every
+        # value of the field and not only those with a one-hot column, since
+        # models often drop a reference level. Categories that are numbers in
+        # the data ('0', '1') are accepted as numbers too.
+        self.categorical = {}
+        for feature in plan.categorical:
+            accepted = {}
+            for encoded_feature in CATEGORICAL_MAPPINGS[feature]:
+                value = encoded_feature[len(feature) + 1:]
+                accepted[value] = value
+                if value.isdigit():
+                    accepted[int(value)] = value
+            self.categorical[feature] = accepted
+
+    def validate(self, data, numbers_as_text=False):
+        """
+        Check a decoded request body, raising InputError listing every bad
+        field. With numbers_as_text (form data) numeric fields are parsed
+        from strings. Fields the model doesn't use are ignored.
+        """
+        if not isinstance(data, dict):
+            raise InputError({'body': "must be an object of patient fields"})
+        errors = {}
+        patient = {}
+
+        for feature, low, high in self.numeric:
+            value = data.get(feature, _MISSING)
+            if value is _MISSING or value is None or value == '':
+                errors[feature] = "is required"
+                continue
+            kind = type(value)
+            if kind is float or kind is int:
+                number = float(value)
+            elif numbers_as_text and kind is str:
+                try:
+                    number = float(value)
+                except ValueError:
+                    errors[feature] = "must be a number"
+                    continue
+            else:
+                errors[feature] = "must be a number"
+                continue
+            # NaN fails both comparisons
+            if not low <= number <= high:
+                errors[feature] = f"must be between {low:g} and {high:g}"
+                continue
+            patient[feature] = number
+
+        for feature, accepted in self.categorical.items():
+            value = data.get(feature, _MISSING)
+            if value is _MISSING or value is None or value == '':
+                errors[feature] = "is required"
+                continue
+            # bool is an int subclass but True shouldn't stand for category 1
+            kind = type(value)
+            category = accepted.get(value) if kind is str or kind is int else None
+            if category is None:
+                errors[feature] = "must be one of " + ", ".join(sorted({str(v) for v in accepted.values()}))
+                continue
+            patient[feature] = category
+
+        if errors:
+            raise InputError(errors)
+        return patient
+
+    def to_dict(self):
+        """Describe the accepted input as JSON-serializable data"""
+        fields = {}
+        for feature, low, high in self.numeric:
+            fields[feature] = {'type': 'number', 'minimum': low, 'maximum': high}
+        for feature, accepted in self.categorical.items():
+            fields[feature] = {'type': 'category', 'values': sorted(set(accepted.values()))}
+        return {'fields': fields, 'required': sorted(fields)}
+
+# Schemas already compiled, keyed by id() of the feature_names list
+_schemas = {}
+
+def get_schema(feature_names):
+    """
+    Return the input schema for feature_names, compiling it on first use.
+    Like get_encoding_plan, it is cached per feature_names list.
+    """
+    cached = _schemas.get(id(feature_names))
+    if cached is not None and cached[0] is feature_names:
+        return cached[1]
+    if len(_schemas) >= 32:
+        _schemas.clear()
+    schema = InputSchema(get_encoding_plan(feature_names))
+    _schemas[id(feature_names)] = (feature_names, schema)
+    return schema
+
+def body_format(content_type):
+    """'json', 'msgpack' or 'form' for a request Content-Type, or None if it's none of these"""
+    media_type = (content_type or '').split(';', 1)[0].strip().lower()
+    if media_type in JSON_CONTENT_TYPES or media_type.endswith('+json'):
+        return 'json'
+    if media_type in MSGPACK_CONTENT_TYPES:
+        return 'msgpack'
+    if media_type in FORM_CONTENT_TYPES:
+        return 'form'
+    return None
+
+def decode_body(body, body_format):
+    """Decode a JSON or MessagePack request body"""
+    if body_format == 'json':
+        try:
+            return json.loads(body)
+        except ValueError as e:
+            raise InputError({'body': f"is not valid JSON ({str(e)})"})
+    if body_format == 'msgpack':
+        if msgpack is None:
+            raise ValueError("MessagePack requests need the msgpack package (pip install msgpack)")
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except Exception as e:
+            raise InputError({'body': f"is not valid MessagePack ({str(e)})"})
+    raise ValueError(f"Unknown body format {body_format!r}")
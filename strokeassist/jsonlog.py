@@ -0,0 +1,179 @@
+"""
+Structured logging for the app: JSON lines written by a background thread.
+
+Request threads only put log records on a bounded in-memory queue; a
+writer thread formats them and writes them out in batches, so a slow stdout
+(or log collector) never blocks a request. When the queue is full new records are
+dropped and counted instead of waiting. Per-request records are sampled per
+route with LOG_SAMPLE_RATES, and warnings and errors are always kept.
+
+Modules log with the standard library as usual:
+
+    logger = logging.getLogger(__name__)
+    logger.info("Model loaded", extra={'model_version': version})
+
+and whatever is passed in `extra` becomes fields of the JSON line.
+"""
+import atexit
+import collections
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+# Level of the root logger, e.g. DEBUG, INFO or WARNING
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
+# Write JSON lines to this file instead of stdout
+LOG_FILE = os.environ.get('LOG_FILE')
+
+# Records waiting for the writer thread before new ones are dropped
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+
+# How often the writer thread writes out queued records, in milliseconds
+LOG_FLUSH_MS = float(os.environ.get('LOG_FLUSH_MS', '100'))
+
+# Share of requests logged per route, e.g. "/predict=0.01,/chatbot=0.1";
+# routes not listed use LOG_SAMPLE_RATE
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '1'))
+
+def parse_sample_rates(spec):
+    """Parse "route=rate,route=rate" into a dict"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        route, _, rate = item.rpartition('=')
+        if not route:
+            raise ValueError(f"Expected route=rate in LOG_SAMPLE_RATES, got {item!r}")
+        rates[route.strip()] = float(rate)
+    return rates
+
+LOG_SAMPLE_RATES = parse_sample_rates(os.environ.get('LOG_SAMPLE_RATES'))
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+def sample(route):
+    """Whether to log this request to route, going by the route's sample rate"""
+    rate = LOG_SAMPLE_RATES.get(route, LOG_SAMPLE_RATE)
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as one JSON object per line"""
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, default=str)
+
+class QueuedHandler(logging.Handler):
+    """
+    Handler that only appends records to a bounded in-memory queue, for the
+    BackgroundWriter to format and write. Records are dropped (and counted)
+    rather than waited for when the queue is full.
+    """
+    def __init__(self, queue_size=LOG_QUEUE_SIZE):
+        super().__init__()
+        self.queue_size = queue_size
+        self.records = collections.deque()
+        self.dropped = 0
+
+    def emit(self, record):
+        # Called under the handler's lock
+        if len(self.records) >= self.queue_size:
+            self.dropped += 1
+            return
+        # Fix the message and traceback now, since the arguments and frames
+        # may change before the writer gets to them; the JSON is built there
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+class BackgroundWriter(threading.Thread):
+    """
+    Thread writing out a QueuedHandler's records every `interval` seconds.
+    Waking up on a timer rather than for every record keeps the writer from
+    taking the GIL away from request threads once per log line.
+    """
+    def __init__(self, handler, output, interval):
+        super().__init__(name='log-writer', daemon=True)
+        self.handler = handler
+        self.output = output
+        self.interval = interval
+        self._stopping = threading.Event()
+
+    def run(self):
+        while not self._stopping.wait(self.interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        records = self.handler.records
+        while records:
+            record = records.popleft()
+            if record.levelno >= self.output.level:
+                self.output.handle(record)
+        self.output.flush()
+
+    def stop(self):
+        self._stopping.set()
+        self.join()
+
+_handler = None
+_writer = None
+
+def configure_logging(stream=None, level=LOG_LEVEL, queue_size=LOG_QUEUE_SIZE, flush_ms=LOG_FLUSH_MS):
+    """
+    Route every log record through a background JSON writer. Calling it
+    again replaces the previous writer (after flushing it).
+    """
+    global _handler, _writer
+    stop_logging()
+
+    if stream is not None:
+        output = logging.StreamHandler(stream)
+    elif LOG_FILE:
+        output = logging.FileHandler(LOG_FILE)
+    else:
+        output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    _handler = QueuedHandler(queue_size)
+    _writer = BackgroundWriter(_handler, output, flush_ms / 1000)
+    _writer.start()
+
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(level)
+    return _handler
+
+def stop_logging():
+    """Write out queued records and stop the writer thread"""
+    global _handler, _writer
+    if _writer is not None:
+        logging.getLogger().removeHandler(_handler)
+        _writer.stop()
+    _handler, _writer = None, None
+
+def dropped_records():
+    """Records dropped because the writer fell behind"""
+    return _handler.dropped if _handler is not None else 0
+
+atexit.register(stop_logging)
@@ -0,0 +1,125 @@
+"""
+Request counters and latency histograms in the Prometheus text format.
+
+Kept deliberately small: each metric has at most one label, updates are a
+dict lookup plus a bisect under a lock, and the text exposition is only
+built when /metrics is scraped.
+"""
+import bisect
+import threading
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5
+)
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _labels(label_name, label, extra=None):
+    pairs = []
+    if label_name is not None:
+        pairs.append(f'{label_name}="{label}"')
+    if extra is not None:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Counter:
+    """Monotonic count, optionally split by one label"""
+    def __init__(self, name, help_text, label_name=None):
+        self.name = name
+        self.help_text = help_text
+        self.label_name = label_name
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label=None, amount=1):
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    def value(self, label=None):
+        return self._values.get(label, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label, value in sorted(self._values.items(), key=lambda item: str(item[0])):
+                lines.append(f"{self.name}{_labels(self.label_name, label)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Distribution of observed values in fixed buckets, optionally split by one label"""
+    def __init__(self, name, help_text, label_name=None, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_name = label_name
+        self.buckets = tuple(buckets)
+        # label -> [per-bucket counts (last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, label=None):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, label=None):
+        series = self._series.get(label)
+        return sum(series[0]) if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(label, list(counts), total) for label, (counts, total) in self._series.items()]
+        for label, counts, total in sorted(snapshot, key=lambda item: str(item[0])):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                bucket_labels = _labels(self.label_name, label, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_name, label)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_name, label)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Collection of metrics rendered together. `collectors` are functions
+    returning extra exposition lines, for values that are already counted
+    elsewhere (such as the prediction cache's hit counters).
+    """
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help_text, label_name=None):
+        metric = Counter(name, help_text, label_name)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, label_name=None, buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, label_name, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+def gauge_lines(name, help_text, value, metric_type='gauge'):
+    """Exposition lines for a single unlabelled value"""
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}", f"{name} {_format_value(value)}"]
@@ -1,51 +1,78 @@
+import argparse
+import hashlib
+import heapq
+import json
+import logging
 import pickle
+import sys
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 import os
-from sklearn.preprocessing import StandardScaler
+import jsonlog
+
+logger = logging.getLogger(__name__)
 
 def load_model(model_path):
     """
-    Load the trained model and feature names from pickle file
+    Load the trained model and feature names from a pickle file, or from a
+    compact model artifact written by export_model
     """
+    start = time.perf_counter()
     try:
         # Check if the file exists
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Model file not found: {model_path}")
         
-        print(f"Loading model from: {model_path}")
+        logger.info(f"Loading model from: {model_path}")
         
-        with open(model_path, 'rb') as file:
-            model_data = pickle.load(file)
+        if is_compact_artifact(model_path):
+            model, feature_names = load_compact_model(model_path)
+        else:
+            model, feature_names = _load_pickled_model(model_path)
         
-        # Print what we got from pickle for debugging
-        print(f"Type of loaded object: {type(model_data)}")
+        logger.info(f"Model loaded successfully. Type: {type(model)}")
+        logger.debug(f"Feature names: {feature_names[:5]}... (total: {len(feature_names)})")
         
-        # Handle different possible pickle structures
-        if isinstance(model_data, dict):
-            print(f"Keys in model_data: {list(model_data.keys())}")
-            
-            # Try to get model and feature_names from the dictionary
-            model = model_data.get('model')
-            feature_names = model_data.get('feature_names')
-            
-            # If model not found in expected key, check alternatives
-            if model is None:
-                # Maybe the model is the entire object
-                if 'model' not in model_data and hasattr(model_data, 'predict'):
-                    print("Using the entire pickle object as the model")
-                    model = model_data
-                    # Try to get feature names from model attributes
-                    if hasattr(model, 'feature_names_in_'):
-                        feature_names = model.feature_names_in_.tolist()
-                    else:
-                        # You may need to provide feature names manually
-                        raise ValueError("Feature names not found in model")
-        else:
-            # Maybe the pickle is just the model without a dictionary wrapper
-            print("Pickle is not a dictionary. Checking if it's a model directly...")
-            if hasattr(model_data, 'predict'):
-                print("Using the entire pickle object as the model")
+        # Build the feature encoding plan and importance ranking now rather
+        # than on the first request
+        get_encoding_plan(feature_names)
+        get_top_features(model, feature_names)
+        logger.info("Model ready", extra={
+            'model_version': model_version(model),
+            'load_ms': round((time.perf_counter() - start) * 1000, 1),
+        })
+        
+        return model, feature_names
+    except Exception as e:
+        logger.exception(f"Failed to load model from {model_path}")
+        raise Exception(f"Failed to load model: {str(e)}")
+
+def _load_pickled_model(model_path):
+    """
+    Unpickle a model and find its feature names
+    """
+    with open(model_path, 'rb') as file:
+        model_data = pickle.load(file)
+    
+    # Log what we got from pickle for debugging
+    logger.debug(f"Type of loaded object: {type(model_data)}")
+    
+    # Handle different possible pickle structures
+    if isinstance(model_data, dict):
+        logger.debug(f"Keys in model_data: {list(model_data.keys())}")
+        
+        # Try to get model and feature_names from the dictionary
+        model = model_data.get('model')
+        feature_names = model_data.get('feature_names')
+        
+        # If model not found in expected key, check alternatives
+        if model is None:
+            # Maybe the model is the entire object
+            if 'model' not in model_data and hasattr(model_data, 'predict'):
+                logger.info("Using the entire pickle object as the model")
                 model = model_data
                 # Try to get feature names from model attributes
                 if hasattr(model, 'feature_names_in_'):
@@ -53,109 +80,380 @@ def load_model(model_path):
                 else:
                     # You may need to provide feature names manually
                     raise ValueError("Feature names not found in model")
+    else:
+        # Maybe the pickle is just the model without a dictionary wrapper
+        logger.debug("Pickle is not a dictionary. Checking if it's a model directly...")
+        if hasattr(model_data, 'predict'):
+            logger.info("Using the entire pickle object as the model")
+            model = model_data
+            # Try to get feature names from model attributes
+            if hasattr(model, 'feature_names_in_'):
+                feature_names = model.feature_names_in_.tolist()
             else:
-                raise ValueError("Unable to find a valid model in the pickle file")
-        
-        # Final check
-        if model is None:
-            raise ValueError("Model not found in pickle file")
-        if feature_names is None or not feature_names:
-            raise ValueError("Feature names not found in model data")
-            
-        print(f"Model loaded successfully. Type: {type(model)}")
-        print(f"Feature names: {feature_names[:5]}... (total: {len(feature_names)})")
+                # You may need to provide feature names manually
+                raise ValueError("Feature names not found in model")
+        else:
+            raise ValueError("Unable to find a valid model in the pickle file")
+    
+    # Final check
+    if model is None:
+        raise ValueError("Model not found in pickle file")
+    if feature_names is None or not feature_names:
+        raise ValueError("Feature names not found in model data")
         
-        return model, feature_names
-    except Exception as e:
-        import traceback
-        print(traceback.format_exc())  # Print the full traceback
-        raise Exception(f"Failed to load model: {str(e)}")
+    return model, feature_names
 
-def preprocess_input(data, feature_names):
+class LinearModel:
     """
-    Preprocess user input to match the format expected by the model
+    Minimal binary linear classifier loaded from a compact model artifact.
+    
+    The weights array holds the coefficients followed by the intercept and is
+    usually a read-only memory map of the artifact's weights file.
     """
-    # Check if feature_names is None or empty
-    if feature_names is None or len(feature_names) == 0:
-        raise ValueError("Feature names cannot be None or empty")
-        
-    # Create a DataFrame with the expected feature names
-    input_dict = {feature: [0] for feature in feature_names}
-    input_df = pd.DataFrame(input_dict)
+    def __init__(self, weights, classes=(0, 1)):
+        self.weights = weights
+        self.coef_ = weights[np.newaxis, :-1]
+        self.intercept_ = weights[-1:]
+        self.classes_ = np.asarray(classes)
     
-    # Handle numeric features
-    numeric_features = {
-        'age': float,
-        'avg_glucose_level': float,
-        'bmi': float
-    }
+    def decision_function(self, X):
+        return np.asarray(X, dtype=float) @ self.coef_[0] + self.intercept_[0]
+    
+    def predict_proba(self, X):
+        probability = 1.0 / (1.0 + np.exp(-self.decision_function(X)))
+        return np.column_stack([1.0 - probability, probability])
     
-    for feature, dtype in numeric_features.items():
-        if feature in data and feature in feature_names:
-            try:
-                input_df.loc[0, feature] = dtype(data[feature])
-            except (ValueError, TypeError):
-                # Handle conversion errors
-                print(f"Warning: Could not convert {feature} value to {dtype}")
-    
-    # Handle categorical features with one-hot encoding
-    categorical_mappings = {
-        'gender': ['gender_Female', 'gender_Male', 'gender_Other'],
-        'hypertension': ['hypertension_0', 'hypertension_1'],
-        'heart_disease': ['heart_disease_0', 'heart_disease_1'],
-        'ever_married': ['ever_married_No', 'ever_married_Yes'],
-        'work_type': ['work_type_Govt_job', 'work_type_Never_worked', 'work_type_Private', 
-                     'work_type_Self-employed', 'work_type_children'],
-        'Residence_type': ['Residence_type_Rural', 'Residence_type_Urban'],
-        'smoking_status': ['smoking_status_Unknown', 'smoking_status_formerly_smoked', 
-                          'smoking_status_never_smoked', 'smoking_status_smokes']
+    def predict(self, X):
+        return self.classes_[(self.decision_function(X) > 0).astype(int)]
+
+# Layout version of the compact artifact written by export_model
+COMPACT_FORMAT_VERSION = 1
+COMPACT_HEADER_FILE = 'model.json'
+COMPACT_WEIGHTS_FILE = 'weights.npy'
+
+def is_compact_artifact(model_path):
+    """
+    Check whether model_path points at a compact artifact (its directory or header)
+    """
+    if os.path.isdir(model_path):
+        return os.path.exists(os.path.join(model_path, COMPACT_HEADER_FILE))
+    return model_path.endswith('.json')
+
+def export_model(model, feature_names, out_dir):
+    """
+    Write a linear model as a compact artifact that loads without pickle:
+    
+    - weights.npy: float64 coefficients followed by the intercept, memory-mappable
+    - model.json:  header with the feature names, classes and encoding plan
+    """
+    if not is_linear_model(model):
+        raise ValueError("Only binary linear models with coef_ and intercept_ can be exported")
+    if len(model.coef_[0]) != len(feature_names):
+        raise ValueError("Model coefficients don't match the feature names")
+    
+    os.makedirs(out_dir, exist_ok=True)
+    weights = np.append(np.asarray(model.coef_[0], dtype=np.float64), float(model.intercept_[0]))
+    np.save(os.path.join(out_dir, COMPACT_WEIGHTS_FILE), weights)
+    
+    header = {
+        'format_version': COMPACT_FORMAT_VERSION,
+        'model_type': type(model).__name__,
+        'feature_names': list(feature_names),
+        'classes': np.asarray(getattr(model, 'classes_', [0, 1])).tolist(),
+        'risk_threshold': RISK_THRESHOLD,
+        'encoding_plan': get_encoding_plan(feature_names).to_dict(),
+        'weights_file': COMPACT_WEIGHTS_FILE,
     }
+    with open(os.path.join(out_dir, COMPACT_HEADER_FILE), 'w') as file:
+        json.dump(header, file, indent=2)
+    
+    return out_dir
+
+def load_compact_model(model_path, mmap=True):
+    """
+    Load a compact artifact written by export_model, returning (model, feature_names).
     
-    for feature, encoded_features in categorical_mappings.items():
-        if feature in data and data[feature] is not None:
-            value = data[feature]
-            for encoded_feature in encoded_features:
-                if encoded_feature == f"{feature}_{value}" and encoded_feature in feature_names:
-                    input_df.loc[0, encoded_feature] = 1
+    With mmap=True the weights are mapped read-only instead of read into memory.
+    """
+    header_path = model_path
+    if os.path.isdir(model_path):
+        header_path = os.path.join(model_path, COMPACT_HEADER_FILE)
     
-    # Ensure we're only using columns that exist in feature_names
-    valid_columns = [col for col in input_df.columns if col in feature_names]
-    input_df = input_df[valid_columns]
+    with open(header_path) as file:
+        header = json.load(file)
+    if header.get('format_version') != COMPACT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported model artifact version: {header.get('format_version')}")
     
-    # If some feature_names are still missing, add them
-    missing_columns = [col for col in feature_names if col not in input_df.columns]
-    for col in missing_columns:
-        input_df[col] = 0
+    feature_names = header['feature_names']
+    weights_path = os.path.join(os.path.dirname(header_path), header['weights_file'])
+    weights = np.load(weights_path, mmap_mode='r' if mmap else None, allow_pickle=False)
+    if weights.shape != (len(feature_names) + 1,):
+        raise ValueError("Model weights don't match the feature names in the header")
     
-    # Reorder columns to match the model's expectations
-    input_df = input_df[feature_names]
+    # Reuse the stored encoding plan instead of rebuilding it
+    _remember_encoding_plan(feature_names, EncodingPlan.from_dict(feature_names, header['encoding_plan']))
     
-    return input_df
+    return LinearModel(weights, header.get('classes', (0, 1))), feature_names
+
+# Raw numeric form fields and the type they are converted to
+NUMERIC_FEATURES = {
+    'age': float,
+    'avg_glucose_level': float,
+    'bmi': float
+}
+
+# Raw categorical form fields and the one-hot columns they expand to
+CATEGORICAL_MAPPINGS = {
+    'gender': ['gender_Female', 'gender_Male', 'gender_Other'],
+    'hypertension': ['hypertension_0', 'hypertension_1'],
+    'heart_disease': ['heart_disease_0', 'heart_disease_1'],
+    'ever_married': ['ever_married_No', 'ever_married_Yes'],
+    'work_type': ['work_type_Govt_job', 'work_type_Never_worked', 'work_type_Private', 
+                 'work_type_Self-employed', 'work_type_children'],
+    'Residence_type': ['Residence_type_Rural', 'Residence_type_Urban'],
+    'smoking_status': ['smoking_status_Unknown', 'smoking_status_formerly_smoked', 
+                      'smoking_status_never_smoked', 'smoking_status_smokes']
+}
+
+# Probability above which a patient is reported as high risk
+RISK_THRESHOLD = 0.7
+
+# How probabilities are computed:
+#   'sklearn'       - the model's own predict_proba
+#   'linear-native' - dot product plus sigmoid over the coefficients of a
+#                     linear model, skipping sklearn's input validation
+SCORING_ENGINES = ('sklearn', 'linear-native')
+DEFAULT_SCORING_ENGINE = os.environ.get('SCORING_ENGINE', 'sklearn')
+
+# How the top features shown with a prediction are chosen:
+#   'global'       - largest model coefficients, the same for every patient
+#   'contribution' - largest coefficient x encoded value for this patient
+EXPLANATION_MODES = ('global', 'contribution')
+DEFAULT_EXPLANATION_MODE = os.environ.get('EXPLANATION_MODE', 'global')
 
-def predict_stroke_risk(model, feature_names, data):
+# Number of features reported with each prediction
+TOP_FEATURE_COUNT = 5
+
+class EncodingPlan:
     """
-    Make stroke risk prediction based on user input
+    Precomputed mapping from raw form fields straight to column indices in
+    feature_names, so a patient can be encoded into a NumPy row without
+    building a DataFrame
     """
-    # Check for None values
-    if model is None:
-        raise ValueError("Model cannot be None")
-    if feature_names is None:
-        raise ValueError("Feature names cannot be None")
-    if data is None:
-        raise ValueError("Input data cannot be None")
+    def __init__(self, feature_names):
+        self.feature_names = list(feature_names)
+        self.n_features = len(self.feature_names)
+        column_index = {feature: i for i, feature in enumerate(self.feature_names)}
+        
+        # (field, column index) for the numeric fields the model uses
+        self.numeric = [
+            (feature, column_index[feature])
+            for feature in NUMERIC_FEATURES if feature in column_index
+        ]
+        
+        # field -> {raw value as text: column index of its one-hot column}
+        self.categorical = {}
+        for feature, encoded_features in CATEGORICAL_MAPPINGS.items():
+            values = {
+                encoded_feature[len(feature) + 1:]: column_index[encoded_feature]
+                for encoded_feature in encoded_features if encoded_feature in column_index
+            }
+            if values:
+                self.categorical[feature] = values
     
-    # Preprocess the input data
-    input_data = preprocess_input(data, feature_names)
+    def to_dict(self):
+        """Describe the plan as JSON-serializable data"""
+        return {'numeric': [list(item) for item in self.numeric], 'categorical': self.categorical}
     
-    # Make prediction
-    try:
-        prediction = model.predict(input_data)[0]
-        probability = model.predict_proba(input_data)[0][1]  # Probability of positive class
-        prediction = 1 if probability >= 0.7 else 0
-    except Exception as e:
-        raise Exception(f"Error during prediction: {str(e)}")
+    @classmethod
+    def from_dict(cls, feature_names, plan):
+        """Rebuild a plan from to_dict() output without recomputing it"""
+        self = cls.__new__(cls)
+        self.feature_names = list(feature_names)
+        self.n_features = len(self.feature_names)
+        self.numeric = [(feature, int(index)) for feature, index in plan['numeric']]
+        self.categorical = {
+            feature: {value: int(index) for value, index in values.items()}
+            for feature, values in plan['categorical'].items()
+        }
+        return self
     
-    # Get feature importance
+    def encode(self, data, out=None):
+        """
+        Encode one patient into a row of length n_features.
+        
+        Pass a preallocated float array as `out` to reuse it between calls.
+        """
+        if out is None:
+            row = np.zeros(self.n_features)
+        else:
+            row = out
+            row.fill(0)
+        
+        # Handle numeric features, unconvertible values are left at 0
+        for feature, index in self.numeric:
+            if feature in data:
+                try:
+                    row[index] = float(data[feature])
+                except (ValueError, TypeError):
+                    logger.warning(f"Could not convert {feature} value to float")
+        
+        # Handle categorical features with one-hot encoding
+        for feature, values in self.categorical.items():
+            value = data.get(feature)
+            if value is not None:
+                index = values.get(str(value))
+                if index is not None:
+                    row[index] = 1
+        
+        return row
+    
+    def encode_batch(self, records):
+        """
+        Encode many patients at once into an (N, n_features) matrix.
+        
+        `records` is either a list of form-style dicts or a DataFrame with the
+        raw form columns. The matrix is built column by column for all rows
+        together.
+        """
+        if not isinstance(records, pd.DataFrame):
+            records = list(records)
+        
+        matrix = np.zeros((len(records), self.n_features))
+        
+        # Handle numeric features, unconvertible values are left at 0
+        for feature, index in self.numeric:
+            values = _batch_column(records, feature)
+            if values is None:
+                continue
+            numeric = pd.to_numeric(pd.Series(values), errors='coerce')
+            failed = int((numeric.isna() & pd.notna(values)).sum())
+            if failed:
+                logger.warning(f"Could not convert {failed} {feature} values to float")
+            matrix[:, index] = numeric.fillna(0).to_numpy(dtype=float)
+        
+        # Handle categorical features with one-hot encoding
+        for feature, categories in self.categorical.items():
+            values = _batch_column(records, feature)
+            if values is None:
+                continue
+            present = pd.notna(values)
+            values = values.astype(str)
+            for category, index in categories.items():
+                matrix[:, index] = present & (values == category)
+        
+        return matrix
+
+# Encoding plans already built, keyed by id() of the feature_names list
+_encoding_plans = {}
+
+def get_encoding_plan(feature_names):
+    """
+    Return the encoding plan for feature_names, building it on first use
+    """
+    # Check if feature_names is None or empty
+    if feature_names is None or len(feature_names) == 0:
+        raise ValueError("Feature names cannot be None or empty")
+    
+    cached = _encoding_plans.get(id(feature_names))
+    if cached is not None and cached[0] is feature_names:
+        return cached[1]
+    
+    return _remember_encoding_plan(feature_names, EncodingPlan(feature_names))
+
+def _remember_encoding_plan(feature_names, plan):
+    """Cache a plan for the feature_names list"""
+    if len(_encoding_plans) >= 32:
+        _encoding_plans.clear()
+    # Keep a reference to feature_names so its id() cannot be reused
+    _encoding_plans[id(feature_names)] = (feature_names, plan)
+    return plan
+
+def encode_input(data, feature_names):
+    """
+    Encode user input into a (1, n_features) NumPy array in feature_names order
+    """
+    return get_encoding_plan(feature_names).encode(data)[np.newaxis, :]
+
+def preprocess_input(data, feature_names):
+    """
+    Preprocess user input to match the format expected by the model
+    """
+    return pd.DataFrame(encode_input(data, feature_names), columns=feature_names)
+
+def _batch_column(records, feature):
+    """
+    Return the raw values of one form field for every record as an object array,
+    or None if no record carries that field
+    """
+    if isinstance(records, pd.DataFrame):
+        if feature not in records.columns:
+            return None
+        return records[feature].to_numpy(dtype=object)
+    
+    if not any(feature in record for record in records):
+        return None
+    return np.array([record.get(feature) for record in records], dtype=object)
+
+def preprocess_batch(records, feature_names):
+    """
+    Preprocess many patients at once into a single model input frame.
+    
+    Every row is encoded exactly like `preprocess_input` would encode it on
+    its own.
+    """
+    matrix = get_encoding_plan(feature_names).encode_batch(records)
+    return pd.DataFrame(matrix, columns=feature_names)
+
+def _model_input(model, X, feature_names):
+    """
+    Wrap an encoded matrix in a DataFrame only if the model was fitted with
+    column names, otherwise sklearn can take the array as is
+    """
+    if hasattr(model, 'feature_names_in_'):
+        return pd.DataFrame(X, columns=feature_names)
+    return X
+
+def is_linear_model(model):
+    """
+    Check whether the model is a binary linear classifier that can be scored
+    directly from coef_ and intercept_
+    """
+    coef = getattr(model, 'coef_', None)
+    intercept = getattr(model, 'intercept_', None)
+    if coef is None or intercept is None:
+        return False
+    classes = getattr(model, 'classes_', None)
+    if classes is not None and len(classes) != 2:
+        return False
+    return np.ndim(coef) == 2 and np.shape(coef)[0] == 1 and np.size(intercept) == 1
+
+def score_probabilities(model, X, feature_names, engine=None):
+    """
+    Return the probability of the positive class for each row of the encoded
+    matrix X using the selected scoring engine.
+    
+    The 'linear-native' engine falls back to sklearn for models that are not
+    linear.
+    """
+    engine = engine or DEFAULT_SCORING_ENGINE
+    if engine not in SCORING_ENGINES:
+        raise ValueError(f"Unknown scoring engine: {engine} (expected one of {SCORING_ENGINES})")
+    
+    if engine == 'linear-native' and is_linear_model(model):
+        decision = X @ model.coef_[0] + model.intercept_[0]
+        return 1.0 / (1.0 + np.exp(-decision))
+    
+    return model.predict_proba(_model_input(model, X, feature_names))[:, 1]
+
+def _display_name(feature):
+    """Clean up a one-hot feature name for display"""
+    return feature.split('_')[0] if '_' in feature else feature
+
+def _rank_features(model, feature_names):
+    """
+    Rank the model coefficients by absolute value and keep the top features
+    """
     # For logistic regression, we can use coefficients as importance
     top_features = {}
     if hasattr(model, 'coef_'):
@@ -163,8 +461,8 @@ def predict_stroke_risk(model, feature_names, data):
             importance = model.coef_[0]
             # Check if importance array matches feature_names length
             if len(importance) != len(feature_names):
-                print(f"Warning: Importance array length ({len(importance)}) doesn't match feature names length ({len(feature_names)})")
-                return prediction, probability, {}
+                logger.warning(f"Importance array length ({len(importance)}) doesn't match feature names length ({len(feature_names)})")
+                return {}
                 
             feature_importance = dict(zip(feature_names, importance))
             
@@ -175,21 +473,269 @@ def predict_stroke_risk(model, feature_names, data):
                 reverse=True
             )}
             
-            # Take only top 5 features with non-zero importance
+            # Take only top features with non-zero importance
             count = 0
             for feature, importance in feature_importance.items():
                 if abs(importance) > 0:
-                    # Clean up feature name for display
-                    display_name = feature.split('_')[0] if '_' in feature else feature
-                    top_features[display_name] = importance
+                    top_features[_display_name(feature)] = importance
                     count += 1
-                    if count >= 5:
+                    if count >= TOP_FEATURE_COUNT:
                         break
         except Exception as e:
-            print(f"Warning: Error calculating feature importance: {str(e)}")
+            logger.warning(f"Error calculating feature importance: {str(e)}")
+    
+    return top_features
+
+# Importance rankings already computed, per model object
+_importance_cache = weakref.WeakKeyDictionary()
+
+def get_top_features(model, feature_names):
+    """
+    Get the five most important features of the model for display.
+    
+    The ranking only depends on the model, so it is computed once per model
+    and served from a cache afterwards.
+    """
+    try:
+        cached = _importance_cache.get(model)
+    except TypeError:
+        # Models that can't be weakly referenced are ranked every time
+        return _rank_features(model, feature_names)
+    
+    if cached is None or (cached[0] is not feature_names and cached[0] != list(feature_names)):
+        cached = (feature_names, _rank_features(model, feature_names))
+        _importance_cache[model] = cached
+    
+    # Hand out a copy so callers can't alter the cached ranking
+    return dict(cached[1])
+
+def get_feature_contributions(model, feature_names, X):
+    """
+    Get the top features for each encoded patient in X by their contribution
+    (coefficient x encoded value) to that patient's score.
+    
+    Returns one dict per row. Only the top few contributions are selected with
+    a heap-based partial selection instead of sorting every feature.
+    """
+    if not hasattr(model, 'coef_'):
+        return [{} for _ in range(len(X))]
+    
+    coef = model.coef_[0]
+    if len(coef) != len(feature_names):
+        logger.warning(f"Importance array length ({len(coef)}) doesn't match feature names length ({len(feature_names)})")
+        return [{} for _ in range(len(X))]
+    
+    results = []
+    for row in (X * coef).tolist():
+        # Partial selection of the largest non-zero contributions
+        top = heapq.nlargest(
+            TOP_FEATURE_COUNT,
+            (i for i, value in enumerate(row) if value != 0),
+            key=lambda i: abs(row[i])
+        )
+        results.append({_display_name(feature_names[i]): row[i] for i in top})
+    return results
+
+def explain_prediction(model, feature_names, X, mode=None):
+    """
+    Get the top features for the encoded patients in X.
+    
+    In 'global' mode this is the cached model ranking, shared by every row.
+    In 'contribution' mode it is a list with one dict per row.
+    """
+    mode = mode or DEFAULT_EXPLANATION_MODE
+    if mode not in EXPLANATION_MODES:
+        raise ValueError(f"Unknown explanation mode: {mode} (expected one of {EXPLANATION_MODES})")
+    
+    if mode == 'contribution':
+        return get_feature_contributions(model, feature_names, X)
+    return get_top_features(model, feature_names)
+
+# Model version fingerprints already computed, per model object
+_model_versions = weakref.WeakKeyDictionary()
+
+def model_version(model):
+    """
+    Short fingerprint identifying the model's parameters.
+    
+    Linear models are hashed from their coefficients and intercept, anything
+    else from its pickled bytes. Computed once per model object.
+    """
+    try:
+        cached = _model_versions.get(model)
+    except TypeError:
+        cached = None
+    if cached is not None:
+        return cached
+    
+    digest = hashlib.sha1()
+    if is_linear_model(model):
+        digest.update(np.ascontiguousarray(model.coef_, dtype=np.float64).tobytes())
+        digest.update(np.ascontiguousarray(model.intercept_, dtype=np.float64).tobytes())
+    else:
+        digest.update(pickle.dumps(model))
+    version = digest.hexdigest()[:12]
+    
+    try:
+        _model_versions[model] = version
+    except TypeError:
+        pass
+    return version
+
+def predict_stroke_risk(model, feature_names, data, engine=None, explain=None, timings=None):
+    """
+    Make stroke risk prediction based on user input
+    
+    Pass a dict as `timings` to have the seconds spent in each stage
+    ('preprocess', 'inference', 'importance') recorded in it.
+    """
+    # Check for None values
+    if model is None:
+        raise ValueError("Model cannot be None")
+    if feature_names is None:
+        raise ValueError("Feature names cannot be None")
+    if data is None:
+        raise ValueError("Input data cannot be None")
+    
+    # Preprocess the input data
+    start = time.perf_counter()
+    input_data = encode_input(data, feature_names)
+    preprocessed = time.perf_counter()
+    
+    # Make prediction, the label comes from the risk threshold rather than model.predict
+    try:
+        probability = score_probabilities(model, input_data, feature_names, engine)[0]
+        prediction = 1 if probability >= RISK_THRESHOLD else 0
+    except Exception as e:
+        raise Exception(f"Error during prediction: {str(e)}")
+    scored = time.perf_counter()
+    
+    # Get feature importance
+    top_features = explain_prediction(model, feature_names, input_data, explain)
+    if isinstance(top_features, list):
+        top_features = top_features[0]
+    
+    if timings is not None:
+        timings['preprocess'] = preprocessed - start
+        timings['inference'] = scored - preprocessed
+        timings['importance'] = time.perf_counter() - scored
     
     return prediction, probability, top_features
 
+def predict_stroke_risk_batch(model, feature_names, records, engine=None, explain=None):
+    """
+    Make stroke risk predictions for many patients with a single model call
+    
+    Returns arrays of predictions and probabilities in input order, plus the
+    top features: one dict shared by every row in 'global' explanation mode,
+    or a list with one dict per row in 'contribution' mode.
+    """
+    # Check for None values
+    if model is None:
+        raise ValueError("Model cannot be None")
+    if feature_names is None:
+        raise ValueError("Feature names cannot be None")
+    if records is None:
+        raise ValueError("Input data cannot be None")
+    
+    # Preprocess the whole batch into one matrix
+    input_data = get_encoding_plan(feature_names).encode_batch(records)
+    if len(input_data) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0), {}
+    
+    # Make predictions
+    try:
+        probabilities = score_probabilities(model, input_data, feature_names, engine)
+        predictions = (probabilities >= RISK_THRESHOLD).astype(int)
+    except Exception as e:
+        raise Exception(f"Error during prediction: {str(e)}")
+    
+    # Get feature importance
+    top_features = explain_prediction(model, feature_names, input_data, explain)
+    
+    return predictions, probabilities, top_features
+
+# Rows encoded and scored at a time by score_grid
+GRID_CHUNK_SIZE = 65536
+
+# Grid scores already computed, per model object
+_grid_cache = weakref.WeakKeyDictionary()
+
+def _field_columns(plan, field):
+    """Column indices of the encoded row a raw form field writes to"""
+    for feature, index in plan.numeric:
+        if feature == field:
+            return [index]
+    if field in plan.categorical:
+        return sorted(plan.categorical[field].values())
+    return []
+
+def _score_grid(model, feature_names, axes, base, engine):
+    plan = get_encoding_plan(feature_names)
+    base_row = plan.encode(base)
+    shape = tuple(len(values) for values in axes.values())
+    
+    # For each axis: the columns its field owns and their encoded values per grid point
+    axis_encodings = []
+    for field, values in axes.items():
+        columns = _field_columns(plan, field)
+        encoded = np.array([plan.encode({field: value})[columns] for value in values])
+        axis_encodings.append((columns, encoded.reshape(len(values), len(columns))))
+    
+    total = int(np.prod(shape))
+    probabilities = np.empty(total)
+    for start in range(0, total, GRID_CHUNK_SIZE):
+        stop = min(start + GRID_CHUNK_SIZE, total)
+        X = np.tile(base_row, (stop - start, 1))
+        positions = np.unravel_index(np.arange(start, stop), shape)
+        for (columns, encoded), position in zip(axis_encodings, positions):
+            if columns:
+                X[:, columns] = encoded[position]
+        probabilities[start:stop] = score_probabilities(model, X, feature_names, engine)
+    
+    return probabilities.reshape(shape)
+
+def score_grid(model, feature_names, axes, base=None, engine=None):
+    """
+    Score every combination of the values in `axes` through the model.
+    
+    `axes` maps raw form fields to the values to try, e.g.
+    {'age': range(20, 101), 'hypertension': [0, 1]}; every other field is
+    taken from the `base` patient. Returns an array of probabilities with one
+    dimension per axis, in the order given. The grid is encoded straight into
+    matrices and scored in chunks of GRID_CHUNK_SIZE rows, and the result is
+    computed once per model and kept (read-only) for later calls.
+    """
+    if model is None:
+        raise ValueError("Model cannot be None")
+    if feature_names is None:
+        raise ValueError("Feature names cannot be None")
+    
+    base = dict(base or {})
+    axes = {field: list(values) for field, values in axes.items()}
+    key = (
+        tuple(feature_names),
+        tuple((field, tuple(values)) for field, values in axes.items()),
+        tuple(sorted((field, str(value)) for field, value in base.items())),
+        engine or DEFAULT_SCORING_ENGINE,
+    )
+    
+    try:
+        cache = _grid_cache.setdefault(model, {})
+    except TypeError:
+        # Models that can't be weakly referenced are scored every time
+        cache = {}
+    
+    grid = cache.get(key)
+    if grid is None:
+        try:
+            grid = _score_grid(model, feature_names, axes, base, engine)
+        except Exception as e:
+            raise Exception(f"Error during prediction: {str(e)}")
+        grid.setflags(write=False)
+        cache[key] = grid
+    return grid
+
 # Example usage with hardcoded feature names as fallback
 def example():
     try:
@@ -197,8 +743,8 @@ def example():
         try:
             model, feature_names = load_model("stroke_model.pkl")
         except Exception as e:
-            print(f"Error loading model: {str(e)}")
-            print("Using fallback approach...")
+            logger.error(f"Error loading model: {str(e)}")
+            logger.info("Using fallback approach...")
             
             # If the model loading fails due to feature_names issue, 
             # try direct model loading with hardcoded feature names
@@ -237,7 +783,165 @@ def example():
             print(f"  {feature}: {importance:.4f}")
     
     except Exception as e:
-        print(f"Error: {str(e)}")
+        logger.exception(f"Error: {str(e)}")
 
 # If you want to run the example, uncomment the line below
-# example()
\ No newline at end of file
+# example()
+
+# Rows read, scored and written at a time by score_file
+SCORE_CHUNK_SIZE = 100000
+
+def _category_text(values):
+    """
+    Numeric category codes as the text the CSV path reads: integer columns
+    with nulls come out of Parquet as floats, and '1.0' matches no category
+    """
+    numbers = values.to_numpy(dtype=float, na_value=np.nan)
+    integral = np.isfinite(numbers) & (numbers == np.trunc(numbers))
+    text = np.where(integral, np.where(integral, numbers, 0).astype(np.int64).astype(str), numbers.astype(str))
+    return pd.Series(text, index=values.index, dtype=object).where(values.notna())
+
+def _read_chunks(path, chunksize):
+    """Yield DataFrames of raw form columns from a CSV or Parquet file"""
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Reading Parquet files requires pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            df = batch.to_pandas()
+            for column in CATEGORICAL_MAPPINGS:
+                if column in df.columns and pd.api.types.is_numeric_dtype(df[column].dtype):
+                    df[column] = _category_text(df[column])
+            yield df
+    else:
+        # Read as text, like CSV uploads to /predict/batch
+        yield from pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False)
+
+class _ChunkWriter:
+    """Append scored chunks to a CSV or Parquet file as they complete"""
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._parquet = None
+    
+    def write(self, df):
+        if self.path.endswith('.parquet'):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table)
+        else:
+            df.to_csv(self.path, mode='w' if self.rows == 0 else 'a', header=self.rows == 0, index=False)
+        self.rows += len(df)
+    
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+# Model of a scoring worker process, loaded once by _init_score_worker
+_worker_model = None
+
+def _init_score_worker(model_path):
+    global _worker_model
+    # A forked worker has the parent's log queue but not its writer thread
+    jsonlog.configure_logging(sys.stderr, level='WARNING')
+    _worker_model = load_model(model_path)
+
+def _score_chunk(chunk, id_column=None, engine=None, model=None):
+    """Score one chunk of raw form rows into a DataFrame of results"""
+    model, feature_names = model or _worker_model
+    predictions, probabilities, _ = predict_stroke_risk_batch(
+        model, feature_names, chunk, engine=engine, explain='global'
+    )
+    result = {}
+    if id_column in chunk.columns:
+        result[id_column] = chunk[id_column].to_numpy()
+    result['prediction'] = predictions
+    result['probability'] = probabilities
+    return pd.DataFrame(result)
+
+def score_file(model_path, input_path, output_path, chunksize=SCORE_CHUNK_SIZE,
+               workers=None, engine=None, id_column='id'):
+    """
+    Score every row of a CSV or Parquet file and write the predictions to
+    another one, chunk by chunk.
+    
+    Chunks are scored by `workers` processes (one per CPU core by default),
+    each loading the model once. At most two chunks per worker are in flight,
+    and results are written in input order as soon as they are ready, so
+    memory use doesn't depend on the file size. Returns the number of rows
+    scored.
+    """
+    workers = workers or os.cpu_count() or 1
+    writer = _ChunkWriter(output_path)
+    try:
+        if workers == 1:
+            model = load_model(model_path)
+            for chunk in _read_chunks(input_path, chunksize):
+                writer.write(_score_chunk(chunk, id_column, engine, model))
+            return writer.rows
+        
+        with ProcessPoolExecutor(workers, initializer=_init_score_worker, initargs=(model_path,)) as pool:
+            pending = []
+            for chunk in _read_chunks(input_path, chunksize):
+                pending.append(pool.submit(_score_chunk, chunk, id_column, engine))
+                # Bound the work held in memory, writing the oldest chunk first
+                if len(pending) >= 2 * workers:
+                    writer.write(pending.pop(0).result())
+            for future in pending:
+                writer.write(future.result())
+        return writer.rows
+    finally:
+        writer.close()
+
+def main(argv=None):
+    """
+    Command-line entry point for model utilities
+    """
+    parser = argparse.ArgumentParser(description="Stroke prediction model utilities")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    export_parser = subparsers.add_parser(
+        'export', help="Write a pickled linear model as a compact artifact"
+    )
+    export_parser.add_argument('model_path', help="Pickled model file to convert")
+    export_parser.add_argument('out_dir', help="Directory to write model.json and weights.npy to")
+    
+    score_parser = subparsers.add_parser(
+        'score', help="Score a CSV or Parquet file of patients in chunks"
+    )
+    score_parser.add_argument('model_path', help="Model file or compact artifact")
+    score_parser.add_argument('input_path', help="CSV or Parquet file with the raw form columns")
+    score_parser.add_argument('output_path', help="CSV or Parquet file to write predictions to")
+    score_parser.add_argument('--chunksize', type=int, default=SCORE_CHUNK_SIZE, help="Rows per chunk")
+    score_parser.add_argument('--workers', type=int, default=None, help="Scoring processes (default: one per core)")
+    score_parser.add_argument('--engine', choices=SCORING_ENGINES, default=None, help="Scoring engine")
+    score_parser.add_argument('--id-column', default='id', help="Input column copied to the output, if present")
+    
+    args = parser.parse_args(argv)
+    
+    # Results go to stdout, log lines to stderr
+    jsonlog.configure_logging(sys.stderr)
+    
+    if args.command == 'score':
+        start = time.perf_counter()
+        rows = score_file(args.model_path, args.input_path, args.output_path, args.chunksize,
+                          args.workers, args.engine, args.id_column)
+        elapsed = time.perf_counter() - start
+        print(f"Scored {rows} rows in {elapsed:.1f} s ({rows / max(elapsed, 1e-9):.0f} rows/s)")
+    
+    elif args.command == 'export':
+        model, feature_names = load_model(args.model_path)
+        export_model(model, feature_names, args.out_dir)
+        print(f"Compact model written to {args.out_dir}")
+        
+        # Report how the two formats compare at startup
+        start = time.perf_counter()
+        load_compact_model(args.out_dir)
+        print(f"Compact artifact loads in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+if __name__ == '__main__':
+    main()
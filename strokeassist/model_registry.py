@@ -0,0 +1,203 @@
+"""
+Hot swapping of the served model.
+
+The registry holds the model in use as one immutable ModelVersion. Requests
+take the current version once when they start and use it to the end, so a
+swap never changes the model under a request that is already running.
+
+With a watched directory, a background thread polls it for the newest model
+(a pickle file or a compact artifact directory). A new one is loaded, warmed
+up and checked with a smoke-test prediction on that thread while the old
+version keeps serving, and only then replaces it with a single reference
+assignment. A model that fails to load or fails the check is logged and
+skipped, and the old version stays in service.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+
+from model import load_model, is_compact_artifact, model_version, predict_stroke_risk
+from input_schema import get_schema
+
+logger = logging.getLogger(__name__)
+
+# Patient scored to check a newly loaded model before it is swapped in
+SMOKE_TEST_PATIENT = {
+    'age': '67', 'gender': 'Male', 'hypertension': '0', 'heart_disease': '1',
+    'ever_married': 'Yes', 'work_type': 'Private', 'Residence_type': 'Urban',
+    'avg_glucose_level': '228.69', 'bmi': '36.6', 'smoking_status': 'formerly_smoked'
+}
+
+# File extensions of pickled models in a watched directory
+MODEL_FILE_EXTENSIONS = ('.pkl', '.pickle')
+
+ModelVersion = namedtuple('ModelVersion', ['model', 'feature_names', 'version', 'path', 'loaded_at'])
+
+def smoke_test(model, feature_names, patient=SMOKE_TEST_PATIENT):
+    """
+    Score a known patient, raising if the model's input schema rejects it
+    or the result isn't a valid prediction
+    """
+    # Validated like a request, so every field reaches the model encoded
+    patient = get_schema(feature_names).validate(patient, numbers_as_text=True)
+    prediction, probability, _ = predict_stroke_risk(model, feature_names, patient)
+    if prediction not in (0, 1) or not (0.0 <= probability <= 1.0) or math.isnan(probability):
+        raise ValueError(f"Smoke test gave prediction {prediction!r} with probability {probability!r}")
+
+def load_version(path):
+    """Load, warm up and smoke-test the model at path"""
+    model, feature_names = load_model(path)
+    # The first prediction also builds the per-model caches (and compiles
+    # the input schema), so requests after the swap don't pay for that
+    smoke_test(model, feature_names)
+    return ModelVersion(model, feature_names, model_version(model), path, time.time())
+
+def _signature(path):
+    """(size, modification time) of a model file, or of everything in an artifact directory"""
+    if os.path.isdir(path):
+        stats = [os.stat(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names]
+        return sum(s.st_size for s in stats), max((s.st_mtime_ns for s in stats), default=0)
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def find_candidates(model_dir):
+    """Models in a directory as {path: signature}"""
+    candidates = {}
+    for name in os.listdir(model_dir):
+        path = os.path.join(model_dir, name)
+        if name.startswith('.'):
+            continue
+        if name.endswith(MODEL_FILE_EXTENSIONS) or (os.path.isdir(path) and is_compact_artifact(path)):
+            try:
+                candidates[path] = _signature(path)
+            except OSError:
+                # Removed or replaced while we looked
+                continue
+    return candidates
+
+class ModelRegistry:
+    """
+    The model in use, optionally replaced by newer models appearing in
+    `model_dir`. `current()` is None until a model has been loaded.
+    """
+    def __init__(self, model_path=None, model_dir=None, poll_interval=5.0):
+        self.model_path = model_path
+        self.model_dir = model_dir
+        self.poll_interval = poll_interval
+
+        self._active = None
+        # path -> signature of models already loaded (or skipped), rejected,
+        # and seen changing at the last check
+        self._seen = {}
+        self._rejected = {}
+        self._pending = {}
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self.swaps = 0
+        self.failures = 0
+
+    def current(self):
+        """The ModelVersion to serve the next request with"""
+        return self._active
+
+    def activate(self, loaded):
+        """Put a loaded version in service"""
+        previous = self._active
+        self._active = loaded
+        if previous is not None:
+            self.swaps += 1
+        logger.info("Model activated", extra={
+            'model_version': loaded.version, 'model_path': loaded.path,
+            'previous_version': previous.version if previous else None,
+        })
+
+    def load_initial(self):
+        """
+        Load the starting model: the newest one in model_dir if it has any,
+        otherwise model_path
+        """
+        path = self.model_path
+        if self.model_dir:
+            # Models already there when we start are not new
+            self._seen = find_candidates(self.model_dir)
+            if self._seen:
+                path = max(self._seen, key=lambda p: (self._seen[p][1], p))
+        if path is None:
+            raise FileNotFoundError(f"No model found in {self.model_dir}")
+        self.activate(load_version(path))
+        return self._active
+
+    def check(self):
+        """
+        Look for a new model in model_dir and swap it in. A model is only
+        loaded once its files have stopped changing between two checks, so
+        one that is still being copied is left for the next check. Returns
+        the new ModelVersion, or None.
+        """
+        changed = {
+            path: signature for path, signature in find_candidates(self.model_dir).items()
+            if self._seen.get(path) != signature and self._rejected.get(path) != signature
+        }
+        # Files that looked the same at the last check are complete
+        settled = {path: signature for path, signature in changed.items() if self._pending.get(path) == signature}
+        self._pending = changed
+        if not settled:
+            return None
+
+        # Only the newest model matters; older ones that appeared with it are skipped
+        path = max(settled, key=lambda p: (settled[p][1], p))
+        self._seen.update(settled)
+        start = time.perf_counter()
+        try:
+            loaded = load_version(path)
+        except Exception as e:
+            self.failures += 1
+            self._rejected[path] = settled[path]
+            logger.error(f"New model {path} rejected, keeping the current one: {str(e)}")
+            return None
+        logger.info("New model loaded", extra={
+            'model_path': path, 'model_version': loaded.version,
+            'load_ms': round((time.perf_counter() - start) * 1000, 1),
+        })
+        active = self._active
+        if active is not None and loaded.version == active.version:
+            # Same parameters as the model in service, nothing to swap
+            return None
+        self.activate(loaded)
+        return loaded
+
+    def _watch(self):
+        while not self._stopping.wait(self.poll_interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Error checking {self.model_dir} for new models: {str(e)}")
+
+    def start_watching(self):
+        """Check model_dir for new models every poll_interval seconds in a background thread"""
+        if self.model_dir is None or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._watch, name='model-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        """Version in service and swap counters"""
+        active = self._active
+        return {
+            'model_version': active.version if active else None,
+            'model_path': active.path if active else None,
+            'loaded_at': active.loaded_at if active else None,
+            'swaps': self.swaps,
+            'failures': self.failures,
+            'watching': self.model_dir,
+        }
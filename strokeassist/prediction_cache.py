@@ -0,0 +1,136 @@
+"""
+Bounded LRU/TTL cache for single-patient predictions.
+
+Kiosks resubmit identical forms all the time (reloads, back button, demo
+patients). Results are cached under a key built from the normalized, encoded
+input together with the model version, so a result is never served for a
+different model.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from model import get_encoding_plan, model_version
+
+# Decimal places each numeric field is rounded to before it becomes part of
+# the cache key (finer than the form's input steps)
+NUMERIC_ROUNDING = {
+    'age': 1,
+    'avg_glucose_level': 2,
+    'bmi': 2
+}
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache of prediction results, bounded to `max_entries`,
+    with entries optionally expiring after `ttl` seconds.
+
+    The cache follows the model it is used with: when a different model
+    version is seen, every entry is dropped.
+    """
+    def __init__(self, max_entries=10000, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_version = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def normalize(self, model, feature_names, data, explain=None):
+        """
+        Normalize form input for caching.
+
+        Returns (normalized_data, key). Predicting on normalized_data gives the
+        result for key, so every input that maps to the same key gets the same
+        answer. Numeric fields are rounded per NUMERIC_ROUNDING, and categorical
+        fields are reduced to the one-hot column they select.
+        """
+        version = model_version(model)
+        if version != self._model_version:
+            self.invalidate(version)
+
+        plan = get_encoding_plan(feature_names)
+        normalized = {}
+        key = [version, explain]
+
+        for feature, _ in plan.numeric:
+            value = 0.0
+            if feature in data:
+                try:
+                    value = round(float(data[feature]), NUMERIC_ROUNDING.get(feature, 2))
+                except (ValueError, TypeError):
+                    pass
+            normalized[feature] = value
+            key.append(value)
+
+        for feature, values in plan.categorical.items():
+            value = data.get(feature)
+            index = values.get(str(value)) if value is not None else None
+            if index is not None:
+                normalized[feature] = str(value)
+            key.append(index)
+
+        return normalized, tuple(key)
+
+    def get(self, key):
+        """Return the cached result for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, result = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        """Store a result, evicting the least recently used entries if full"""
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key[0] != self._model_version:
+                # Computed against a model that has since been replaced
+                return
+            self._entries[key] = (expires_at, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, version=None):
+        """Drop every entry and start following the given model version"""
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._model_version = version
+
+    def stats(self):
+        """Hit, miss and eviction counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'model_version': self._model_version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
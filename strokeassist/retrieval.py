@@ -0,0 +1,362 @@
+"""
+Passage retrieval for the chatbot.
+
+Documents (patient-education articles) are split into passages, and every
+passage is indexed once into a sparse BM25 matrix with one row per term, so
+a question only touches the posting rows of its own words: its score for
+every passage is a single sparse vector-matrix product, and the best k
+passages are picked from the non-zero scores.
+
+An index is saved as a directory of raw arrays plus a JSON header and is
+memory-mapped when it is opened, so startup doesn't depend on the size of
+the corpus.
+
+Usage:
+    python retrieval.py build articles/ articles.index/
+    python retrieval.py query articles.index/ "how is a stroke treated"
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import Counter
+import numpy as np
+import scipy.sparse as sp
+
+# Layout version of the index written by RetrievalIndex.save
+INDEX_FORMAT_VERSION = 1
+INDEX_META_FILE = 'index.json'
+
+# BM25 term frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Paragraphs are merged into passages of up to this many words
+PASSAGE_WORDS = 120
+
+# Article files read from a corpus directory
+DOCUMENT_EXTENSIONS = ('.txt', '.md')
+
+# Words that say nothing about what the user is asking for
+STOPWORDS = {
+    "a", "about", "am", "an", "and", "any", "are", "at", "be", "can", "could", "do", "does",
+    "for", "from", "get", "has", "have", "how", "i", "if", "in", "is", "it", "its", "know",
+    "me", "my", "of", "on", "or", "please", "should", "some", "tell", "that", "the", "there",
+    "this", "to", "was", "were", "what", "when", "which", "who", "why", "will", "with",
+    "would", "you", "your"
+}
+
+# Suffixes stripped so that e.g. "prevent", "preventing" and "prevention" match
+SUFFIXES = [
+    ("ments", ""), ("ment", ""), ("ions", ""), ("ion", ""), ("ing", ""),
+    ("ies", "y"), ("ery", "er"), ("ed", ""), ("s", "")
+]
+
+@functools.lru_cache(maxsize=200000)
+def stem(token):
+    """Strip a common suffix, keeping at least three characters"""
+    for suffix, replacement in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)] + replacement
+    return token
+
+def tokenize(text):
+    """Split text into lowercase, stemmed word tokens"""
+    return [stem(token) for token in re.findall(r"[a-z0-9]+", text.lower().replace("'s", ""))]
+
+def content_terms(text):
+    """Tokens of text without stopwords"""
+    return [token for token in tokenize(text) if token not in STOPWORDS]
+
+def split_passages(text, max_words=PASSAGE_WORDS):
+    """Split an article into passages of whole paragraphs, about max_words long"""
+    passages, current, words = [], [], 0
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        length = len(paragraph.split())
+        if current and words + length > max_words:
+            passages.append(" ".join(current))
+            current, words = [], 0
+        current.append(paragraph)
+        words += length
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+def _corpus_files(path):
+    """Article files of a corpus directory in a stable order"""
+    return sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(path)
+        for name in names if name.lower().endswith(DOCUMENT_EXTENSIONS)
+    )
+
+def load_documents(path, max_words=PASSAGE_WORDS):
+    """
+    Read a corpus into passages ({'title', 'text', 'source'} dicts). `path` is
+    a directory of .txt/.md articles, whose first line is the title, or a
+    .jsonl file with one {"title", "text"} object per line.
+    """
+    passages = []
+    if os.path.isdir(path):
+        for file_path in _corpus_files(path):
+            with open(file_path, encoding='utf-8') as file:
+                title, _, body = file.read().strip().partition('\n')
+            source = os.path.relpath(file_path, path)
+            title = title.strip().lstrip('#').strip()
+            for text in split_passages(body, max_words):
+                passages.append({'title': title, 'text': text, 'source': source})
+    else:
+        with open(path, encoding='utf-8') as file:
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                document = json.loads(line)
+                title = document.get('title', '')
+                source = document.get('source', f"{os.path.basename(path)}:{line_number}")
+                for text in split_passages(document['text'], max_words):
+                    passages.append({'title': title, 'text': text, 'source': source})
+    return passages
+
+def corpus_signature(path):
+    """
+    Fingerprint of a corpus (file names, sizes and modification times), used
+    to tell whether a saved index is current
+    """
+    digest = hashlib.sha1()
+    files = _corpus_files(path) if os.path.isdir(path) else [path]
+    for file_path in files:
+        stat = os.stat(file_path)
+        digest.update(f"{os.path.relpath(file_path, path)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    digest.update(f"{INDEX_FORMAT_VERSION}|{BM25_K1}|{BM25_B}|{PASSAGE_WORDS}".encode())
+    return digest.hexdigest()
+
+class RetrievalIndex:
+    """
+    BM25 index of passages.
+
+    `postings` is a (terms x passages) CSR matrix holding each term's BM25
+    weight in each passage, and `vocabulary` maps a term to its row. Passages
+    are stored as one UTF-8 blob of JSON records with their offsets, so they
+    can be memory-mapped and only the returned ones are decoded.
+    """
+    def __init__(self, vocabulary, postings, blob, offsets, signature=None):
+        self.vocabulary = vocabulary
+        self.postings = postings
+        self.blob = blob
+        self.offsets = offsets
+        self.signature = signature
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def passage(self, i):
+        """The passage dict at position i"""
+        return json.loads(bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8'))
+
+    def search(self, query, k=3):
+        """Best k passages for query as (score, passage) pairs, best first"""
+        rows = sorted({self.vocabulary[term] for term in content_terms(query) if term in self.vocabulary})
+        if not rows:
+            return []
+        # Sum of the query terms' rows, as a sparse vector-matrix product
+        selector = sp.csr_matrix(
+            (np.ones(len(rows), dtype=self.postings.dtype), (np.zeros(len(rows), dtype=np.int32), rows)),
+            shape=(1, self.postings.shape[0])
+        )
+        scores = selector @ self.postings
+        if scores.nnz == 0:
+            return []
+        candidates, values = scores.indices, scores.data
+        if len(values) > k:
+            top = np.argpartition(values, -k)[-k:]
+            candidates, values = candidates[top], values[top]
+        order = np.argsort(-values, kind='stable')
+        return [(float(values[i]), self.passage(int(candidates[i]))) for i in order]
+
+    def save(self, index_dir):
+        """
+        Write the index as raw arrays plus a JSON header. It is written to a
+        new sibling directory that then takes the place of index_dir, so
+        processes that have the old index memory-mapped keep reading intact
+        files, and readers see either the old index or the new one.
+        """
+        index_dir = os.path.abspath(index_dir)
+        parent, name = os.path.split(index_dir)
+        os.makedirs(parent, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(prefix=f'.{name}.', suffix='.tmp', dir=parent)
+        try:
+            self._write(temp_dir)
+            _swap_directory(temp_dir, index_dir)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def _write(self, index_dir):
+        arrays = {
+            'data': self.postings.data, 'indices': self.postings.indices,
+            'indptr': self.postings.indptr, 'offsets': self.offsets,
+        }
+        meta = {
+            'format_version': INDEX_FORMAT_VERSION,
+            'shape': list(self.postings.shape),
+            'arrays': {name: str(array.dtype) for name, array in arrays.items()},
+            'vocabulary': sorted(self.vocabulary, key=self.vocabulary.get),
+            'signature': self.signature,
+        }
+        for name, array in arrays.items():
+            np.ascontiguousarray(array).tofile(os.path.join(index_dir, f'{name}.bin'))
+        with open(os.path.join(index_dir, 'passages.bin'), 'wb') as file:
+            file.write(bytes(self.blob))
+        with open(os.path.join(index_dir, INDEX_META_FILE), 'w') as file:
+            json.dump(meta, file)
+
+def _swap_directory(new_dir, target_dir):
+    """
+    Put new_dir in the place of target_dir. The old directory is renamed
+    aside and deleted; its files stay readable to anyone who has them open
+    or mapped until they close them. If another process installs its own
+    copy in between (workers rebuilding the same index at once), that copy
+    is kept and new_dir is left for the caller to remove.
+    """
+    old_dir = new_dir + '.old'
+    try:
+        os.rename(target_dir, old_dir)
+    except FileNotFoundError:
+        old_dir = None
+    try:
+        os.rename(new_dir, target_dir)
+    except OSError:
+        if not os.path.exists(os.path.join(target_dir, INDEX_META_FILE)):
+            raise
+    finally:
+        if old_dir:
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+def build_index(passages, signature=None, k1=BM25_K1, b=BM25_B):
+    """Index a list of passage dicts ({'title', 'text', ...})"""
+    vocabulary = {}
+    term_rows, passage_columns, frequencies = [], [], []
+    lengths = np.zeros(len(passages))
+    for column, passage in enumerate(passages):
+        terms = content_terms(f"{passage.get('title', '')} {passage['text']}")
+        lengths[column] = len(terms)
+        for term, count in Counter(terms).items():
+            term_rows.append(vocabulary.setdefault(term, len(vocabulary)))
+            passage_columns.append(column)
+            frequencies.append(count)
+
+    counts = sp.csr_matrix(
+        (np.array(frequencies, dtype=np.float32), (term_rows, passage_columns)),
+        shape=(len(vocabulary), len(passages))
+    )
+    counts.sort_indices()
+
+    # BM25 weight of every (term, passage) pair
+    n_passages = max(len(passages), 1)
+    document_frequency = np.diff(counts.indptr)
+    idf = np.log1p((n_passages - document_frequency + 0.5) / (document_frequency + 0.5))
+    average_length = max(lengths.mean(), 1.0) if len(passages) else 1.0
+    norm = k1 * (1 - b + b * lengths / average_length)
+    tf = counts.data
+    weights = np.repeat(idf, document_frequency) * tf * (k1 + 1) / (tf + norm[counts.indices])
+    postings = sp.csr_matrix(
+        (weights.astype(np.float32), counts.indices.astype(np.int32), counts.indptr.astype(np.int64)),
+        shape=counts.shape
+    )
+
+    records = [json.dumps(passage, ensure_ascii=False).encode('utf-8') for passage in passages]
+    offsets = np.zeros(len(records) + 1, dtype=np.int64)
+    np.cumsum([len(record) for record in records], out=offsets[1:])
+    blob = np.frombuffer(b''.join(records), dtype=np.uint8)
+    return RetrievalIndex(vocabulary, postings, blob, offsets, signature)
+
+def load_index(index_dir):
+    """Open a saved index with its arrays memory-mapped"""
+    with open(os.path.join(index_dir, INDEX_META_FILE)) as file:
+        meta = json.load(file)
+    if meta['format_version'] != INDEX_FORMAT_VERSION:
+        raise ValueError(f"Unsupported index format {meta['format_version']}")
+
+    arrays = {}
+    for name, dtype in meta['arrays'].items():
+        path = os.path.join(index_dir, f'{name}.bin')
+        if os.path.getsize(path):
+            arrays[name] = np.memmap(path, dtype=dtype, mode='r')
+        else:
+            arrays[name] = np.zeros(0, dtype=dtype)
+    postings = sp.csr_matrix(
+        (arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(meta['shape']), copy=False
+    )
+    blob_path = os.path.join(index_dir, 'passages.bin')
+    blob = np.memmap(blob_path, dtype=np.uint8, mode='r') if os.path.getsize(blob_path) else np.zeros(0, np.uint8)
+    # A header and arrays from different saves (the directory was replaced
+    # while they were being opened) don't fit together
+    if (len(arrays['indptr']) != meta['shape'][0] + 1 or len(arrays['indices']) != len(arrays['data'])
+            or len(arrays['offsets']) != meta['shape'][1] + 1 or int(arrays['offsets'][-1]) != len(blob)):
+        raise ValueError(f"Index in {index_dir} is incomplete")
+    vocabulary = {term: row for row, term in enumerate(meta['vocabulary'])}
+    return RetrievalIndex(vocabulary, postings, blob, arrays['offsets'], meta.get('signature'))
+
+def open_index(corpus_path, index_dir=None):
+    """
+    Load the index of a corpus from index_dir (default: next to the corpus,
+    with an .index suffix), building and saving it first if it is missing or
+    the corpus has changed since
+    """
+    index_dir = index_dir or corpus_path.rstrip('/\\') + '.index'
+    signature = corpus_signature(corpus_path)
+    try:
+        index = load_index(index_dir)
+        if index.signature == signature:
+            return index
+    except (OSError, ValueError):
+        # Missing, or being replaced by another process right now
+        pass
+    index = build_index(load_documents(corpus_path), signature)
+    index.save(index_dir)
+    return load_index(index_dir)
+
+def main(argv=None):
+    """
+    Command-line entry point for building and querying passage indexes
+    """
+    parser = argparse.ArgumentParser(description="Chatbot passage retrieval utilities")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="Index a directory of articles or a .jsonl file")
+    build_parser.add_argument('corpus_path')
+    build_parser.add_argument('index_dir')
+
+    query_parser = subparsers.add_parser('query', help="Show the best passages for a question")
+    query_parser.add_argument('index_dir')
+    query_parser.add_argument('question')
+    query_parser.add_argument('-k', type=int, default=3)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        index = build_index(load_documents(args.corpus_path), corpus_signature(args.corpus_path))
+        index.save(args.index_dir)
+        print(f"Indexed {len(index)} passages ({len(index.vocabulary)} terms) "
+              f"in {time.perf_counter() - start:.1f} s")
+
+    elif args.command == 'query':
+        index = load_index(args.index_dir)
+        start = time.perf_counter()
+        results = index.search(args.question, args.k)
+        elapsed = (time.perf_counter() - start) * 1000
+        for score, passage in results:
+            print(f"{score:7.2f}  {passage.get('title', '')} ({passage.get('source', '')})")
+            print(f"         {passage['text'][:200]}")
+        print(f"{len(results)} passages in {elapsed:.2f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Multi-process launcher for the Flask app.
+
+The listening socket is bound once in the parent, then WEB_CONCURRENCY worker
+processes are forked and each runs waitress on that shared socket, so scoring
+uses more than one core. Before forking, a pickled linear model is exported
+once to a compact artifact next to it, and every worker memory-maps that one
+read-only file instead of holding its own unpickled copy.
+
+Usage:
+    WEB_CONCURRENCY=4 PORT=8080 python serve.py
+"""
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import jsonlog
+from model import load_model, export_model, is_compact_artifact, is_linear_model
+
+logger = logging.getLogger(__name__)
+
+def default_worker_count():
+    """Number of workers from WEB_CONCURRENCY, or one per CPU core"""
+    return int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+
+def prepare_shared_model(model_path):
+    """
+    Return the path every worker should load the model from.
+
+    A pickled linear model is exported to `<model_path>.compact/` (refreshed
+    whenever the pickle is newer) so workers can share one memory-mapped file.
+    Other models are returned unchanged and each worker unpickles its own copy.
+    """
+    if not os.path.exists(model_path) or is_compact_artifact(model_path):
+        return model_path
+
+    compact_path = model_path + '.compact'
+    header_path = os.path.join(compact_path, 'model.json')
+    if os.path.exists(header_path) and os.path.getmtime(header_path) >= os.path.getmtime(model_path):
+        return compact_path
+
+    try:
+        model, feature_names = load_model(model_path)
+        if not is_linear_model(model):
+            logger.info("Model is not linear, each worker will load its own copy")
+            return model_path
+        export_model(model, feature_names, compact_path)
+        logger.info(f"Exported shared model artifact to {compact_path}")
+        return compact_path
+    except Exception as e:
+        logger.warning(f"Could not prepare shared model, workers will load {model_path}: {str(e)}")
+        return model_path
+
+def create_socket(host, port, backlog=1024):
+    """Bind the listening socket shared by all workers"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+def run_worker(sock, threads):
+    """Serve the app on the inherited socket until the process is terminated"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    # Import after fork so the model is mapped by the worker itself
+    from waitress import serve
+    from app import app
+
+    serve(app, sockets=[sock], threads=threads)
+
+def run(host='0.0.0.0', port=8080, workers=None, threads=4):
+    """
+    Start `workers` forked waitress processes on one socket and restart any
+    that exit until the launcher is told to stop
+    """
+    workers = workers or default_worker_count()
+    os.environ['MODEL_PATH'] = prepare_shared_model(os.environ.get('MODEL_PATH', 'stroke_model.pkl'))
+
+    if workers == 1 or not hasattr(os, 'fork'):
+        # Single process (also the only option where fork isn't available)
+        from waitress import serve
+        from app import app
+        logger.info(f"Starting 1 worker on port {port}")
+        serve(app, host=host, port=port, threads=threads)
+        return
+
+    sock = create_socket(host, port)
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(sock, threads)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info(f"Starting {workers} workers on port {port}")
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            logger.warning(f"Worker {pid} exited with status {status}, restarting")
+            # Avoid a tight restart loop if workers die on startup
+            time.sleep(1)
+            spawn()
+
+    sock.close()
+
+if __name__ == '__main__':
+    # Workers set up their own writer when they import the app
+    jsonlog.configure_logging()
+    try:
+        run(
+            port=int(os.environ.get('PORT', 8080)),
+            threads=int(os.environ.get('WAITRESS_THREADS', 4))
+        )
+    except Exception as e:
+        logger.exception(f"Error starting the server: {str(e)}")
+        jsonlog.stop_logging()
+        sys.exit(1)
@@ -0,0 +1,280 @@
+"""
+Mergeable summary statistics for the dashboard's distribution charts.
+
+A QuantileSketch keeps counts in logarithmically sized buckets (as in
+DDSketch), so any quantile comes back within a chosen relative error, using
+memory that depends on the range of the values and not on how many there
+are. Count, mean, variance, min and max are kept exactly. Sketches built on
+separate chunks of data merge into the sketch of all of it, which is how
+appended data is folded in.
+"""
+import math
+import numpy as np
+import pandas as pd
+
+# Default relative error of quantiles (1%)
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# Numeric columns summarized for the dashboard
+SUMMARY_COLUMNS = ('age', 'avg_glucose_level', 'bmi')
+
+class QuantileSketch:
+    """
+    Streaming summary of a numeric column.
+
+    Quantiles are accurate to within `relative_accuracy` of the true value
+    (e.g. 0.01 -> within 1%). Missing values are counted separately and left
+    out of every statistic.
+    """
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+
+        # Bucket index -> count, for positive values and for magnitudes of
+        # negative ones; bucket i holds (gamma^(i-1), gamma^i]
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+
+        self.count = 0
+        self.missing = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _add_buckets(self, store, magnitudes):
+        indices = np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64)
+        for index, count in zip(*np.unique(indices, return_counts=True)):
+            index = int(index)
+            store[index] = store.get(index, 0) + int(count)
+
+    def _merge_moments(self, count, mean, m2):
+        """Combine count/mean/M2 of another part of the data (Chan et al.)"""
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def add(self, values):
+        """Add an array of values"""
+        values = np.asarray(values, dtype=float)
+        present = ~np.isnan(values)
+        self.missing += int(len(values) - present.sum())
+        values = values[present]
+        if len(values) == 0:
+            return self
+
+        mean = float(values.mean())
+        self._merge_moments(len(values), mean, float(((values - mean) ** 2).sum()))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        self._add_buckets(self.positive, values[values > 0])
+        self._add_buckets(self.negative, -values[values < 0])
+        self.zeros += int((values == 0).sum())
+        return self
+
+    def merge(self, other):
+        """Fold another sketch with the same accuracy into this one"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracies")
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in other_store.items():
+                store[index] = store.get(index, 0) + count
+        self.zeros += other.zeros
+        self.missing += other.missing
+        if other.count:
+            self._merge_moments(other.count, other.mean, other.m2)
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        return self
+
+    def _value(self, index):
+        """Representative value of a positive bucket"""
+        return 2 * self._gamma ** index / (self._gamma + 1)
+
+    def _buckets(self):
+        """(value, count) for every non-empty bucket in ascending order"""
+        for index in sorted(self.negative, reverse=True):
+            yield -self._value(index), self.negative[index]
+        if self.zeros:
+            yield 0.0, self.zeros
+        for index in sorted(self.positive):
+            yield self._value(index), self.positive[index]
+
+    def quantiles(self, qs):
+        """Approximate quantiles for the fractions in qs (NaN when empty)"""
+        if self.count == 0:
+            return [math.nan for _ in qs]
+        ranks = sorted((q * (self.count - 1), i) for i, q in enumerate(qs))
+        results = [math.nan] * len(qs)
+        seen = 0
+        position = 0
+        for value, count in self._buckets():
+            seen += count
+            while position < len(ranks) and ranks[position][0] < seen:
+                results[ranks[position][1]] = min(max(value, self.min), self.max)
+                position += 1
+        for _, i in ranks[position:]:
+            results[i] = self.max
+        return results
+
+    def quantile(self, q):
+        return self.quantiles([q])[0]
+
+    @property
+    def std(self):
+        """Sample standard deviation, like pandas"""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+    def describe(self):
+        """The statistics of pandas' Series.describe()"""
+        q1, median, q3 = self.quantiles([0.25, 0.5, 0.75])
+        return pd.Series({
+            'count': float(self.count),
+            'mean': self.mean if self.count else math.nan,
+            'std': self.std,
+            'min': self.min if self.count else math.nan,
+            '25%': q1,
+            '50%': median,
+            '75%': q3,
+            'max': self.max if self.count else math.nan,
+        })
+
+    def boxplot_stats(self, whis=1.5):
+        """
+        Box plot statistics in the form Axes.bxp takes. Whiskers reach the
+        most extreme bucket within `whis` IQRs of the box, as in seaborn's
+        boxplot. Outliers are shown as one point per bucket outside the
+        whiskers, so their number is bounded too.
+        """
+        q1, median, q3 = self.quantiles([0.25, 0.5, 0.75])
+        low, high = q1 - whis * (q3 - q1), q3 + whis * (q3 - q1)
+        values = [min(max(value, self.min), self.max) for value, _ in self._buckets()]
+        inside = [value for value in values if low <= value <= high] or [q1, q3]
+        return {
+            'med': median,
+            'q1': q1,
+            'q3': q3,
+            'whislo': self.min if low <= self.min else min(inside),
+            'whishi': self.max if high >= self.max else max(inside),
+            'fliers': [value for value in values if value < low or value > high],
+            'mean': self.mean,
+        }
+
+    def to_dict(self):
+        """Describe the sketch as JSON-serializable data"""
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'positive': {str(index): count for index, count in self.positive.items()},
+            'negative': {str(index): count for index, count in self.negative.items()},
+            'zeros': self.zeros,
+            'count': self.count,
+            'missing': self.missing,
+            'mean': self.mean,
+            'm2': self.m2,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a sketch from to_dict() output"""
+        self = cls(data['relative_accuracy'])
+        self.positive = {int(index): count for index, count in data['positive'].items()}
+        self.negative = {int(index): count for index, count in data['negative'].items()}
+        self.zeros = data['zeros']
+        self.count = data['count']
+        self.missing = data['missing']
+        self.mean = data['mean']
+        self.m2 = data['m2']
+        if self.count:
+            self.min = data['min']
+            self.max = data['max']
+        return self
+
+class ColumnSummaries:
+    """
+    Quantile sketches of the SUMMARY_COLUMNS, over all rows and split by
+    stroke status
+    """
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY, columns=SUMMARY_COLUMNS):
+        self.relative_accuracy = relative_accuracy
+        self.columns = tuple(columns)
+        self.overall = {column: QuantileSketch(relative_accuracy) for column in self.columns}
+        # column -> {stroke value: sketch}
+        self.by_stroke = {column: {} for column in self.columns}
+        self.rows = 0
+
+    def add(self, df):
+        """Summarize the rows of df (which needs the columns and 'stroke')"""
+        stroke = pd.to_numeric(df['stroke'], errors='coerce').to_numpy(dtype=float)
+        labels = [int(label) for label in np.unique(stroke[~np.isnan(stroke)])]
+        for column in self.columns:
+            values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+            self.overall[column].add(values)
+            groups = self.by_stroke[column]
+            for label in labels:
+                sketch = groups.get(label)
+                if sketch is None:
+                    sketch = groups[label] = QuantileSketch(self.relative_accuracy)
+                sketch.add(values[stroke == label])
+        self.rows += len(df)
+        return self
+
+    def merge(self, other):
+        """Fold summaries of other rows into these"""
+        for column in self.columns:
+            self.overall[column].merge(other.overall[column])
+            for label, sketch in other.by_stroke[column].items():
+                if label in self.by_stroke[column]:
+                    self.by_stroke[column][label].merge(sketch)
+                else:
+                    self.by_stroke[column][label] = QuantileSketch(self.relative_accuracy).merge(sketch)
+        self.rows += other.rows
+        return self
+
+    def describe(self):
+        """Summary table like df[columns].describe()"""
+        return pd.DataFrame({column: self.overall[column].describe() for column in self.columns})
+
+    def boxplot_stats(self, column):
+        """Axes.bxp statistics for column, one box per stroke status in ascending order"""
+        groups = self.by_stroke[column]
+        return [dict(groups[label].boxplot_stats(), label=str(label)) for label in sorted(groups)]
+
+    def to_dict(self):
+        """Describe the summaries as JSON-serializable data"""
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'rows': self.rows,
+            'overall': {column: sketch.to_dict() for column, sketch in self.overall.items()},
+            'by_stroke': {
+                column: {str(label): sketch.to_dict() for label, sketch in groups.items()}
+                for column, groups in self.by_stroke.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild summaries from to_dict() output"""
+        self = cls(data['relative_accuracy'], data['overall'].keys())
+        self.rows = data['rows']
+        self.overall = {column: QuantileSketch.from_dict(sketch) for column, sketch in data['overall'].items()}
+        self.by_stroke = {
+            column: {int(label): QuantileSketch.from_dict(sketch) for label, sketch in groups.items()}
+            for column, groups in data['by_stroke'].items()
+        }
+        return self
+
+def build_summaries(df, relative_accuracy=DEFAULT_RELATIVE_ACCURACY, chunksize=1000000):
+    """Summarize a dataset with SUMMARY_COLUMNS and 'stroke', a chunk of rows at a time"""
+    summaries = ColumnSummaries(relative_accuracy)
+    for start in range(0, max(len(df), 1), chunksize):
+        summaries.add(df.iloc[start:start + chunksize])
+    return summaries
@@ -7,6 +7,87 @@ document.addEventListener('DOMContentLoaded', function() {
     const chatbotInput = document.getElementById('chatbot-input-text');
     const chatbotSend = document.getElementById('chatbot-send');
     
+    // Messages go over one WebSocket per page where the server offers one
+    // (asgi.py). Where it doesn't, or the socket can't be opened, each
+    // message is POSTed to /chatbot instead.
+    const socketUrl = (window.location.protocol === 'https:' ? 'wss://' : 'ws://') + window.location.host + '/chatbot/ws';
+    let socket = null;
+    let connecting = null;
+    let socketFailed = !('WebSocket' in window);
+    let nextId = 0;
+    const pending = new Map();
+    
+    function postMessage(message) {
+        return fetch('/chatbot', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ message: message })
+        })
+        .then(response => response.json());
+    }
+    
+    function connect() {
+        return new Promise(resolve => {
+            const ws = new WebSocket(socketUrl);
+            let opened = false;
+            ws.onopen = function() {
+                opened = true;
+                socket = ws;
+                resolve(ws);
+            };
+            ws.onmessage = function(event) {
+                const data = JSON.parse(event.data);
+                const request = pending.get(data.id);
+                if (request) {
+                    pending.delete(data.id);
+                    request.resolve(data);
+                }
+            };
+            ws.onclose = function() {
+                if (socket === ws) {
+                    socket = null;
+                }
+                if (!opened) {
+                    // No WebSocket endpoint here, stay on POST
+                    socketFailed = true;
+                    resolve(null);
+                }
+                // Anything still waiting for an answer is asked again over POST
+                pending.forEach(request => request.resolve(postMessage(request.message)));
+                pending.clear();
+            };
+        });
+    }
+    
+    function getSocket() {
+        if (socket) {
+            return Promise.resolve(socket);
+        }
+        if (socketFailed) {
+            return Promise.resolve(null);
+        }
+        if (!connecting) {
+            connecting = connect().finally(() => { connecting = null; });
+        }
+        return connecting;
+    }
+    
+    // Ask the chatbot, resolving to {response} or {error}
+    function askBot(message) {
+        return getSocket().then(ws => {
+            if (!ws) {
+                return postMessage(message);
+            }
+            return new Promise(resolve => {
+                const id = ++nextId;
+                pending.set(id, { message: message, resolve: resolve });
+                ws.send(JSON.stringify({ id: id, message: message }));
+            });
+        });
+    }
+    
     // Toggle chatbot visibility
     chatbotToggle.addEventListener('click', function(e) {
         e.preventDefault();
@@ -16,6 +97,8 @@ document.addEventListener('DOMContentLoaded', function() {
             chatbotWidget.style.display = 'flex';
             // Focus the input when opening
             chatbotInput.focus();
+            // Connect while the user types the first message
+            getSocket();
         }
     });
     
@@ -66,14 +149,7 @@ document.addEventListener('DOMContentLoaded', function() {
         chatbotMessages.scrollTop = chatbotMessages.scrollHeight;
         
         // Send message to backend
-        fetch('/chatbot', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ message: message })
-        })
-        .then(response => response.json())
+        askBot(message)
         .then(data => {
             // Remove typing indicator
             chatbotMessages.removeChild(typingElement);
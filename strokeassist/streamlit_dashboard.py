@@ -3,9 +3,14 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-import pickle
 from sklearn.metrics import confusion_matrix, roc_curve, auc
 import os
+from model import load_model as load_model_file
+from dashboard_data import make_synthetic_dataset, resolve_store, load_columns, dataset_version, build_stats
+from dashboard_data import load_stats as load_dataset_stats
+from figure_cache import FigureCache
+from model import model_version, score_grid
+import jsonlog
 
 # Set page configuration
 st.set_page_config(
@@ -15,64 +20,141 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# JSON lines written by a background thread, set up once per server process
+# rather than on every rerun of this script
+@st.cache_resource
+def start_logging():
+    return jsonlog.configure_logging()
+
+start_logging()
+
 # Load the model (for feature importance)
 @st.cache_resource
 def load_model():
     try:
-        with open('stroke_model.pkl', 'rb') as file:
-            model_data = pickle.load(file)
-        return model_data['model'], model_data['feature_names']
+        # Same loader as the Flask app, so a compact artifact works here too
+        return load_model_file(os.environ.get('MODEL_PATH', 'stroke_model.pkl'))
     except Exception as e:
         st.error(f"Failed to load model: {str(e)}")
         return None, None
 
-# Load stroke dataset
-@st.cache_data
-def load_data():
-    # Try to load the dataset from common paths
-    potential_paths = [
-        'D:\\healthcare-dataset-stroke-data.csv'
-    ]
-    
-    for path in potential_paths:
-        if os.path.exists(path):
-            return pd.read_csv(path)
+# Dataset to visualize: a CSV (converted once to a columnar store next to it)
+# or a store directory written by `python dashboard_data.py convert`
+DATA_PATH = os.environ.get('STROKE_DATA_PATH', 'D:\\healthcare-dataset-stroke-data.csv')
+
+# Relative error of the quantiles in summary tables and box plots
+QUANTILE_ACCURACY = float(os.environ.get('DASHBOARD_QUANTILE_ACCURACY', 0.01))
+
+# Patient whose risk the Model Insights charts show, apart from the factors
+# varied by each chart
+REFERENCE_PATIENT = {
+    'gender': 'Female',
+    'age': 50,
+    'hypertension': 0,
+    'heart_disease': 0,
+    'ever_married': 'Yes',
+    'work_type': 'Private',
+    'Residence_type': 'Urban',
+    'avg_glucose_level': 100,
+    'bmi': 28,
+    'smoking_status': 'never_smoked'
+}
+
+# Smoking choices of the risk assessment and the model's values for them
+SMOKING_CHOICES = {
+    "Never Smoked": 'never_smoked',
+    "Formerly Smoked": 'formerly_smoked',
+    "Currently Smoking": 'smokes'
+}
+
+# Every input combination of the interactive risk assessment
+GAUGE_GRID = {
+    'age': list(range(20, 101)),
+    'hypertension': [0, 1],
+    'heart_disease': [0, 1],
+    'avg_glucose_level': list(range(50, 301)),
+    'smoking_status': list(SMOKING_CHOICES.values())
+}
+
+# Columnar store for the configured dataset (None if there is no dataset)
+@st.cache_resource
+def get_store():
+    if os.path.exists(DATA_PATH):
+        return resolve_store(DATA_PATH)
+    return None
+
+# Load stroke dataset columns, memory-mapped from the store and shared between
+# sessions (so they must not be modified); `version` ties the cache to the
+# dataset's contents
+@st.cache_resource
+def load_data(columns=None, rows=None, version=None):
+    store = get_store()
+    if store is not None:
+        return load_columns(store, columns, rows)
     
     # If no dataset is found, create a mock dataset for demonstration
-    st.warning("No actual stroke dataset found. Using synthetic data for demonstration.")
-    
-    # Create synthetic data based on stroke dataset schema
-    np.random.seed(42)
-    n_samples = 500
-    
-    data = {
-        'id': range(1, n_samples + 1),
-        'gender': np.random.choice(['Male', 'Female', 'Other'], n_samples, p=[0.48, 0.51, 0.01]),
-        'age': np.clip(np.random.normal(45, 20, n_samples), 0, 100),
-        'hypertension': np.random.choice([0, 1], n_samples, p=[0.8, 0.2]),
-        'heart_disease': np.random.choice([0, 1], n_samples, p=[0.9, 0.1]),
-        'ever_married': np.random.choice(['Yes', 'No'], n_samples),
-        'work_type': np.random.choice(['Private', 'Self-employed', 'Govt_job', 'children', 'Never_worked'], n_samples),
-        'Residence_type': np.random.choice(['Urban', 'Rural'], n_samples),
-        'avg_glucose_level': np.clip(np.random.normal(106, 45, n_samples), 50, 300),
-        'bmi': np.clip(np.random.normal(28, 7, n_samples), 10, 60),
-        'smoking_status': np.random.choice(['never_smoked', 'formerly_smoked', 'smokes', 'Unknown'], n_samples),
-    }
-    
-    # Adding stroke with correlation to risk factors
-    stroke_prob = 0.05 + 0.1 * (data['age'] > 60).astype(int) + \
-                  0.1 * data['hypertension'] + \
-                  0.1 * data['heart_disease'] + \
-                  0.05 * (data['avg_glucose_level'] > 200).astype(int)
-    stroke_prob = np.clip(stroke_prob, 0, 0.9)
-    data['stroke'] = np.random.binomial(1, stroke_prob)
-    
-    return pd.DataFrame(data)
+    df = make_synthetic_dataset()
+    if columns is not None:
+        df = df[list(columns)]
+    return df if rows is None else df.head(rows)
+
+# Aggregate cube (stroke rates for every group-by chart) and quantile sketches
+# (summary table and box plots). For a store they are saved next to the data
+# and kept up to date by `dashboard_data.py ingest`, so a new dataset version
+# is usually just a file read; otherwise they are built in one pass.
+@st.cache_resource(max_entries=2)
+def load_stats(version=None):
+    store = get_store()
+    if store is not None:
+        return load_dataset_stats(store, QUANTILE_ACCURACY)
+    return build_stats(load_data(version=version), QUANTILE_ACCURACY)
+
+# Encoded figures shared by all sessions
+@st.cache_resource
+def get_figure_cache():
+    return FigureCache(int(os.environ.get('DASHBOARD_FIGURE_CACHE_MB', 64)) * 1024 * 1024)
+
+# Show a chart, drawing it only if this (page, chart, versions) isn't cached
+def show_figure(key, draw):
+    st.image(get_figure_cache().render(key, draw), width='stretch')
+
+# Bar chart of the stroke rate by one column of an aggregate table
+def plot_stroke_rate(table, column, title, figsize=(8, 6), xticklabels=None, rotate=False):
+    fig, ax = plt.subplots(figsize=figsize)
+    sns.barplot(x=column, y='stroke', data=table, ax=ax)
+    ax.set_title(title)
+    ax.set_ylabel('Stroke Incidence Rate')
+    if xticklabels is not None:
+        ax.set_xticks(range(len(xticklabels)))
+        ax.set_xticklabels(xticklabels)
+    if rotate:
+        plt.xticks(rotation=45)
+    return fig
+
+# Box plot of a numeric column split by stroke status, drawn from its sketches
+def plot_stroke_boxplot(summaries, column, title):
+    stats = summaries.boxplot_stats(column)
+    fig, ax = plt.subplots(figsize=(10, 6))
+    color = sns.color_palette()[0]
+    ax.bxp(stats, patch_artist=True, widths=0.8,
+           boxprops={'facecolor': color},
+           medianprops={'color': 'black'},
+           flierprops={'marker': 'o', 'markerfacecolor': 'none'})
+    ax.set_title(title)
+    ax.set_xlabel('stroke')
+    ax.set_ylabel(column)
+    ax.set_xticks(range(1, len(stats) + 1))
+    ax.set_xticklabels(['No Stroke', 'Stroke'][:len(stats)])
+    return fig
 
 # Main function
 def main():
     model, feature_names = load_model()
-    df = load_data()
+    
+    store = get_store()
+    if store is None:
+        st.warning("No actual stroke dataset found. Using synthetic data for demonstration.")
+    version = dataset_version(store) if store is not None else 'synthetic'
     
     # Sidebar
     st.sidebar.title("Stroke Dashboard Navigation")
@@ -81,6 +163,12 @@ def main():
         ["Overview", "Demographics Analysis", "Risk Factors", "Model Insights"]
     )
     
+    # Pages draw from aggregates and sketches, not from the rows themselves
+    cube, summaries = load_stats(version)
+    
+    # Everything a cached figure can depend on
+    versions = (version, model_version(model) if model is not None else None)
+    
     # Overview page
     if page == "Overview":
         st.title("Stroke Dataset Overview 🧠")
@@ -89,29 +177,33 @@ def main():
         
         with col1:
             st.subheader("Dataset Summary")
-            st.write(f"Total Records: {len(df)}")
-            st.write(f"Stroke Cases: {df['stroke'].sum()} ({df['stroke'].mean()*100:.2f}%)")
-            st.write(f"Non-Stroke Cases: {len(df) - df['stroke'].sum()} ({(1-df['stroke'].mean())*100:.2f}%)")
+            labelled, strokes = cube.totals()
+            stroke_rate = strokes / labelled if labelled else 0.0
+            st.write(f"Total Records: {cube.rows}")
+            st.write(f"Stroke Cases: {strokes} ({stroke_rate*100:.2f}%)")
+            st.write(f"Non-Stroke Cases: {labelled - strokes} ({(1-stroke_rate)*100:.2f}%)")
             
             st.subheader("Dataset Preview")
-            st.dataframe(df.head())
+            st.dataframe(load_data(rows=5, version=version))
             
         with col2:
             st.subheader("Stroke Distribution")
-            fig, ax = plt.subplots(figsize=(6, 6))
-            ax.pie(df['stroke'].value_counts(), 
-                   labels=['No Stroke', 'Stroke'], 
-                   autopct='%1.1f%%',
-                   colors=['#4CAF50', '#F44336'],
-                   explode=[0, 0.1])
-            ax.set_title('Stroke Distribution')
-            st.pyplot(fig)
+            def draw_distribution():
+                fig, ax = plt.subplots(figsize=(6, 6))
+                ax.pie([labelled - strokes, strokes], 
+                       labels=['No Stroke', 'Stroke'], 
+                       autopct='%1.1f%%',
+                       colors=['#4CAF50', '#F44336'],
+                       explode=[0, 0.1])
+                ax.set_title('Stroke Distribution')
+                return fig
+            show_figure((page, 'distribution') + versions, draw_distribution)
         
         st.subheader("Dataset Statistics")
         
-        # Calculate statistics for numerical columns
-        numeric_cols = ['age', 'avg_glucose_level', 'bmi']
-        st.write(df[numeric_cols].describe())
+        # Statistics for numerical columns, quantiles from the sketches
+        st.write(summaries.describe())
+        st.caption(f"Quartiles are approximate, within {QUANTILE_ACCURACY:.1%} of the exact values.")
     
     # Demographics Analysis page
     elif page == "Demographics Analysis":
@@ -121,41 +213,22 @@ def main():
         
         with col1:
             st.subheader("Stroke by Gender")
-            gender_stroke = df.groupby('gender')['stroke'].mean().reset_index()
-            fig, ax = plt.subplots(figsize=(8, 6))
-            sns.barplot(x='gender', y='stroke', data=gender_stroke, ax=ax)
-            ax.set_title('Stroke Incidence by Gender')
-            ax.set_ylabel('Stroke Incidence Rate')
-            st.pyplot(fig)
+            show_figure((page, 'gender') + versions, lambda: plot_stroke_rate(
+                cube.marginal('gender'), 'gender', 'Stroke Incidence by Gender'))
             
             st.subheader("Stroke by Work Type")
-            work_stroke = df.groupby('work_type')['stroke'].mean().reset_index()
-            fig, ax = plt.subplots(figsize=(10, 6))
-            sns.barplot(x='work_type', y='stroke', data=work_stroke, ax=ax)
-            ax.set_title('Stroke Incidence by Work Type')
-            ax.set_ylabel('Stroke Incidence Rate')
-            plt.xticks(rotation=45)
-            st.pyplot(fig)
+            show_figure((page, 'work_type') + versions, lambda: plot_stroke_rate(
+                cube.marginal('work_type'), 'work_type', 'Stroke Incidence by Work Type',
+                figsize=(10, 6), rotate=True))
         
         with col2:
             st.subheader("Stroke by Age Groups")
-            # Create age groups
-            df['age_group'] = pd.cut(df['age'], bins=[0, 20, 40, 60, 80, 100], labels=['0-20', '21-40', '41-60', '61-80', '81-100'])
-            age_stroke = df.groupby('age_group')['stroke'].mean().reset_index()
-            
-            fig, ax = plt.subplots(figsize=(8, 6))
-            sns.barplot(x='age_group', y='stroke', data=age_stroke, ax=ax)
-            ax.set_title('Stroke Incidence by Age Group')
-            ax.set_ylabel('Stroke Incidence Rate')
-            st.pyplot(fig)
+            show_figure((page, 'age_group') + versions, lambda: plot_stroke_rate(
+                cube.marginal('age_group'), 'age_group', 'Stroke Incidence by Age Group'))
             
             st.subheader("Stroke by Residence Type")
-            residence_stroke = df.groupby('Residence_type')['stroke'].mean().reset_index()
-            fig, ax = plt.subplots(figsize=(8, 6))
-            sns.barplot(x='Residence_type', y='stroke', data=residence_stroke, ax=ax)
-            ax.set_title('Stroke Incidence by Residence Type')
-            ax.set_ylabel('Stroke Incidence Rate')
-            st.pyplot(fig)
+            show_figure((page, 'Residence_type') + versions, lambda: plot_stroke_rate(
+                cube.marginal('Residence_type'), 'Residence_type', 'Stroke Incidence by Residence Type'))
     
     # Risk Factors page
     elif page == "Risk Factors":
@@ -165,48 +238,28 @@ def main():
         
         with col1:
             st.subheader("Stroke by Hypertension")
-            hypertension_stroke = df.groupby('hypertension')['stroke'].mean().reset_index()
-            fig, ax = plt.subplots(figsize=(8, 6))
-            sns.barplot(x='hypertension', y='stroke', data=hypertension_stroke, ax=ax)
-            ax.set_title('Stroke Incidence by Hypertension')
-            ax.set_ylabel('Stroke Incidence Rate')
-            ax.set_xticks([0, 1])
-            ax.set_xticklabels(['No Hypertension', 'Hypertension'])
-            st.pyplot(fig)
+            show_figure((page, 'hypertension') + versions, lambda: plot_stroke_rate(
+                cube.marginal('hypertension'), 'hypertension', 'Stroke Incidence by Hypertension',
+                xticklabels=['No Hypertension', 'Hypertension']))
             
             st.subheader("Average Glucose Level vs Stroke")
-            fig, ax = plt.subplots(figsize=(10, 6))
-            sns.boxplot(x='stroke', y='avg_glucose_level', data=df, ax=ax)
-            ax.set_title('Average Glucose Level by Stroke Status')
-            ax.set_xticklabels(['No Stroke', 'Stroke'])
-            st.pyplot(fig)
+            show_figure((page, 'avg_glucose_level') + versions, lambda: plot_stroke_boxplot(
+                summaries, 'avg_glucose_level', 'Average Glucose Level by Stroke Status'))
         
         with col2:
             st.subheader("Stroke by Heart Disease")
-            heart_stroke = df.groupby('heart_disease')['stroke'].mean().reset_index()
-            fig, ax = plt.subplots(figsize=(8, 6))
-            sns.barplot(x='heart_disease', y='stroke', data=heart_stroke, ax=ax)
-            ax.set_title('Stroke Incidence by Heart Disease')
-            ax.set_ylabel('Stroke Incidence Rate')
-            ax.set_xticks([0, 1])
-            ax.set_xticklabels(['No Heart Disease', 'Heart Disease'])
-            st.pyplot(fig)
+            show_figure((page, 'heart_disease') + versions, lambda: plot_stroke_rate(
+                cube.marginal('heart_disease'), 'heart_disease', 'Stroke Incidence by Heart Disease',
+                xticklabels=['No Heart Disease', 'Heart Disease']))
             
             st.subheader("BMI vs Stroke")
-            fig, ax = plt.subplots(figsize=(10, 6))
-            sns.boxplot(x='stroke', y='bmi', data=df, ax=ax)
-            ax.set_title('BMI by Stroke Status')
-            ax.set_xticklabels(['No Stroke', 'Stroke'])
-            st.pyplot(fig)
+            show_figure((page, 'bmi') + versions, lambda: plot_stroke_boxplot(
+                summaries, 'bmi', 'BMI by Stroke Status'))
         
         st.subheader("Smoking Status and Stroke")
-        smoking_stroke = df.groupby('smoking_status')['stroke'].mean().reset_index()
-        fig, ax = plt.subplots(figsize=(10, 6))
-        sns.barplot(x='smoking_status', y='stroke', data=smoking_stroke, ax=ax)
-        ax.set_title('Stroke Incidence by Smoking Status')
-        ax.set_ylabel('Stroke Incidence Rate')
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+        show_figure((page, 'smoking_status') + versions, lambda: plot_stroke_rate(
+            cube.marginal('smoking_status'), 'smoking_status', 'Stroke Incidence by Smoking Status',
+            figsize=(10, 6), rotate=True))
     
     # Model Insights page
     elif page == "Model Insights":
@@ -218,69 +271,73 @@ def main():
             
             if hasattr(model, 'coef_'):
                 coef = model.coef_[0]
-                importance = pd.DataFrame({
-                    'Feature': feature_names,
-                    'Importance': np.abs(coef)
-                }).sort_values('Importance', ascending=False)
                 
-                fig, ax = plt.subplots(figsize=(12, 8))
-                sns.barplot(x='Importance', y='Feature', data=importance.head(15), ax=ax)
-                ax.set_title('Top 15 Feature Importance (Absolute Value)')
-                st.pyplot(fig)
+                def draw_importance():
+                    importance = pd.DataFrame({
+                        'Feature': feature_names,
+                        'Importance': np.abs(coef)
+                    }).sort_values('Importance', ascending=False)
+                    
+                    fig, ax = plt.subplots(figsize=(12, 8))
+                    sns.barplot(x='Importance', y='Feature', data=importance.head(15), ax=ax)
+                    ax.set_title('Top 15 Feature Importance (Absolute Value)')
+                    return fig
+                show_figure((page, 'importance') + versions, draw_importance)
                 
                 # Show positive and negative influences
                 st.subheader("Feature Influence Direction")
-                influence = pd.DataFrame({
-                    'Feature': feature_names,
-                    'Coefficient': coef
-                }).sort_values('Coefficient', ascending=False)
-                
-                fig, ax = plt.subplots(figsize=(12, 8))
-                bars = sns.barplot(x='Coefficient', y='Feature', data=influence.head(15), ax=ax)
                 
-                # Color bars based on positive or negative influence
-                for i, bar in enumerate(bars.patches):
-                    if bar.get_width() < 0:
-                        bar.set_color('#F44336')  # Red for negative
-                    else:
-                        bar.set_color('#4CAF50')  # Green for positive
-                
-                ax.set_title('Top 15 Features by Coefficient Value')
-                ax.axvline(x=0, color='black', linestyle='-', alpha=0.7)
-                st.pyplot(fig)
+                def draw_influence():
+                    influence = pd.DataFrame({
+                        'Feature': feature_names,
+                        'Coefficient': coef
+                    }).sort_values('Coefficient', ascending=False)
+                    
+                    fig, ax = plt.subplots(figsize=(12, 8))
+                    bars = sns.barplot(x='Coefficient', y='Feature', data=influence.head(15), ax=ax)
+                    
+                    # Color bars based on positive or negative influence
+                    for i, bar in enumerate(bars.patches):
+                        if bar.get_width() < 0:
+                            bar.set_color('#F44336')  # Red for negative
+                        else:
+                            bar.set_color('#4CAF50')  # Green for positive
+                    
+                    ax.set_title('Top 15 Features by Coefficient Value')
+                    ax.axvline(x=0, color='black', linestyle='-', alpha=0.7)
+                    return fig
+                show_figure((page, 'influence') + versions, draw_influence)
             else:
                 st.write("Feature importance visualization not available for this model type.")
         else:
             st.error("Model could not be loaded for analysis.")
         
+        # The risk charts below are scored by the loaded model
+        if model is None or feature_names is None:
+            return
+        
         # Risk prediction chart
         st.subheader("Stroke Risk by Age and Hypertension")
         
-        # Create a risk visualization
-        age_range = np.linspace(20, 80, 100)
-        risk_no_hypertension = []
-        risk_with_hypertension = []
-        
-        for age in age_range:
-            # This is a simplified risk calculation for visualization
-            risk_no = 0.01 + age * 0.001
-            risk_with = 0.01 + age * 0.001 + 0.1
+        def draw_risk_curve():
+            # Score the reference patient over a grid of ages with and without hypertension
+            age_range = np.linspace(20, 80, 100)
+            risk = score_grid(model, feature_names, {'age': age_range, 'hypertension': [0, 1]},
+                              base=REFERENCE_PATIENT)
             
-            risk_no_hypertension.append(min(risk_no, 1.0))
-            risk_with_hypertension.append(min(risk_with, 1.0))
-        
-        fig, ax = plt.subplots(figsize=(12, 6))
-        ax.plot(age_range, risk_no_hypertension, label='No Hypertension', color='#4CAF50')
-        ax.plot(age_range, risk_with_hypertension, label='With Hypertension', color='#F44336')
-        ax.set_xlabel('Age')
-        ax.set_ylabel('Stroke Risk Probability')
-        ax.set_title('Estimated Stroke Risk by Age and Hypertension')
-        ax.legend()
-        ax.grid(True, alpha=0.3)
-        st.pyplot(fig)
+            fig, ax = plt.subplots(figsize=(12, 6))
+            ax.plot(age_range, risk[:, 0], label='No Hypertension', color='#4CAF50')
+            ax.plot(age_range, risk[:, 1], label='With Hypertension', color='#F44336')
+            ax.set_xlabel('Age')
+            ax.set_ylabel('Stroke Risk Probability')
+            ax.set_title('Estimated Stroke Risk by Age and Hypertension')
+            ax.legend()
+            ax.grid(True, alpha=0.3)
+            return fig
+        show_figure((page, 'risk_curve') + versions, draw_risk_curve)
 
         st.subheader("Interactive Risk Assessment")
-        st.write("This is a simplified risk visualization based on age and key risk factors.")
+        st.write("Stroke risk from the loaded model for a reference patient with the factors below.")
         
         col1, col2 = st.columns(2)
         
@@ -291,25 +348,33 @@ def main():
         
         with col2:
             glucose = st.slider("Average Glucose Level", 50, 300, 100)
-            smoking = st.selectbox("Smoking Status", ["Never Smoked", "Formerly Smoked", "Currently Smoking"])
+            smoking = st.selectbox("Smoking Status", list(SMOKING_CHOICES))
         
-        # Calculate simplified risk score (this is for visualization only)
-        risk_score = 0.01 + (age * 0.005) + (hypertension * 0.15) + (heart_disease * 0.15)
-        risk_score += (glucose > 140) * 0.05
-        risk_score += (smoking == "Currently Smoking") * 0.1 + (smoking == "Formerly Smoked") * 0.05
-        risk_score = min(risk_score, 0.95)  # Cap at 95%
+        # Every slider combination is scored in one vectorized pass per model,
+        # so an interaction is just a lookup
+        risk_grid = score_grid(model, feature_names, GAUGE_GRID, base=REFERENCE_PATIENT)
+        risk_score = float(risk_grid[
+            age - GAUGE_GRID['age'][0],
+            int(hypertension),
+            int(heart_disease),
+            glucose - GAUGE_GRID['avg_glucose_level'][0],
+            GAUGE_GRID['smoking_status'].index(SMOKING_CHOICES[smoking])
+        ])
         
         # Display risk gauge
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
-            fig, ax = plt.subplots(figsize=(8, 4))
-            ax.barh(['Risk'], [risk_score], color='red' if risk_score > 0.5 else 'orange' if risk_score > 0.2 else 'green')
-            ax.barh(['Risk'], [1], color='lightgray', alpha=0.3)
-            ax.set_xlim(0, 1)
-            ax.set_xticks([0, 0.2, 0.5, 0.8, 1])
-            ax.set_xticklabels(['0%', '20%', '50%', '80%', '100%'])
-            ax.set_title(f'Estimated Stroke Risk: {risk_score:.1%}')
-            st.pyplot(fig)
+            def draw_gauge():
+                fig, ax = plt.subplots(figsize=(8, 4))
+                ax.barh(['Risk'], [risk_score], color='red' if risk_score > 0.5 else 'orange' if risk_score > 0.2 else 'green')
+                ax.barh(['Risk'], [1], color='lightgray', alpha=0.3)
+                ax.set_xlim(0, 1)
+                ax.set_xticks([0, 0.2, 0.5, 0.8, 1])
+                ax.set_xticklabels(['0%', '20%', '50%', '80%', '100%'])
+                ax.set_title(f'Estimated Stroke Risk: {risk_score:.1%}')
+                return fig
+            # The gauge only shows the risk to 0.1%, so at most 1001 versions are cached
+            show_figure((page, 'gauge', f'{risk_score:.1%}'), draw_gauge)
             
             if risk_score < 0.2:
                 st.success("Your estimated risk is relatively low based on the factors provided.")
@@ -318,7 +383,7 @@ def main():
             else:
                 st.error("Your estimated risk is high. Please consult with a healthcare provider.")
             
-            st.info("Note: This is a simplified visualization and not a medical assessment. Always consult with healthcare professionals for proper medical advice.")
+            st.info("Note: This is a model estimate and not a medical assessment. Always consult with healthcare professionals for proper medical advice.")
 
 # Run the app
 if __name__ == '__main__':